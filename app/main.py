@@ -1,46 +1,124 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import (
     HTMLResponse,
     JSONResponse,
-    FileResponse,
     PlainTextResponse,
     Response,
+    StreamingResponse,
 )
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
-import mailbox
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import multiprocessing
+import queue
+import threading
+import os
+import shutil
 import csv
 import zipfile
+import gzip
 import io
 import uuid
+import errno
 import json
+import sqlite3
+import asyncio
+import array
+import atexit
+import base64
+import binascii
+import bisect
+import collections
+import datetime
+import fnmatch
+import functools
 import hashlib
+import heapq
+import html
 import math
-from typing import Optional, Dict, Any
+import mmap
+import re
+import struct
+import sys
+import time
+import zlib
+from typing import Optional, Dict, Any, List, Tuple
 
-from email.parser import BytesHeaderParser, BytesParser
-from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email import policy, utils as email_utils
 
 from pydantic import BaseModel
 
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .csv.zst output
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # optional: only needed for Parquet / Arrow output
+    pa = None
+
 # --- paths ---
 BASE_DIR = Path(__file__).resolve().parent
 PAGES = BASE_DIR / "pages"
 STATIC = BASE_DIR / "static"
 
 # --- storage ---
-DATA = Path("/data")
+DATA = Path(os.environ.get("DATA_DIR", "/data"))
 UP = DATA / "uploads"
 JOBS = DATA / "jobs"
-OUT = Path("/downloads")
-for p in (DATA, UP, JOBS, OUT):
+OUT = Path(os.environ.get("DOWNLOADS_DIR", "/downloads"))
+RESULTS = OUT / "cache"
+JOB_DB = DATA / "jobs.sqlite3"
+for p in (DATA, UP, JOBS, OUT, RESULTS):
     p.mkdir(parents=True, exist_ok=True)
 
 # --- limits / worker ---
 MAX_BYTES = 20 * 1024 * 1024 * 1024
 CHUNK = 16 * 1024 * 1024
+UPLOAD_BUFFER = 1024 * 1024
+STREAM_IDLE_TIMEOUT = 3600
+UPLOAD_IDLE_SECONDS = int(os.environ.get("UPLOAD_IDLE_SECONDS", "3600"))  # then an unfinished upload is dropped
+JOB_FLUSH_SECONDS = 2.0
+STATUS_STREAM_INTERVAL = 0.5
+STATUS_STREAM_KEEPALIVE = 15
 BODY_LIMIT = 32000
-POOL = ThreadPoolExecutor(max_workers=2)
+MBOX_READ_BLOCK = 8 * 1024 * 1024
+BODY_SCAN_BYTES = BODY_LIMIT * 8
+QP_COUNT_BLOCK = 1024 * 1024
+SHARD_MIN_BYTES = 64 * 1024 * 1024
+CHECKPOINT_SECONDS = 60
+OUTPUT_BLOCK = 1024 * 1024
+OUTPUT_QUEUE_BLOCKS = 8
+COLUMNAR_BLOCK = 32 * 1024 * 1024  # CSV bytes per Parquet row group / Arrow record batch
+DEFLATE_BLOCK = 1024 * 1024
+DEFLATE_WINDOW = 32 * 1024
+DEFLATE_THREADS = int(os.environ.get("DEFLATE_THREADS", "0")) or (os.cpu_count() or 1)
+PARSE_PROCESSES = int(os.environ.get("PARSE_PROCESSES", "0")) or (os.cpu_count() or 1)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "2"))
+STREAM_WORKERS = int(os.environ.get("STREAM_WORKERS", "2"))  # parses that tail an upload in progress
+MAX_QUEUED_BYTES = int(os.environ.get("MAX_QUEUED_BYTES", str(100 * 1024 * 1024 * 1024)))
+MIN_FREE_BYTES = 1024 * 1024 * 1024
+SCHEDULER_AGING = 16 * 1024 * 1024  # bytes of priority gained per second of waiting
+SCHEDULER_DEFAULT_RATE = 20 * 1024 * 1024  # bytes/s per worker until jobs have been timed
+DOWNLOAD_TTL_SECONDS = int(os.environ.get("DOWNLOAD_TTL_SECONDS", str(24 * 3600)))
+OUTPUT_BUDGET_BYTES = int(os.environ.get("OUTPUT_BUDGET_BYTES", str(50 * 1024 * 1024 * 1024)))
+REAPER_INTERVAL = 300
+LABEL_OPEN_FILES = 64  # per-label spools kept open at once
+THREAD_REFS = 8  # ancestors kept per message for threading: the first and the nearest ones
+PREVIEW_PAGE_ROWS = 50
+PREVIEW_MAX_ROWS = 500
+SEARCH_SCAN_ROWS = 5000
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", str(20 * 1024 * 1024 * 1024)))
+_PROCS: Optional[ProcessPoolExecutor] = None
+_DEFLATE_POOL: Optional[ThreadPoolExecutor] = None
 
 app = FastAPI()
 
@@ -121,7 +199,7 @@ HTML = """<!doctype html><html lang=\"en\"><head>
           \"name\": \"Do you retain my uploaded emails?\",
           \"acceptedAnswer\": {
             \"@type\": \"Answer\",
-            \"text\": \"No. Files are processed in a private job directory and removed automatically after conversion completes.\"
+            \"text\": \"No. Files are processed in a private job directory; the upload is removed after conversion and the export within 24 hours.\"
           }
         }
       ]
@@ -281,7 +359,7 @@ kbd{background:#111a2e;padding:2px 6px;border-radius:6px;border:1px solid #1e293
           <li>Handles archives up to 20 GB with resumable, checksum-verified uploads.</li>
           <li>Server-side parsing keeps the heavy lifting off your device while protecting your data.</li>
           <li>Plain-text body content is included automatically (trimmed to 32K characters) for quick reviews.</li>
-          <li>Privacy-first processing — temporary files are automatically deleted after each job finishes.</li>
+          <li>Privacy-first processing — uploads are deleted after each job finishes and exports within 24 hours.</li>
         </ul>
       </section>
 
@@ -433,7 +511,7 @@ kbd{background:#111a2e;padding:2px 6px;border-radius:6px;border:1px solid #1e293
           </article>
           <article>
             <h3>Secure processing</h3>
-            <p>Jobs run in isolated directories, links are unique per upload, and files are deleted automatically after delivery.</p>
+            <p>Jobs run in isolated directories, links are unique per upload, and files are deleted automatically within 24 hours.</p>
           </article>
           <article>
             <h3>Why researchers trust us</h3>
@@ -459,7 +537,7 @@ kbd{background:#111a2e;padding:2px 6px;border-radius:6px;border:1px solid #1e293
           </div>
           <div class=\"trust-card\">
             <strong>Automatic deletion</strong>
-            <p>Temporary files are purged within 24 hours or immediately after your download completes.</p>
+            <p>Temporary files are purged within 24 hours.</p>
           </div>
           <div class=\"trust-card\">
             <strong>Checksum verification</strong>
@@ -516,7 +594,7 @@ const progressState={
   upload:{total:0,uploaded:0,startedAt:null,completed:false,completedAt:null,duration:0},
   parse:{total:0,processed:0,startedAt:null,completed:false,completedAt:null}
 };
-let selected=null, job=null, poll=null, timer=null, startedAt=null;
+let selected=null, job=null, poll=null, stream=null, timer=null, startedAt=null;
 
 function setPct(v){ fill.style.width=v+"%"; pct.textContent=Math.min(100,Math.floor(v)) + "%" }
 function renderElapsed(ms){
@@ -734,39 +812,103 @@ async function sha256Hex(buffer){
   return Array.from(new Uint8Array(hashBuffer)).map(b=>b.toString(16).padStart(2,"0")).join("");
 }
 
+const UPLOAD_PARALLEL = 4;
+
 async function uploadChunks(chunkSize){
   const total = selected.size;
   if(total === 0){ throw new Error("File is empty"); }
   const totalChunks = Math.ceil(total / chunkSize);
   let uploaded = 0;
-  for(let index=0; index<totalChunks; index++){
-    const start = index * chunkSize;
-    const end = Math.min(start + chunkSize, total);
-    const slice = selected.slice(start, end);
-    const arrayBuffer = await slice.arrayBuffer();
-    const hash = await sha256Hex(arrayBuffer);
-    const form = new FormData();
-    form.append("job_id", job);
-    form.append("index", String(index));
-    form.append("total", String(totalChunks));
-    form.append("final", String(index === totalChunks - 1));
-    form.append("chunk_hash", hash);
-    form.append("chunk", new Blob([arrayBuffer]));
-    const res = await fetch("/upload/chunk", { method:"POST", body: form });
-    if(!res.ok){
-      const text = await res.text();
-      throw new Error(text || `Chunk upload failed (${res.status})`);
+  let completed = 0;
+  let nextIndex = 0;
+  let failed = false;
+  async function worker(){
+    while(!failed && nextIndex < totalChunks){
+      const index = nextIndex++;
+      const start = index * chunkSize;
+      const end = Math.min(start + chunkSize, total);
+      const slice = selected.slice(start, end);
+      const arrayBuffer = await slice.arrayBuffer();
+      const hash = await sha256Hex(arrayBuffer);
+      const form = new FormData();
+      form.append("job_id", job);
+      form.append("index", String(index));
+      form.append("total", String(totalChunks));
+      form.append("final", String(index === totalChunks - 1));
+      form.append("chunk_hash", hash);
+      form.append("chunk", new Blob([arrayBuffer]));
+      const res = await fetch("/upload/chunk", { method:"POST", body: form });
+      if(!res.ok){
+        failed = true;
+        const text = await res.text();
+        throw new Error(text || `Chunk upload failed (${res.status})`);
+      }
+      uploaded += arrayBuffer.byteLength;
+      completed++;
+      updateUploadMetrics(uploaded,total);
+      setSt(`Uploading… ${completed}/${totalChunks}`);
+    }
+  }
+  const workers = [];
+  for(let n=0; n<Math.min(UPLOAD_PARALLEL, totalChunks); n++){ workers.push(worker()); }
+  await Promise.all(workers);
+}
+
+function handleStatus(r){
+  updateParseTracking(r.status, r.processed ?? null, r.total_messages ?? null);
+  if(r.status==="processing"){
+    const processed=r.processed||0;
+    const total=r.total_messages;
+    if(Number.isFinite(total) && total>0){
+      setSt(`Parsing… ${processed.toLocaleString()} / ${total.toLocaleString()} messages`);
+    }else{
+      setSt(`Parsing… ${processed.toLocaleString()} messages`);
     }
-    uploaded += arrayBuffer.byteLength;
-    updateUploadMetrics(uploaded,total);
-    setSt(`Uploading… ${index+1}/${totalChunks}`);
   }
+  else if(r.status==="queued"){
+    if(r.queue_position){
+      const wait = Math.max(0, r.estimated_start - Date.now()/1000);
+      setSt(`Queued for parsing… #${r.queue_position} in line, starting in about ${Math.ceil(wait/60)} min`);
+    }else{
+      setSt("Queued for parsing…");
+    }
+  }
+  else if(r.status==="done"){
+    stopStatus();
+    dl.href="/download/"+job; dl.download="emails.zip"; dl.style.display="inline";
+    dl.click(); setSt("Done."); go.disabled=false; stopTimer(); renderEta(0);
+  } else if(r.status==="error"){
+    stopStatus(); setSt("Error: "+(r.error||"unknown")); go.disabled=false; stopTimer(); renderEta(NaN);
+  }
+}
+
+function stopStatus(){
+  if(poll){ clearInterval(poll); poll=null; }
+  if(stream){ stream.close(); stream=null; }
+}
+
+function pollStatus(){
+  poll = setInterval(async ()=>{
+    try{
+      handleStatus(await fetch("/status/"+job).then(r=>r.json()));
+    }catch(err){
+      stopStatus(); setSt("Error checking status."); go.disabled=false; stopTimer(); renderEta(NaN);
+    }
+  }, 1500);
+}
+
+function watchStatus(){
+  if(!window.EventSource){ pollStatus(); return; }
+  stream = new EventSource("/status/"+job+"/stream");
+  stream.onmessage = (e)=>handleStatus(JSON.parse(e.data));
+  // Proxies that buffer or cut the stream: fall back to polling.
+  stream.onerror = ()=>{ if(stream){ stream.close(); stream=null; pollStatus(); } };
 }
 
 go.addEventListener("click",async()=>{
   if(!selected) return;
   go.disabled=true; dl.style.display="none"; setSt("Preparing upload…");
-  if(poll){ clearInterval(poll); poll=null; }
+  stopStatus();
   startTimer();
   beginJobTracking(selected.size);
   try{
@@ -788,33 +930,7 @@ go.addEventListener("click",async()=>{
     await uploadChunks(init.chunk_size);
     markUploadComplete();
     setSt("Upload complete. Parsing…");
-    poll = setInterval(async ()=>{
-      try{
-        const r = await fetch("/status/"+job).then(r=>r.json());
-        updateParseTracking(r.status, r.processed ?? null, r.total_messages ?? null);
-        if(r.status==="processing"){
-          const processed=r.processed||0;
-          const total=r.total_messages;
-          if(Number.isFinite(total) && total>0){
-            setSt(`Parsing… ${processed.toLocaleString()} / ${total.toLocaleString()} messages`);
-          }else{
-            setSt(`Parsing… ${processed.toLocaleString()} messages`);
-          }
-        }
-        else if(r.status==="queued"){
-          setSt("Queued for parsing…");
-        }
-        else if(r.status==="done"){
-          clearInterval(poll); poll=null;
-          dl.href="/download/"+job; dl.download="emails.zip"; dl.style.display="inline";
-          dl.click(); setSt("Done."); go.disabled=false; stopTimer(); renderEta(0);
-        } else if(r.status==="error"){
-          clearInterval(poll); poll=null; setSt("Error: "+(r.error||"unknown")); go.disabled=false; stopTimer(); renderEta(NaN);
-        }
-      }catch(err){
-        clearInterval(poll); poll=null; setSt("Error checking status."); go.disabled=false; stopTimer(); renderEta(NaN);
-      }
-    }, 1500);
+    watchStatus();
   }catch(err){
     setSt(err.message || "Upload failed");
     go.disabled=false; stopTimer(); renderEta(NaN);
@@ -825,80 +941,612 @@ go.addEventListener("click",async()=>{
 """
 
 
+class MessageFilter(BaseModel):
+    # ISO 8601 dates or datetimes (UTC unless an offset is given); date_to is exclusive.
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    # Addresses ("ann@example.com", wildcards allowed) or domains ("example.com", "@example.com").
+    senders: List[str] = []
+    recipients: List[str] = []  # matched against To and Cc
+    subject: Optional[str] = None  # glob ("*invoice*") over the decoded subject; plain text matches anywhere
+    labels: List[str] = []  # Gmail labels (X-Gmail-Labels); any one matches
+
+
 class UploadInit(BaseModel):
     filename: str
     size: int
     sha256: Optional[str] = None
+    # SHA-256 over the concatenated raw SHA-256 digests of every chunk, in index order.
+    tree_sha256: Optional[str] = None
+    # None lets the server decide: archives small enough to be parsed serially are streamed.
+    parse_while_uploading: Optional[bool] = None
     include_body: bool = True
     include_thread_id: bool = False
+    include_labels: bool = False
+    split_labels: bool = False  # one labels/<label>.csv member per Gmail label
+    build_threads: bool = False  # thread_id, parent_id and thread_depth from References headers
+    dedupe: bool = False  # keep only the first copy of each message
     include_attachments: bool = False
+    include_index: bool = False
+    compression: str = "deflate"
+    compression_level: Optional[int] = None
+    output_format: str = "csv"
+    filter: Optional[MessageFilter] = None
+    columns: Optional[List[str]] = None  # subset and order of the emails.csv columns
+
+
+# compression -> (download name, media type, accepted levels)
+OUTPUT_FORMATS = {
+    "stored": ("emails.zip", "application/zip", range(0)),
+    "deflate": ("emails.zip", "application/zip", range(0, 10)),
+    "gzip": ("emails.csv.gz", "application/gzip", range(0, 10)),
+    "zstd": ("emails.csv.zst", "application/zstd", range(1, 23)),
+}
+# output_format -> (file extension, media type); CSV uses OUTPUT_FORMATS
+COLUMNAR_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+# Columns stored dictionary-encoded in columnar outputs.
+DICTIONARY_COLUMNS = ("from", "to", "cc", "bcc", "content_type")
+
 
+def _output_file(options: Dict[str, Any]) -> Tuple[str, str]:
+    """Download name and media type of a job's output."""
+    output_format = options["output_format"]
+    if output_format == "csv":
+        return OUTPUT_FORMATS[options["compression"]][:2]
+    if options["include_attachments"]:
+        return "emails.zip", "application/zip"
+    extension, media_type = COLUMNAR_FORMATS[output_format]
+    return f"emails.{extension}", media_type
 
-def _jpath(jid: str) -> Path:
-    return JOBS / f"{jid}.json"
+
+# --- job store ---
+# Job records live in SQLite (WAL) with a write-through in-process cache, so
+# /status never touches disk. Cached records are replaced, never mutated, so
+# readers can copy them without the lock. Progress counters are coalesced and
+# flushed every JOB_FLUSH_SECONDS; state changes are committed immediately.
+_JOB_DB_LOCK = threading.Lock()
+_JOB_CACHE: Dict[str, Dict] = {}
+_JOB_DIRTY: set = set()
+
+
+class _JobEvents:
+    """In-memory pub/sub that wakes /status streams when a job record changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set] = collections.defaultdict(set)
+
+    def subscribe(self, jid: str) -> asyncio.Event:
+        event = asyncio.Event()
+        with self._lock:
+            self._subscribers[jid].add((asyncio.get_running_loop(), event))
+        return event
+
+    def unsubscribe(self, jid: str, event: asyncio.Event) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(jid, set())
+            subscribers.difference_update({sub for sub in subscribers if sub[1] is event})
+            if not subscribers:
+                self._subscribers.pop(jid, None)
+
+    def publish(self, jid: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(jid, ()))
+        for loop, event in subscribers:
+            loop.call_soon_threadsafe(event.set)
+
+
+_JOB_EVENTS = _JobEvents()
+
+
+def _open_job_db() -> sqlite3.Connection:
+    db = sqlite3.connect(JOB_DB, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id TEXT PRIMARY KEY, status TEXT NOT NULL, size INTEGER, updated REAL NOT NULL, data TEXT NOT NULL)"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated)")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, rows INTEGER NOT NULL, used REAL NOT NULL)"
+    )
+    return db
+
+
+# Opened on first use: the parse pool's spawned workers import this module but never touch the store.
+_JOB_DB: Optional[sqlite3.Connection] = None
+
+
+def _job_db() -> sqlite3.Connection:
+    # Caller holds _JOB_DB_LOCK.
+    global _JOB_DB
+    if _JOB_DB is None:
+        _JOB_DB = _open_job_db()
+    return _JOB_DB
+
+
+def _write_jobs(records: List[Dict]) -> None:
+    # Caller holds _JOB_DB_LOCK.
+    now = time.time()
+    db = _job_db()
+    with db:
+        db.executemany(
+            "INSERT INTO jobs (id, status, size, updated, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET status = excluded.status, size = excluded.size, "
+            "updated = excluded.updated, data = excluded.data",
+            [(j["id"], j.get("status", ""), j.get("size"), now, json.dumps(j)) for j in records],
+        )
 
 
 def _load(jid: str) -> Optional[Dict]:
-    p = _jpath(jid)
-    if not p.exists():
-        return None
-    return json.loads(p.read_text())
+    j = _JOB_CACHE.get(jid)
+    if j is None:
+        with _JOB_DB_LOCK:
+            row = _job_db().execute("SELECT data FROM jobs WHERE id = ?", (jid,)).fetchone()
+            if row is None:
+                return None
+            j = _JOB_CACHE.setdefault(jid, json.loads(row[0]))
+    return dict(j)
 
 
 def _save(obj: Dict) -> None:
-    _jpath(obj["id"]).write_text(json.dumps(obj))
+    with _JOB_DB_LOCK:
+        _JOB_CACHE[obj["id"]] = dict(obj)
+        _JOB_DIRTY.discard(obj["id"])
+        _write_jobs([obj])
+    _JOB_EVENTS.publish(obj["id"])
+
+
+def _update_job(jid: str, **fields) -> Optional[Dict]:
+    """Merge ``fields`` into the stored record, so concurrent writers only touch their own keys."""
+    return _merge_job(jid, fields, durable=True)
+
+
+def _note_progress(jid: str, **fields) -> Optional[Dict]:
+    """Like ``_update_job`` for progress counters: visible at once, written to disk in batches."""
+    return _merge_job(jid, fields, durable=False)
+
+
+def _merge_job(jid: str, fields: Dict, durable: bool) -> Optional[Dict]:
+    if jid not in _JOB_CACHE and _load(jid) is None:
+        return None
+    with _JOB_DB_LOCK:
+        j = _JOB_CACHE.get(jid)
+        if j is None:
+            return None
+        j = {**j, **fields}
+        _JOB_CACHE[jid] = j
+        if durable:
+            _JOB_DIRTY.discard(jid)
+            _write_jobs([j])
+        else:
+            _JOB_DIRTY.add(jid)
+    _JOB_EVENTS.publish(jid)
+    return dict(j)
+
+
+def _delete_job(jid: str) -> None:
+    with _JOB_DB_LOCK:
+        db = _job_db()
+        _JOB_CACHE.pop(jid, None)
+        _JOB_DIRTY.discard(jid)
+        with db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (jid,))
+    _JOB_EVENTS.publish(jid)
+
+
+def _flush_jobs() -> None:
+    with _JOB_DB_LOCK:
+        if _JOB_DIRTY:
+            _write_jobs([_JOB_CACHE[jid] for jid in _JOB_DIRTY if jid in _JOB_CACHE])
+            _JOB_DIRTY.clear()
 
 
-def _cleanup_job(jid: str, out_path: str) -> None:
+def _job_flusher() -> None:
+    while True:
+        time.sleep(JOB_FLUSH_SECONDS)
+        try:
+            _flush_jobs()
+        except Exception:
+            pass
+
+
+def _import_json_jobs() -> None:
+    """Move records left by the old one-JSON-file-per-job store into the database."""
+    for path in JOBS.glob("*.json"):
+        try:
+            j = json.loads(path.read_text())
+            with _JOB_DB_LOCK:
+                if _job_db().execute("SELECT 1 FROM jobs WHERE id = ?", (j["id"],)).fetchone() is None:
+                    _write_jobs([j])
+            path.unlink()
+        except Exception:
+            pass
+
+
+# --- result cache ---
+# Finished outputs are hard-linked into RESULTS under a key made from the
+# archive's SHA-256 and the normalized options, so an identical re-upload is
+# finished without a parse once its bytes have been verified against that hash.
+# Entries are evicted least recently used first and expire with DOWNLOAD_TTL_SECONDS.
+def _result_key(j: Dict) -> Optional[str]:
+    if not j.get("sha256"):
+        return None
+    options = json.dumps(_normalize_options(j.get("options")), sort_keys=True)
+    return hashlib.sha256(f"{j['sha256'].lower()}:{j['size']}:{options}".encode()).hexdigest()
+
+
+def _cached_result(key: str) -> Optional[Tuple[Path, int]]:
+    with _JOB_DB_LOCK:
+        db = _job_db()
+        row = db.execute("SELECT path, rows FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with db:
+            try:
+                created = Path(row[0]).stat().st_mtime
+            except OSError:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            if time.time() - created >= DOWNLOAD_TTL_SECONDS:
+                # Expired; the reaper deletes it.
+                return None
+            db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+    return Path(row[0]), row[1]
+
+
+def _cache_result(key: str, out_path: Path, rows: int) -> None:
+    path = RESULTS / f"{key}{''.join(out_path.suffixes)}"
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}")
+    os.link(out_path, tmp)
+    os.replace(tmp, path)
+    with _JOB_DB_LOCK:
+        db = _job_db()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, path, size, rows, used) VALUES (?, ?, ?, ?, ?)",
+                (key, str(path), path.stat().st_size, rows, time.time()),
+            )
+    _evict_results()
+
+
+def _expire_results() -> None:
+    """Delete cached outputs older than DOWNLOAD_TTL_SECONDS; they hold user data like any other output."""
+    now = time.time()
+    with _JOB_DB_LOCK:
+        db = _job_db()
+        for key, path in db.execute("SELECT key, path FROM results").fetchall():
+            try:
+                if now - Path(path).stat().st_mtime < DOWNLOAD_TTL_SECONDS:
+                    continue
+                Path(path).unlink()
+            except OSError:
+                pass
+            with db:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+    # Files without a row, e.g. left by a crash between linking and recording them.
+    for path in RESULTS.iterdir():
+        try:
+            if now - path.stat().st_mtime >= DOWNLOAD_TTL_SECONDS:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _finish_from_cache(job: Dict) -> bool:
+    """Finish a verified upload with the cached output of the same archive and options, if any."""
+    key = _result_key(job)
+    cached = _cached_result(key) if key else None
+    if not cached:
+        return False
+    out_path = OUT / f"{job['id']}-{_output_file(_normalize_options(job.get('options')))[0]}"
     try:
-        Path(out_path).unlink(missing_ok=True)
-    except Exception:
-        pass
+        os.link(cached[0], out_path)
+    except OSError:
+        shutil.copyfile(cached[0], out_path)
+    Path(job["in_path"]).unlink(missing_ok=True)
+    _update_job(
+        job["id"],
+        status="done",
+        processed=cached[1],
+        total_messages=cached[1],
+        out_path=str(out_path),
+        finished=time.time(),
+        cached=True,
+    )
+    return True
+
+
+def _evict_results() -> None:
+    with _JOB_DB_LOCK:
+        db = _job_db()
+        rows = db.execute("SELECT key, path, size FROM results ORDER BY used DESC").fetchall()
+        total = 0
+        for key, path, size in rows:
+            total += size
+            if total > RESULT_CACHE_BYTES:
+                with db:
+                    db.execute("DELETE FROM results WHERE key = ?", (key,))
+                try:
+                    Path(path).unlink(missing_ok=True)
+                except Exception:
+                    pass
+
+
+# Serializes read-modify-write of a job record across concurrent chunk requests.
+_JOB_LOCKS: Dict[str, asyncio.Lock] = collections.defaultdict(asyncio.Lock)
+# Serializes requests for the same chunk index, by job id and index.
+_CHUNK_LOCKS: Dict[str, Dict[int, asyncio.Lock]] = collections.defaultdict(lambda: collections.defaultdict(asyncio.Lock))
+
+
+def _chunk_length(job: Dict, index: int) -> int:
+    return min(CHUNK, job["size"] - index * CHUNK)
+
+
+def _bitmap_test(bitmap: bytes, index: int) -> bool:
+    return bool(bitmap[index >> 3] & (1 << (index & 7)))
+
+
+def _contiguous_bytes(job: Dict, bitmap: bytes) -> int:
+    index = 0
+    while index < job["expected_chunks"] and _bitmap_test(bitmap, index):
+        index += 1
+    return min(index * CHUNK, job["size"])
+
+
+class _GrowingUpload:
+    """An upload still being written, readable up to its contiguous verified prefix."""
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+        self.available = 0
+        self.final = False
+        self.error: Optional[str] = None
+        self._cond = threading.Condition()
+
+    def advance(self, available: int, final: bool = False) -> None:
+        with self._cond:
+            self.available = max(self.available, available)
+            self.final = self.final or final
+            self._cond.notify_all()
+
+    def abort(self, error: str) -> None:
+        with self._cond:
+            self.error = error
+            self._cond.notify_all()
+
+    def wait(self, pos: int) -> int:
+        """Block until bytes past ``pos`` are verified or the upload is final; return the readable end."""
+        with self._cond:
+            while True:
+                if self.error:
+                    raise OSError(self.error)
+                if self.available > pos or self.final:
+                    return self.available
+                if not self._cond.wait(STREAM_IDLE_TIMEOUT):
+                    raise TimeoutError("Upload stalled")
+
+    def open(self, mode: str = "rb") -> "_GrowingReader":
+        return _GrowingReader(self)
+
+
+class _GrowingReader(io.RawIOBase):
+    def __init__(self, upload: _GrowingUpload):
+        self._upload = upload
+        self._fp = open(upload.path, "rb", buffering=0)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self._pos = pos
+        return pos
+
+    def readinto(self, b) -> int:
+        n = min(len(b), self._upload.wait(self._pos) - self._pos)
+        if n <= 0:
+            return 0
+        self._fp.seek(self._pos)
+        n = self._fp.readinto(memoryview(b)[:n])
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        self._fp.close()
+        super().close()
+
+
+# Uploads being parsed while they arrive, by job id.
+_GROWING: Dict[str, _GrowingUpload] = {}
+
+
+def _preallocate(path: Path, size: int) -> None:
+    with path.open("wb") as fp:
+        try:
+            os.posix_fallocate(fp.fileno(), 0, size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            fp.truncate(size)
+        except AttributeError:
+            fp.truncate(size)
+
+
+def _cleanup_job(jid: str, out_path: Optional[str]) -> None:
+    # Jobs with an index keep their source mbox and index next to the output.
+    # Failed jobs have no output path.
+    paths = [OUT / f"{jid}-index.bin", UP / f"{jid}.mbox"] + ([Path(out_path)] if out_path else [])
+    for path in paths:
+        try:
+            path.unlink(missing_ok=True)
+        except Exception:
+            pass
     try:
-        _jpath(jid).unlink(missing_ok=True)
+        _delete_job(jid)
     except Exception:
         pass
 
 
-def _sha256_file(path: Path) -> str:
+def _ingest_chunk(src, dest_path: str, offset: int, limit: int, running=None) -> Tuple[int, str]:
+    """Copy an uploaded chunk into ``dest_path`` at ``offset`` through one reused buffer, hashing as it goes.
+
+    ``running`` (a whole-file hasher) is fed from the same buffer. Stops without
+    writing once more than ``limit`` bytes arrive; the caller sees ``written > limit``.
+    """
     h = hashlib.sha256()
-    with path.open("rb") as fp:
-        for chunk in iter(lambda: fp.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    buf = memoryview(bytearray(UPLOAD_BUFFER))
+    written = 0
+    fd = os.open(dest_path, os.O_WRONLY)
+    try:
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            if written + n > limit:
+                return written + n, ""
+            os.pwrite(fd, buf[:n], offset + written)
+            h.update(buf[:n])
+            if running is not None:
+                running.update(buf[:n])
+            written += n
+    finally:
+        os.close(fd)
+    return written, h.hexdigest()
+
+
+# Running whole-file SHA-256 of each upload's contiguous received prefix: (hasher, bytes hashed).
+# hashlib state cannot be persisted, so after a restart the prefix is rehashed once.
+_UPLOAD_HASHES: Dict[str, Tuple[Any, int]] = {}
+
+
+def _advance_upload_hash(job: Dict, hasher, hashed: int) -> Tuple[Any, int]:
+    """Fold chunks that landed ahead of the hashed prefix into the running hash."""
+    bitmap = base64.b64decode(job["chunks"])
+    buf = memoryview(bytearray(UPLOAD_BUFFER))
+    with open(job["in_path"], "rb", buffering=0) as fp:
+        fp.seek(hashed)
+        while hashed < job["size"] and _bitmap_test(bitmap, hashed // CHUNK):
+            remaining = _chunk_length(job, hashed // CHUNK)
+            while remaining:
+                n = fp.readinto(buf[:min(UPLOAD_BUFFER, remaining)])
+                if not n:
+                    raise OSError(f"Upload file ends at {hashed}")
+                hasher.update(buf[:n])
+                remaining -= n
+                hashed += n
+    return hasher, hashed
+
+
+def _part_text(part) -> str:
+    try:
+        return part.get_content()
+    except Exception:
+        payload = part.get_payload(decode=True) or b""
+        charset = part.get_content_charset() or "utf-8"
+        return payload.decode(charset, errors="replace")
+
+
+# Elements dropped with their content; unclosed ones run to the end, so a
+# prefix cut after any ">" renders as a prefix of the whole document.
+_HTML_HIDDEN = "|".join(
+    rf"{name}\b[^<]*(?:<(?!/{name}\b)[^<]*)*(?:</{name}\s*>)?" for name in ("script", "style", "head", "title")
+)
+_HTML_TOKEN = re.compile(
+    rf"<(?:(?i:{_HTML_HIDDEN})|!--[^-]*(?:-(?!->)[^-]*)*(?:-->)?|[!?][^>]*>|/?([a-zA-Z][a-zA-Z0-9]*)[^>]*>)"
+)
+# Tags become markers that survive whitespace collapsing: \x01 starts a break,
+# \x02 asks for a blank line and \x03 is one <br>.
+_HTML_TAG_TEXT = {
+    **dict.fromkeys(("div", "li", "tr", "dt", "dd", "pre", "section", "article", "header", "footer", "center"), "\x01"),
+    **dict.fromkeys(("p", "table", "blockquote", "ul", "ol", "hr", "h1", "h2", "h3", "h4", "h5", "h6"), "\x01\x02"),
+    "br": "\x01\x03",
+    "td": " ",
+    "th": " ",
+}
+_HTML_BREAK = re.compile(r"\x01[\x01\x02\x03 ]*")
+
+
+def _html_tag_text(match) -> str:
+    name = match.group(1)
+    return _HTML_TAG_TEXT.get(name.lower(), "") if name else ""
+
+
+def _html_break(match) -> str:
+    run = match.group()
+    return "\n\n" if "\x02" in run or run.count("\x03") > 1 else "\n"
+
+
+def _html_render(markup: str) -> str:
+    text = " ".join(_HTML_TOKEN.sub(_html_tag_text, markup).split())
+    if "&" in text:
+        text = html.unescape(text).replace("\xa0", " ")
+    return _HTML_BREAK.sub(_html_break, text.replace(" \x01", "\x01")).strip()
+
+
+def _html_text(markup: str) -> str:
+    """Readable text of an HTML body, at most BODY_LIMIT characters.
+
+    script, style and head are dropped, block tags break lines, whitespace
+    collapses and entities are decoded, all in a few C-level regex and string
+    passes. Long documents are rendered from a growing prefix cut after a ">",
+    so only as much markup as BODY_LIMIT characters need is processed.
+    """
+    size = len(markup)
+    window = 8 * BODY_LIMIT
+    while True:
+        cut = markup.rfind(">", 0, window) + 1 if window < size else size
+        if cut <= 0:
+            cut = size
+        text = _html_render(markup[:cut] if cut < size else markup)
+        if cut == size or len(text) >= BODY_LIMIT:
+            return text[:BODY_LIMIT]
+        window *= 4
 
 
 def _extract_body_text(message) -> str:
+    """The first non-empty text/plain part, else the first text/html part as text."""
     try:
         if message.is_multipart():
+            first_html = None
             for part in message.walk():
                 if part.get_filename():
                     continue
-                if part.get_content_type() == "text/plain":
-                    try:
-                        text = part.get_content()
-                    except Exception:
-                        payload = part.get_payload(decode=True) or b""
-                        charset = part.get_content_charset() or "utf-8"
-                        text = payload.decode(charset, errors="replace")
-                    text = text.strip()
+                content_type = part.get_content_type()
+                if content_type == "text/plain":
+                    text = _part_text(part).strip()
                     if text:
                         return text[:BODY_LIMIT]
+                elif content_type == "text/html" and first_html is None:
+                    first_html = part
+            if first_html is not None:
+                return _html_text(_part_text(first_html))
         else:
-            if message.get_content_type() == "text/plain":
-                try:
-                    text = message.get_content()
-                except Exception:
-                    payload = message.get_payload(decode=True) or b""
-                    charset = message.get_content_charset() or "utf-8"
-                    text = payload.decode(charset, errors="replace")
-                return text.strip()[:BODY_LIMIT]
+            content_type = message.get_content_type()
+            if content_type == "text/plain":
+                return _part_text(message).strip()[:BODY_LIMIT]
+            if content_type == "text/html":
+                return _html_text(_part_text(message))
     except Exception:
         return ""
     return ""
 
 
-def _iter_attachment_rows(message, message_id: str):
+def _payload_size(part) -> int:
+    try:
+        payload = part.get_payload(decode=True)
+        return len(payload) if payload else 0
+    except Exception:
+        return 0
+
+
+def _iter_attachment_rows(message, message_id: str, size_of=_payload_size):
     if not hasattr(message, "iter_attachments"):
         return
     index = 0
@@ -906,25 +1554,42 @@ def _iter_attachment_rows(message, message_id: str):
         index += 1
         filename = part.get_filename() or f"attachment-{index}"
         content_type = part.get_content_type() or ""
-        size_bytes = 0
-        try:
-            payload = part.get_payload(decode=True)
-            if payload:
-                size_bytes = len(payload)
-        except Exception:
-            size_bytes = 0
-        yield (message_id, filename, content_type, size_bytes)
+        yield (message_id, filename, content_type, size_of(part))
 
 
-def _normalize_options(options: Optional[Dict]) -> Dict[str, bool]:
+def _normalize_options(options: Optional[Dict]) -> Dict[str, Any]:
     options = options or {}
     include_body = options.get("include_body")
     include_thread = options.get("include_thread_id")
+    include_labels = options.get("include_labels")
     include_attachments = options.get("include_attachments")
+    include_index = options.get("include_index")
+    build_threads = options.get("build_threads")
+    columns = options.get("columns") or None
+    if columns:
+        include_body = "body" in columns
+        include_thread = "thread_id" in columns
+        include_labels = "labels" in columns
+        build_threads = build_threads or "parent_id" in columns or "thread_depth" in columns
+    message_filter = options.get("filter") or None
+    if isinstance(message_filter, dict):
+        # Kept as canonical JSON so it is hashable for _compile_filter.
+        message_filter = {key: value for key, value in message_filter.items() if value not in (None, "", [])}
+        message_filter = json.dumps(message_filter, sort_keys=True) if message_filter else None
     return {
         "include_body": True if include_body is None else bool(include_body),
         "include_thread_id": bool(include_thread),
+        "include_labels": bool(include_labels),
+        "split_labels": bool(options.get("split_labels")),
+        "build_threads": bool(build_threads),
+        "dedupe": bool(options.get("dedupe")),
         "include_attachments": bool(include_attachments),
+        "include_index": bool(include_index),
+        "compression": options.get("compression") or "deflate",
+        "compression_level": options.get("compression_level"),
+        "output_format": options.get("output_format") or "csv",
+        "columns": list(columns) if columns else None,
+        "filter": message_filter,
     }
 
 
@@ -980,184 +1645,2257 @@ def _header_value(msg, name: str) -> str:
     return _coerce_header_value(raw_value)
 
 
-def _parse_job(jid: str) -> None:
-    j = _load(jid)
-    if not j:
-        return
-    j["status"] = "processing"
-    j["processed"] = 0
-    j["total_messages"] = j.get("total_messages", 0)
-    _save(j)
-    src = Path(j["in_path"])
-    out_zip = OUT / f"{jid}-emails.zip"
-    options = _normalize_options(j.get("options"))
-    include_body = options["include_body"]
-    include_thread = options["include_thread_id"]
-    include_attachments = options["include_attachments"]
-    header_fields = ["date", "from", "to", "cc", "bcc", "subject", "message_id"]
-    if include_thread:
-        header_fields.append("thread_id")
-    if include_body:
-        header_fields.append("body")
-    attachments_fields = ["message_id", "filename", "content_type", "size_bytes"]
-    try:
-        m = mailbox.mbox(str(src))
-        header_parser = BytesHeaderParser()
-        full_parser = BytesParser(policy=policy.default)
-        processed = 0
-        try:
-            total_messages = len(m)
-        except Exception:
-            total_messages = 0
-        j["total_messages"] = total_messages
-        j["processed"] = 0
-        _save(j)
-        try:
-            with zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                with zf.open("emails.csv", "w") as emails_member:
-                    with io.TextIOWrapper(emails_member, encoding="utf-8", newline="") as emails_txt:
-                        writer = csv.writer(emails_txt)
-                        writer.writerow(header_fields)
-                        attachments_txt = None
-                        attachments_writer = None
-                        if include_attachments:
-                            attachments_member = zf.open("attachments.csv", "w")
-                            attachments_txt = io.TextIOWrapper(attachments_member, encoding="utf-8", newline="")
-                            attachments_writer = csv.writer(attachments_txt)
-                            attachments_writer.writerow(attachments_fields)
-                        update_interval = max(1, total_messages // 200) if total_messages else 50000
-                        try:
-                            for idx, key in enumerate(m.iterkeys(), 1):
-                                with m.get_file(key) as msg_fp:
-                                    if include_body or include_attachments:
-                                        msg = full_parser.parse(msg_fp)
-                                    else:
-                                        msg = header_parser.parse(msg_fp, headersonly=True)
-                                message_id = _header_value(msg, "Message-Id")
-                                row = [
-                                    _header_value(msg, "Date"),
-                                    _header_value(msg, "From"),
-                                    _header_value(msg, "To"),
-                                    _header_value(msg, "Cc"),
-                                    _header_value(msg, "Bcc"),
-                                    _header_value(msg, "Subject"),
-                                    message_id,
-                                ]
-                                if include_thread:
-                                    row.append(_header_value(msg, "X-GM-THRID"))
-                                if include_body:
-                                    row.append(_extract_body_text(msg))
-                                writer.writerow(row)
-                                if include_attachments and attachments_writer:
-                                    for attachment_row in _iter_attachment_rows(msg, message_id):
-                                        attachments_writer.writerow(attachment_row)
-                                processed = idx
-                                if processed % update_interval == 0:
-                                    j["processed"] = processed
-                                    _save(j)
-                        finally:
-                            if attachments_txt:
-                                attachments_txt.flush()
-                                attachments_txt.close()
-            j["status"] = "done"
-            j["processed"] = processed
-            j["total_messages"] = total_messages
-            j["out_path"] = str(out_zip)
-            _save(j)
-        finally:
-            try:
-                m.close()
-            except Exception:
-                pass
-    except Exception as e:
-        j["status"] = "error"
-        j["error"] = str(e)
-        _save(j)
-    finally:
-        try:
-            src.unlink(missing_ok=True)
-        except Exception:
-            pass
+_HEADER_LINE = re.compile(rb"From |[\041-\071\073-\176]*:|[\t ]")
+_ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+_DOT_ATOM = rf"{_ATOM}(?:\.{_ATOM})*"
+_ADDR_SPEC = rf"{_DOT_ATOM}@{_DOT_ATOM}"
+_SIMPLE_MAILBOX = re.compile(
+    rf"[ \t]*(?:({_ADDR_SPEC})|((?:{_ATOM}[ \t]+)*{_ATOM})?[ \t]*<({_ADDR_SPEC})>)[ \t]*"
+)
+_SIMPLE_MSGID = re.compile(rf"[ \t]*<{_ADDR_SPEC}>[ \t]*")
+_HEADER_KINDS = {
+    "date": "date",
+    "from": "address",
+    "to": "address",
+    "cc": "address",
+    "bcc": "address",
+    "subject": "text",
+    "message-id": "msgid",
+    "x-gm-thrid": "text",
+    "x-gmail-labels": "text",
+}
 
 
-@app.get("/", response_class=HTMLResponse)
-def home():
-    return HTML
+def _normalize_newlines(data: bytes) -> bytes:
+    # BytesParser reads through a universal-newlines TextIOWrapper; match it.
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    return data
 
 
-@app.head("/")
-def head_ok():
-    return Response(status_code=200)
+def _source_header(lines: List[bytes]) -> Tuple[str, str]:
+    first = lines[0]
+    colon = first.find(b":")
+    value = (first[colon + 1 :].lstrip(b" \t") + b"".join(lines[1:])).rstrip(b"\r\n")
+    return first[:colon].decode("ascii"), value.decode("ascii", "surrogateescape")
 
 
-@app.get("/how-to", response_class=HTMLResponse)
-def how_to():
-    return read_page("how-to.html")
+def _split_headers(data: bytes, start: int = 0, end: Optional[int] = None) -> Tuple[List[Tuple[str, str]], int]:
+    """Read a header block the way ``email.feedparser`` does, without building a message.
 
+    Returns the raw ``(name, value)`` pairs and the offset where the body starts
+    (-1 when the feedparser would push a stray "From " line back into the body).
+    """
+    if end is None:
+        end = len(data)
+    lines = []
+    pos = start
+    while pos < end:
+        newline = data.find(b"\n", pos, end)
+        stop = end if newline < 0 else newline + 1
+        if not _HEADER_LINE.match(data, pos, stop):
+            if data[pos] == 10:
+                pos = stop
+            break
+        lines.append(data[pos:stop])
+        pos = stop
+    headers = []
+    current: List[bytes] = []
+    last = len(lines) - 1
+    for lineno, line in enumerate(lines):
+        if line[0] in (9, 32):
+            if current:
+                current.append(line)
+            continue
+        if current:
+            headers.append(_source_header(current))
+            current = []
+        if line.startswith(b"From "):
+            if lineno == last and lineno:
+                return headers, -1
+            continue
+        if line[0] == 58:
+            continue
+        current = [line]
+    if current:
+        headers.append(_source_header(current))
+    return headers, pos
 
-@app.head("/how-to")
-def how_to_head():
-    return Response(status_code=200)
 
+def _first_headers(headers: List[Tuple[str, str]]) -> Dict[str, Tuple[str, str]]:
+    fields: Dict[str, Tuple[str, str]] = {}
+    for name, value in headers:
+        fields.setdefault(name.lower(), (name, value))
+    return fields
 
-@app.get("/faq", response_class=HTMLResponse)
-def faq():
-    return read_page("faq.html")
 
+def _render_header(name: str, raw: str, header_policy) -> str:
+    """Render a raw header value exactly as ``_header_value`` would for ``header_policy``.
 
-@app.head("/faq")
-def faq_head():
-    return Response(status_code=200)
+    Plain ASCII values of the CSV fields are rendered directly; anything that
+    needs RFC 2047 decoding or real address parsing goes through the policy.
+    """
+    if header_policy is policy.compat32:
+        if raw.isascii():
+            return raw
+    else:
+        value = raw.replace("\r", "").replace("\n", "") if "\n" in raw or "\r" in raw else raw
+        kind = _HEADER_KINDS.get(name.lower())
+        if kind and value.isascii() and "=?" not in value:
+            if kind == "text":
+                return value
+            if kind == "msgid":
+                if _SIMPLE_MSGID.fullmatch(value):
+                    return value
+            elif kind == "date":
+                if not value:
+                    return ""
+                try:
+                    try:
+                        parsed = email_utils.parsedate_to_datetime(value)
+                    except ValueError:
+                        return value
+                    return email_utils.format_datetime(parsed)
+                except Exception:
+                    return ""
+            else:
+                rendered = []
+                for item in value.split(","):
+                    match = _SIMPLE_MAILBOX.fullmatch(item)
+                    if not match:
+                        break
+                    bare, display, addr_spec = match.groups()
+                    if bare:
+                        rendered.append(bare)
+                    elif display:
+                        rendered.append(f"{' '.join(display.split())} <{addr_spec}>")
+                    else:
+                        rendered.append(addr_spec)
+                else:
+                    return ", ".join(rendered)
+    try:
+        return _coerce_header_value(header_policy.header_fetch_parse(name, raw))
+    except Exception:
+        return ""
 
 
-@app.get("/privacy", response_class=HTMLResponse)
-def privacy():
-    return read_page("privacy.html")
+def _fields_value(fields: Dict[str, Tuple[str, str]], name: str, header_policy) -> str:
+    entry = fields.get(name)
+    if entry is None:
+        return ""
+    return _render_header(entry[0], entry[1], header_policy)
 
 
-@app.head("/privacy")
-def privacy_head():
-    return Response(status_code=200)
+class _MimeFallback(Exception):
+    """The fast MIME walker hit a structure only the full parser reproduces exactly."""
 
 
-@app.get("/terms", response_class=HTMLResponse)
-def terms():
-    return read_page("terms.html")
+_BOUNDARY_END = re.compile(rb"(--)?[ \t]*\n?$")
+_BASE64_BODY = re.compile(rb"[A-Za-z0-9+/\n]*={0,2}\n*")
 
 
-@app.head("/terms")
-def terms_head():
-    return Response(status_code=200)
+def _walk_mime(data: bytes, start: int, end: int, strip: bool, parent=None, default_type: str = "text/plain"):
+    """Yield ``(part, payload_start, payload_stop)`` in ``Message.walk()`` order.
 
+    Parts are header-only ``EmailMessage`` skeletons; leaf payloads are left in
+    ``data`` as byte ranges (``None`` for containers), so attachment bodies are
+    skipped with ``bytes.find`` instead of being fed line by line to the
+    feedparser. Boundaries, preambles and the newline owned by each boundary
+    follow ``email.feedparser``; anything it would flag as a defect raises
+    ``_MimeFallback``.
+    """
+    headers, body = _split_headers(data, start, end)
+    if body < 0:
+        raise _MimeFallback("stray From line")
+    part = EmailMessage(policy.default)
+    if default_type != "text/plain":
+        part.set_default_type(default_type)
+    for name, value in headers:
+        part.set_raw(name, value)
+    if parent is not None:
+        parent.attach(part)
+    content_type = part.get_content_type()
+    maintype = part.get_content_maintype()
+    if maintype == "message":
+        if content_type == "message/delivery-status":
+            raise _MimeFallback(content_type)
+        part.set_payload([])
+        yield part, None, None
+        yield from _walk_mime(data, body, end, strip, part)
+        return
+    if maintype != "multipart":
+        stop = end
+        if strip and stop > body and data[stop - 1] == 10:
+            stop -= 1
+        yield part, body, stop
+        return
+    boundary = part.get_boundary()
+    if boundary is None:
+        raise _MimeFallback("multipart without boundary")
+    separator = b"--" + boundary.encode("ascii")
+    child_type = "message/rfc822" if content_type == "multipart/digest" else "text/plain"
+    part.set_payload([])
+    yield part, None, None
 
-@app.get("/contact", response_class=HTMLResponse)
-def contact():
-    return read_page("contact.html")
+    def match(pos):
+        if not data.startswith(separator, pos, end):
+            return None
+        newline = data.find(b"\n", pos, end)
+        line_end = end if newline < 0 else newline + 1
+        found = _BOUNDARY_END.match(data, pos + len(separator), line_end)
+        return (bool(found.group(1)), line_end) if found else None
 
+    def next_boundary(pos):
+        found = match(pos) if pos < end else None
+        while found is None:
+            pos = data.find(b"\n" + separator, pos, end)
+            if pos < 0:
+                raise _MimeFallback("missing boundary")
+            pos += 1
+            found = match(pos)
+        return (pos,) + found
 
-@app.head("/contact")
-def contact_head():
-    return Response(status_code=200)
+    _, closing, line_end = next_boundary(body)
+    if closing:
+        raise _MimeFallback("start boundary not found")
+    while not closing:
+        pos = line_end
+        duplicate = match(pos) if pos < end else None
+        while duplicate:
+            pos = duplicate[1]
+            duplicate = match(pos) if pos < end else None
+        line_start, closing, line_end = next_boundary(pos)
+        yield from _walk_mime(data, pos, line_start, True, part, child_type)
 
 
-@app.get("/support", response_class=HTMLResponse)
-def support():
-    return read_page("support.html")
+def _leaf_prefix_text(part, data: bytes, start: int, stop: int) -> Optional[str]:
+    # Decode only the head of a large text part when that provably yields the
+    # same first BODY_LIMIT characters as decoding all of it.
+    cut = start + BODY_SCAN_BYTES
+    cte = str(part.get("content-transfer-encoding", "")).lower()
+    if cte == "base64":
+        match = _BASE64_BODY.fullmatch(data, start, stop)
+        if not match:
+            return None
+        digits = stop - start - data.count(b"\n", start, stop) - data.count(b"=", start, stop)
+        if digits % 4 == 1:
+            return None
+        head = data[start:cut].replace(b"\n", b"")
+        head = head[: len(head) - len(head) % 4]
+    elif cte == "quoted-printable":
+        head = data[start : data.rfind(b"\n", start, cut) + 1]
+    elif cte in ("x-uuencode", "uuencode", "uue", "x-uue"):
+        return None
+    else:
+        head = data[start:cut]
+    preview = EmailMessage(policy.default)
+    for name, value in part.raw_items():
+        preview.set_raw(name, value)
+    preview.set_payload(head.decode("ascii", "surrogateescape"))
+    try:
+        text = _part_text(preview)[:-16].strip()
+    except Exception:
+        return None
+    return text if len(text) >= BODY_LIMIT else None
 
 
-@app.head("/support")
-def support_head():
-    return Response(status_code=200)
+def _leaf_text(part, data: bytes, start: int, stop: int) -> str:
+    if stop - start > 2 * BODY_SCAN_BYTES:
+        text = _leaf_prefix_text(part, data, start, stop)
+        if text is not None:
+            return text
+    part.set_payload(data[start:stop].decode("ascii", "surrogateescape"))
+    return _part_text(part).strip()
 
 
-@app.get("/robots.txt")
-def robots():
-    txt = (PAGES / "robots.txt").read_text(encoding="utf-8")
-    return Response(
-        txt,
-        media_type="text/plain; charset=utf-8",
-        headers={"Cache-Control": "no-store"},
-    )
+def _encoded_payload_size(part, data: bytes, start: int, stop: int) -> int:
+    """``len(part.get_payload(decode=True))`` computed without decoding the payload."""
+    cte = str(part.get("content-transfer-encoding", "")).lower()
+    if cte == "base64" and _BASE64_BODY.fullmatch(data, start, stop):
+        padding = data.count(b"=", start, stop)
+        digits = stop - start - data.count(b"\n", start, stop) - padding
+        if digits % 4 == 1:
+            # email._encoded_words.decode_b gives up and returns the encoded text.
+            return digits + padding
+        return digits // 4 * 3 + (0, 0, 1, 2)[digits % 4]
+    if cte == "quoted-printable":
+        size = 0
+        pos = start
+        while pos < stop:
+            cut = stop
+            if stop - pos > QP_COUNT_BLOCK:
+                # a2b_qp never looks past a line break, so line-aligned blocks add up.
+                newline = data.rfind(b"\n", pos, pos + QP_COUNT_BLOCK)
+                if newline < 0:
+                    newline = data.find(b"\n", pos + QP_COUNT_BLOCK, stop)
+                if newline >= 0:
+                    cut = newline + 1
+            size += len(binascii.a2b_qp(data[pos:cut]))
+            pos = cut
+        return size
+    if cte in ("base64", "x-uuencode", "uuencode", "uue", "x-uue"):
+        part.set_payload(data[start:stop].decode("ascii", "surrogateescape"))
+        return _payload_size(part)
+    return stop - start
+
+
+def _html_leaf_text(part, data: bytes, start: int, stop: int) -> str:
+    # HTML shrinks by an unknown amount, so the whole part is decoded.
+    part.set_payload(data[start:stop].decode("ascii", "surrogateescape"))
+    return _html_text(_part_text(part))
+
+
+def _body_candidate(
+    part, data: bytes, start: Optional[int], stop: Optional[int], root: bool, html_parts: List[tuple]
+) -> Optional[str]:
+    # One step of _extract_body_text over _walk_mime output; None means keep looking.
+    # text/html leaves are collected in html_parts for the fallback.
+    if root and start is not None:
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            return _leaf_text(part, data, start, stop)[:BODY_LIMIT]
+        if content_type == "text/html":
+            return _html_leaf_text(part, data, start, stop)
+        return ""
+    if part.get_filename() or start is None:
+        return None
+    content_type = part.get_content_type()
+    if content_type == "text/plain":
+        text = _leaf_text(part, data, start, stop)
+        if text:
+            return text[:BODY_LIMIT]
+    elif content_type == "text/html":
+        html_parts.append((part, start, stop))
+    return None
+
+
+def _fast_message_parts(
+    data: bytes, include_body: bool, include_attachments: bool, message_id: str
+) -> Tuple[Optional[str], List[tuple]]:
+    """Return the body text and attachment rows the full ``policy.default`` parse would give.
+
+    The body search stops at the first usable text part unless attachments are
+    wanted too. Attachment sizes come from the encoded length, so payloads are
+    never decoded. Raises ``_MimeFallback`` when the message needs the full parser.
+    """
+    body = None
+    html_parts: List[tuple] = []
+    ranges: Dict[int, Tuple[int, int]] = {}
+    root = None
+    try:
+        for part, start, stop in _walk_mime(data, 0, len(data), False):
+            if root is None:
+                root = part
+            elif start is not None:
+                ranges[id(part)] = (start, stop)
+            if include_body and body is None:
+                try:
+                    body = _body_candidate(part, data, start, stop, part is root, html_parts)
+                except Exception:
+                    body = ""
+                if body is not None and not include_attachments:
+                    break
+    except _MimeFallback:
+        raise
+    except Exception as exc:
+        raise _MimeFallback(str(exc)) from exc
+    if include_body and body is None:
+        # No usable text/plain part: fall back to the first HTML one.
+        body = ""
+        if html_parts:
+            part, start, stop = html_parts[0]
+            try:
+                body = _html_leaf_text(part, data, start, stop)
+            except Exception:
+                pass
+    attachment_rows = []
+    if include_attachments:
+
+        def size_of(part) -> int:
+            if id(part) not in ranges:
+                return _payload_size(part)
+            try:
+                return _encoded_payload_size(part, data, *ranges[id(part)])
+            except Exception:
+                return 0
+
+        attachment_rows = list(_iter_attachment_rows(root, message_id, size_of))
+    return body, attachment_rows
+
+
+def _mbox_message(buf: bytearray, head: int, end: int) -> bytes:
+    newline = buf.find(b"\n", head, end)
+    if newline < 0:
+        return b""
+    stop = end
+    if buf[end - 2 : end] == b"\n\n":
+        stop = end - 1
+    return bytes(buf[newline + 1 : stop])
+
+
+def _iter_mbox_messages(path, start: int = 0, stop: Optional[int] = None):
+    """Yield ``(offset, data)`` for each message in ``path`` between ``start`` and ``stop``.
+
+    Messages are split on "From " lines exactly like ``mailbox.mbox`` (including
+    dropping the blank line before a separator), but the file is read once in
+    large blocks instead of being indexed up front and re-read per message.
+    ``path`` is a ``Path`` or anything else with a compatible ``open``, such
+    as a ``_GrowingUpload``.
+    """
+    buf = bytearray(b"\n")
+    base = start - 1
+    head = -1
+    scan = 0
+    left = None if stop is None else stop - start
+    with path.open("rb") as fp:
+        fp.seek(start)
+        while True:
+            want = MBOX_READ_BLOCK if left is None else min(MBOX_READ_BLOCK, left)
+            block = fp.read(want) if want else b""
+            if left is not None:
+                left -= len(block)
+            buf += block
+            while True:
+                found = buf.find(b"\nFrom ", scan)
+                if found < 0:
+                    break
+                if head >= 0:
+                    yield base + head, _mbox_message(buf, head, found + 1)
+                head = found + 1
+                scan = head
+            if not block:
+                break
+            scan = max(scan, len(buf) - 5)
+            drop = head if head >= 0 else scan
+            if drop > 0:
+                del buf[:drop]
+                base += drop
+                scan -= drop
+                if head >= 0:
+                    head = 0
+    if head >= 0:
+        yield base + head, _mbox_message(buf, head, len(buf))
+
+
+def _mbox_shard_bounds(path: Path, size: int, count: int, start: int = 0) -> List[int]:
+    """Split ``path`` from ``start`` into at most ``count`` byte ranges that start on "From " lines."""
+    bounds = [start]
+    with path.open("rb") as fp:
+        for n in range(1, count):
+            base = max(start + (size - start) * n // count, bounds[-1] + 1) - 1
+            fp.seek(base)
+            data = b""
+            boundary = -1
+            while boundary < 0:
+                block = fp.read(1024 * 1024)
+                if not block:
+                    break
+                data += block
+                found = data.find(b"\nFrom ")
+                if found >= 0:
+                    boundary = base + found + 1
+                else:
+                    base += len(data) - 5
+                    data = data[-5:]
+            if boundary < 0:
+                break
+            bounds.append(boundary)
+    bounds.append(size)
+    return bounds
+
+
+def _parse_processes() -> ProcessPoolExecutor:
+    global _PROCS
+    if _PROCS is None:
+        # spawn: the API process is multi-threaded, so forking it is not safe.
+        _PROCS = ProcessPoolExecutor(
+            max_workers=PARSE_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _PROCS
+
+
+_FULL_PARSER = BytesParser(policy=policy.default)
+
+
+ALL_COLUMNS = [
+    "date", "from", "to", "cc", "bcc", "subject", "message_id", "thread_id", "parent_id", "thread_depth", "labels", "body"
+]
+
+
+def _row_fields(options: Dict[str, Any]) -> List[str]:
+    """Fields of the rows ``_convert_message`` builds, before column selection."""
+    fields = ["date", "from", "to", "cc", "bcc", "subject", "message_id"]
+    if options["include_thread_id"] or options["build_threads"]:
+        fields.append("thread_id")
+    if options["build_threads"]:
+        fields.extend(("parent_id", "thread_depth"))
+    if options["include_labels"] or options["split_labels"]:
+        fields.append("labels")
+    if options["include_body"]:
+        fields.append("body")
+    return fields
+
+
+def _header_fields(options: Dict[str, Any]) -> List[str]:
+    if options["columns"]:
+        return list(options["columns"])
+    fields = _row_fields(options)
+    if options["split_labels"] and not options["include_labels"]:
+        fields.remove("labels")
+    return fields
+
+
+@functools.lru_cache(maxsize=64)
+def _projection(row_fields: Tuple[str, ...], header_fields: Tuple[str, ...]) -> Optional[Tuple[int, ...]]:
+    if row_fields == header_fields:
+        return None
+    return tuple(row_fields.index(name) for name in header_fields)
+
+
+def _project_row(row: List[str], options: Dict[str, Any]) -> List[str]:
+    if not options["columns"] and not options["split_labels"]:
+        return row
+    indices = _projection(tuple(_row_fields(options)), tuple(_header_fields(options)))
+    return row if indices is None else [row[n] for n in indices]
+
+
+def _filter_datetime(value: str) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _address_matcher(pattern: str):
+    pattern = pattern.strip().lower()
+    if "@" in pattern and not pattern.startswith("@"):
+        return lambda address: fnmatch.fnmatchcase(address, pattern)
+    domain = pattern.lstrip("@")
+
+    def match(address: str) -> bool:
+        host = address.rpartition("@")[2]
+        return host == domain or host.endswith("." + domain)
+
+    return match
+
+
+def _subject_matcher(pattern: str):
+    """Case-insensitive glob over the decoded subject; without wildcards, a substring match.
+
+    fnmatch compiles ``*`` to atomic groups, so unlike a user-supplied regular
+    expression no pattern can backtrack for ages in a shared parse worker.
+    """
+    pattern = pattern.casefold()
+    if not any(char in pattern for char in "*?["):
+        return lambda subject: pattern in subject.casefold()
+    match = re.compile(fnmatch.translate(pattern)).match
+    return lambda subject: match(subject.casefold()) is not None
+
+
+def _header_addresses(fields: Dict[str, Tuple[str, str]], *names: str) -> List[str]:
+    raw = [fields[name][1] for name in names if name in fields]
+    return [address.lower() for _name, address in email_utils.getaddresses(raw) if address]
+
+
+def _labels_value(fields: Dict[str, Tuple[str, str]]) -> str:
+    """The X-Gmail-Labels value, RFC 2047 decoded whatever policy the job renders its headers with."""
+    return _fields_value(fields, "x-gmail-labels", policy.default)
+
+
+@functools.lru_cache(maxsize=4096)
+def _gmail_labels(value: str) -> Tuple[str, ...]:
+    """Split an X-Gmail-Labels value into interned labels; labels containing commas are quoted.
+
+    Takeout repeats the same few label sets, so the cache also saves the split.
+    """
+    if not value:
+        return ()
+    labels = (label.strip() for label in next(csv.reader([value], skipinitialspace=True)))
+    return tuple(sys.intern(label) for label in labels if label)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_filter(spec: str):
+    """Build a predicate over a message's first headers from a normalized filter spec.
+
+    Raises ValueError for an invalid spec.
+    """
+    spec = json.loads(spec)
+    unknown = set(spec) - set(MessageFilter.model_fields)
+    if unknown:
+        raise ValueError(f"unknown filter keys: {', '.join(sorted(unknown))}")
+    date_from = _filter_datetime(spec["date_from"]) if spec.get("date_from") else None
+    date_to = _filter_datetime(spec["date_to"]) if spec.get("date_to") else None
+    senders = [_address_matcher(pattern) for pattern in spec.get("senders", ())]
+    recipients = [_address_matcher(pattern) for pattern in spec.get("recipients", ())]
+    subject = _subject_matcher(spec["subject"]) if spec.get("subject") else None
+    labels = {label.casefold() for label in spec.get("labels", ())}
+
+    def accept(fields: Dict[str, Tuple[str, str]]) -> bool:
+        if date_from or date_to:
+            try:
+                date = email_utils.parsedate_to_datetime(fields["date"][1])
+                if date.tzinfo is None:
+                    date = date.replace(tzinfo=datetime.timezone.utc)
+            except Exception:
+                return False
+            if (date_from and date < date_from) or (date_to and date >= date_to):
+                return False
+        if senders and not any(match(a) for a in _header_addresses(fields, "from") for match in senders):
+            return False
+        if recipients and not any(
+            match(a) for a in _header_addresses(fields, "to", "cc") for match in recipients
+        ):
+            return False
+        if subject and not subject(_fields_value(fields, "subject", policy.default)):
+            return False
+        if labels and not any(
+            label.casefold() in labels
+            for label in _gmail_labels(_labels_value(fields))
+        ):
+            return False
+        return True
+
+    return accept
+
+
+ATTACHMENTS_FIELDS = ["message_id", "filename", "content_type", "size_bytes"]
+
+
+class _FingerprintSet:
+    """Set of 64-bit message fingerprints in one flat array, probed linearly.
+
+    8 bytes a slot and at most 70% full, so ten million messages fit in 128 MiB.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self._slots = array.array("Q", bytes(8 * capacity))
+        self._mask = capacity - 1
+        self._size = 0
+
+    def add(self, fingerprint: int) -> bool:
+        """Insert ``fingerprint`` (non-zero); False if it was already there."""
+        slots = self._slots
+        mask = self._mask
+        n = fingerprint & mask
+        while True:
+            slot = slots[n]
+            if slot == fingerprint:
+                return False
+            if not slot:
+                break
+            n = (n + 1) & mask
+        slots[n] = fingerprint
+        self._size += 1
+        if self._size * 10 > len(slots) * 7:
+            old = slots
+            self._slots = array.array("Q", bytes(16 * len(old)))
+            self._mask = 2 * len(old) - 1
+            self._size = 0
+            for fingerprint in old:
+                if fingerprint:
+                    self.add(fingerprint)
+        return True
+
+
+def _message_fingerprint(data: bytes, fields: Dict[str, Tuple[str, str]], body_start: int) -> int:
+    """Hash of the Message-Id or, without one, of the main headers and the raw body; never 0."""
+    message_id = fields.get("message-id", ("", ""))[1]
+    token = _MESSAGE_ID_TOKEN.search(message_id)
+    if token or message_id.strip():
+        return _message_id_hash(token.group() if token else message_id) or 1
+    digest = hashlib.blake2b(digest_size=8)
+    for name in ("date", "from", "to", "cc", "subject"):
+        digest.update(" ".join(fields.get(name, ("", ""))[1].split()).encode("utf-8", "surrogateescape") + b"\0")
+    digest.update(memoryview(data)[max(body_start, 0):])
+    return int.from_bytes(digest.digest(), "little") or 1
+
+
+def _convert_message(
+    data: bytes, options: Dict[str, Any], fingerprints: Optional[_FingerprintSet] = None
+) -> Tuple[Optional[List[str]], Optional[List[tuple]]]:
+    """Build a message's row (all ``_row_fields``) and attachment rows.
+
+    The row is None if the filter rejects the message; both are None if it is
+    already in ``fingerprints``.
+    """
+    include_body = options["include_body"]
+    include_attachments = options["include_attachments"]
+    data = _normalize_newlines(data)
+    headers, body_start = _split_headers(data)
+    fields = _first_headers(headers)
+    if options["filter"] and not _compile_filter(options["filter"])(fields):
+        # Rejected on headers alone: the body and attachments are never parsed.
+        return None, []
+    if fingerprints is not None and not fingerprints.add(_message_fingerprint(data, fields, body_start)):
+        return None, None
+    # Header-only jobs have always rendered headers with the compat32 policy.
+    header_policy = policy.default if include_body or include_attachments else policy.compat32
+    message_id = _fields_value(fields, "message-id", header_policy)
+    row = [
+        _fields_value(fields, "date", header_policy),
+        _fields_value(fields, "from", header_policy),
+        _fields_value(fields, "to", header_policy),
+        _fields_value(fields, "cc", header_policy),
+        _fields_value(fields, "bcc", header_policy),
+        _fields_value(fields, "subject", header_policy),
+        message_id,
+    ]
+    if options["build_threads"]:
+        # Until the threads are resolved, thread_id carries the ancestors for _Threads.
+        refs = _message_refs(fields)
+        row.extend((" ".join(refs), refs[-1] if refs else "", ""))
+    elif options["include_thread_id"]:
+        row.append(_fields_value(fields, "x-gm-thrid", header_policy))
+    if options["include_labels"] or options["split_labels"]:
+        row.append(_labels_value(fields))
+    body = None
+    attachment_rows = []
+    if include_body or include_attachments:
+        try:
+            body, attachment_rows = _fast_message_parts(data, include_body, include_attachments, message_id)
+        except _MimeFallback:
+            msg = _FULL_PARSER.parse(io.BytesIO(data))
+            if include_body:
+                body = _extract_body_text(msg)
+            if include_attachments:
+                attachment_rows = list(_iter_attachment_rows(msg, message_id))
+    if include_body:
+        row.append(body)
+    return row, attachment_rows
+
+
+class _LabelSplitter:
+    """Spools one CSV per Gmail label in ``directory`` while rows stream past.
+
+    At most LABEL_OPEN_FILES spools are open at once; the least recently used
+    one is closed and reopened for appending when needed.
+    """
+
+    def __init__(self, directory: Path, options: Dict[str, Any], header: bool = True):
+        directory.mkdir(parents=True, exist_ok=True)
+        self._directory = directory
+        self._options = options
+        self._labels_at = _row_fields(options).index("labels")
+        self._header = _header_fields(options) if header else None
+        self._paths: Dict[str, Path] = {}
+        self._open: "collections.OrderedDict[str, Any]" = collections.OrderedDict()
+        self._line = io.StringIO()
+        self._writer = csv.writer(self._line)
+
+    def _spool(self, label: str):
+        fp = self._open.get(label)
+        if fp is not None:
+            self._open.move_to_end(label)
+            return fp
+        if len(self._open) >= LABEL_OPEN_FILES:
+            self._open.popitem(last=False)[1].close()
+        path = self._paths.get(label)
+        if path is None:
+            path = self._paths[label] = self._directory / f"{len(self._paths)}.csv"
+            fp = path.open("w", encoding="utf-8", newline="")
+            if self._header:
+                csv.writer(fp).writerow(self._header)
+        else:
+            fp = path.open("a", encoding="utf-8", newline="")
+        self._open[label] = fp
+        return fp
+
+    def write(self, row: List[str]) -> None:
+        """Add ``row`` (all ``_row_fields``) to the spool of each of its labels."""
+        labels = _gmail_labels(row[self._labels_at])
+        if not labels:
+            return
+        # Format once, copy to every label.
+        self._line.seek(0)
+        self._line.truncate()
+        self._writer.writerow(_project_row(row, self._options))
+        line = self._line.getvalue()
+        for label in labels:
+            self._spool(label).write(line)
+
+    def absorb(self, part: "_LabelSplitter") -> None:
+        """Append a closed shard splitter's spools (written without headers)."""
+        for label, path in part.members():
+            fp = self._spool(label)
+            fp.flush()
+            with path.open("rb") as src:
+                shutil.copyfileobj(src, fp.buffer, 1024 * 1024)
+
+    def members(self) -> List[Tuple[str, Path]]:
+        return list(self._paths.items())
+
+    def close(self) -> None:
+        while self._open:
+            self._open.popitem()[1].close()
+
+    def __getstate__(self):
+        # Shard workers send back a closed splitter; only the spool paths matter.
+        return {"_paths": self._paths}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open = collections.OrderedDict()
+
+
+def _label_member_names(labels: List[str]) -> List[str]:
+    """ZIP member names for labels: nested labels become folders, unsafe characters become "_"."""
+    names = []
+    used = set()
+    for label in labels:
+        parts = [re.sub(r"[^\w .,()&'+-]", "_", part).strip(" .") or "_" for part in label.split("/")]
+        name = "labels/" + "/".join(parts)
+        candidate, n = f"{name}.csv", 1
+        while candidate.lower() in used:
+            n += 1
+            candidate = f"{name} ({n}).csv"
+        used.add(candidate.lower())
+        names.append(candidate)
+    return names
+
+
+_MESSAGE_ID_TOKEN = re.compile(r"<[^<>\s]+>")
+_REPLY_PREFIX = re.compile(r"(?:\s*(?:re|fwd?|aw|sv)(?:\[\d+\])?\s*:)+\s*", re.IGNORECASE)
+
+
+def _message_refs(fields: Dict[str, Tuple[str, str]]) -> List[str]:
+    """A message's ancestors, oldest first: References, or In-Reply-To without it.
+
+    Long chains keep the first id and the nearest THREAD_REFS - 1.
+    """
+    refs = _MESSAGE_ID_TOKEN.findall(_fields_value(fields, "references", policy.compat32))
+    if not refs:
+        refs = _MESSAGE_ID_TOKEN.findall(_fields_value(fields, "in-reply-to", policy.compat32))[:1]
+    refs = list(dict.fromkeys(refs))
+    if len(refs) > THREAD_REFS:
+        refs = refs[:1] + refs[1 - THREAD_REFS:]
+    return refs
+
+
+class _ContainerTable:
+    """Message-Id hash -> container number for ``_Threads.resolve``, in one flat array probed linearly.
+
+    Slots hold container numbers plus one (0 is free) and compare keys through
+    the containers' own key array, so an id costs 4 bytes here on top of its 8
+    there. At most 70% full.
+    """
+
+    def __init__(self, keys: array.array, capacity: int = 1 << 16):
+        self._keys = keys
+        self._slots = array.array("I", bytes(4 * capacity))
+        self._mask = capacity - 1
+        self._size = 0
+
+    def get(self, key: int) -> int:
+        """The container holding ``key``, or -1."""
+        slots = self._slots
+        keys = self._keys
+        mask = self._mask
+        n = key & mask
+        while True:
+            slot = slots[n]
+            if not slot:
+                return -1
+            if keys[slot - 1] == key:
+                return slot - 1
+            n = (n + 1) & mask
+
+    def add(self, container: int) -> None:
+        """Index ``container`` under its key, which must not be in the table yet."""
+        slots = self._slots
+        mask = self._mask
+        n = self._keys[container] & mask
+        while slots[n]:
+            n = (n + 1) & mask
+        slots[n] = container + 1
+        self._size += 1
+        if self._size * 10 > len(slots) * 7:
+            old = slots
+            self._slots = array.array("I", bytes(8 * len(old)))
+            self._mask = 2 * len(old) - 1
+            self._size = 0
+            for slot in old:
+                if slot:
+                    self.add(slot - 1)
+
+
+class _Threads:
+    """JWZ threading over rows as they stream past, without keeping the messages.
+
+    Message-Ids, ancestors and normalized subjects are kept as 64-bit hashes in
+    flat arrays; ``resolve`` interns the ids into dense containers through a
+    ``_ContainerTable`` and links them once every row has been seen.
+    """
+
+    def __init__(self, options: Dict[str, Any]):
+        self._refs_at = _row_fields(options).index("thread_id")
+        self.ids = array.array("Q")
+        self.refs = array.array("Q")
+        self.ref_ends = array.array("Q")
+        self.subjects = array.array("Q")
+        self.replies = bytearray()
+        self.thread = array.array("Q")
+        self.depth = array.array("Q")
+
+    def add(self, row: List[str]) -> None:
+        """Record a row (all ``_row_fields``) in output order."""
+        own = _MESSAGE_ID_TOKEN.search(row[6])
+        self.ids.append(_message_id_hash(own.group() if own else row[6]) if row[6].strip() else 0)
+        self.refs.extend(_message_id_hash(ref) for ref in row[self._refs_at].split())
+        self.ref_ends.append(len(self.refs))
+        reply = _REPLY_PREFIX.match(row[5])
+        subject = " ".join(row[5][reply.end() if reply else 0:].split()).casefold()
+        self.subjects.append(_text_hash(subject) if subject else 0)
+        self.replies.append(reply is not None)
+
+    def extend(self, part: "_Threads") -> None:
+        """Append a finished shard's rows."""
+        base = len(self.refs)
+        self.ids.extend(part.ids)
+        self.refs.extend(part.refs)
+        self.ref_ends.extend(end + base for end in part.ref_ends)
+        self.subjects.extend(part.subjects)
+        self.replies.extend(part.replies)
+
+    def resolve(self) -> None:
+        """Fill ``thread`` (hash of the root's Message-Id) and ``depth`` for every row."""
+        keys = array.array("Q")  # container -> Message-Id hash
+        parent = array.array("q")  # container -> parent container, -1 at a root
+        owner = array.array("q")  # container -> row, -1 for ids only seen in References
+        interned = _ContainerTable(keys)
+
+        def container(key: int) -> int:
+            n = len(keys)
+            keys.append(key)
+            parent.append(-1)
+            owner.append(-1)
+            return n
+
+        def reaches(n: int, ancestor: int) -> bool:
+            while n >= 0:
+                if n == ancestor:
+                    return True
+                n = parent[n]
+            return False
+
+        rows = len(self.ids)
+        nodes = array.array("q", bytes(8 * rows))
+        for row, key in enumerate(self.ids):
+            n = interned.get(key) if key else -1
+            if n < 0 and key:
+                n = container(key)
+                interned.add(n)
+            elif n < 0 or owner[n] >= 0:
+                # No Message-Id, or a repeated one: the message gets a container of its own.
+                n = container(_text_hash(f"\0{row}"))
+            owner[n] = row
+            nodes[row] = n
+        start = 0
+        for row in range(rows):
+            end = self.ref_ends[row]
+            previous = -1
+            for ref in self.refs[start:end]:
+                n = interned.get(ref)
+                if n < 0:
+                    n = container(ref)
+                    interned.add(n)
+                # Link the chain where nothing is linked yet, never into a loop.
+                if previous >= 0 and parent[n] < 0 and not reaches(previous, n):
+                    parent[n] = previous
+                previous = n
+            start = end
+            # A message's own References decide its parent over what others implied.
+            n = nodes[row]
+            if previous < 0:
+                parent[n] = -1
+            elif not reaches(previous, n):
+                parent[n] = previous
+        self.refs = self.ref_ends = None
+        interned = None
+
+        def place() -> Tuple[array.array, array.array]:
+            root = array.array("q", bytes(8 * len(keys)))
+            depth = array.array("q", [-1]) * len(keys)
+            for n in nodes:
+                path = []
+                while depth[n] < 0 and parent[n] >= 0:
+                    path.append(n)
+                    n = parent[n]
+                if depth[n] < 0:
+                    root[n] = n
+                    depth[n] = 0
+                for n in reversed(path):
+                    root[n] = root[parent[n]]
+                    depth[n] = depth[parent[n]] + 1
+            return root, depth
+
+        root, depth = place()
+        # Threads whose root lost its References join the earliest thread with
+        # the same subject when they look like replies.
+        grouped: Dict[int, int] = {}
+        seen = bytearray(len(keys))
+        for row in range(rows):
+            top = root[nodes[row]]
+            if seen[top]:
+                continue
+            seen[top] = 1
+            first = owner[top] if owner[top] >= 0 else row
+            subject = self.subjects[first]
+            if not subject:
+                continue
+            group = grouped.setdefault(subject, top)
+            if group != top and self.replies[first]:
+                parent[top] = group
+        # Merged threads keep their depths: the subject gives no parent_id to count from.
+        root, _depth = place()
+        self.thread = array.array("Q", (keys[root[n]] for n in nodes))
+        self.depth = array.array("Q", (depth[n] for n in nodes))
+
+
+def _write_threaded(
+    rows_txt, emails_txt, options: Dict[str, Any], threads: _Threads,
+    index: Optional["_RowIndex"], labels: Optional[_LabelSplitter], csv_pos: int,
+) -> None:
+    """Copy spooled rows (all ``_row_fields``) to emails.csv with their resolved threads.
+
+    Rows change length here, so the index gets its emails.csv offsets now.
+    """
+    at = _row_fields(options).index("thread_id")
+    counter = _CountingText(emails_txt)
+    writer = csv.writer(counter)
+    for row, values in enumerate(csv.reader(rows_txt)):
+        values[at] = f"{threads.thread[row]:016x}"
+        values[at + 2] = str(threads.depth[row])
+        writer.writerow(_project_row(values, options))
+        if index is not None:
+            index.csv[row] = csv_pos
+            csv_pos += counter.take()
+        if labels is not None:
+            labels.write(values)
+    if index is not None:
+        index.csv_pos = csv_pos
+
+
+def _shard_fingerprints(in_path: str, start: int, stop: int, options: Dict[str, Any]) -> array.array:
+    """Process-pool entry point for dedupe jobs: fingerprints of one byte range, 0 where the filter rejects."""
+    message_filter = _compile_filter(options["filter"]) if options["filter"] else None
+    fingerprints = array.array("Q")
+    for _offset, data in _iter_mbox_messages(Path(in_path), start, stop):
+        data = _normalize_newlines(data)
+        headers, body_start = _split_headers(data)
+        fields = _first_headers(headers)
+        if message_filter and not message_filter(fields):
+            fingerprints.append(0)
+        else:
+            fingerprints.append(_message_fingerprint(data, fields, body_start))
+    return fingerprints
+
+
+def _parse_shard(
+    in_path: str, start: int, stop: int, options: Dict[str, Any], part: str, skip: Optional[array.array] = None
+) -> Tuple[int, int, int, Optional["_RowIndex"], Optional[_LabelSplitter], Optional[_Threads]]:
+    """Process-pool entry point: convert one byte range into partial CSV files.
+
+    ``skip`` lists the ordinals of messages in the range that are duplicates.
+    Returns the row count, the numbers of messages the filter rejected and
+    skipped, and the part's row index, label splitter and threading rows when
+    the job wants them.
+    """
+    count = 0
+    filtered = 0
+    skipped = 0
+    skip_at = iter(skip or ())
+    next_skip = next(skip_at, -1)
+    index = _RowIndex() if options["include_index"] else None
+    labels = _LabelSplitter(Path(f"{part}.labels"), options, header=False) if options["split_labels"] else None
+    threads = _Threads(options) if options["build_threads"] else None
+    with open(f"{part}.emails.csv", "w", encoding="utf-8", newline="") as emails_txt, open(
+        f"{part}.attachments.csv", "w", encoding="utf-8", newline=""
+    ) as attachments_txt:
+        counter = _CountingText(emails_txt)
+        writer = csv.writer(counter)
+        attachments_writer = csv.writer(attachments_txt)
+        for ordinal, (offset, data) in enumerate(_iter_mbox_messages(Path(in_path), start, stop)):
+            if index is not None:
+                index.end(offset)
+            if ordinal == next_skip:
+                skipped += 1
+                next_skip = next(skip_at, -1)
+                continue
+            row, attachment_rows = _convert_message(data, options)
+            if row is None:
+                filtered += 1
+                continue
+            writer.writerow(_project_row(row, options))
+            if index is not None:
+                index.add(offset, counter.take(), row[6])
+            if labels is not None:
+                labels.write(row)
+            if threads is not None:
+                threads.add(row)
+            attachments_writer.writerows(attachment_rows)
+            count += 1
+    if index is not None:
+        index.end(stop)
+    if labels is not None:
+        labels.close()
+    return count, filtered, skipped, index, labels, threads
+
+
+def _parse_serial(
+    j: Dict, src, source_size: int, options: Dict[str, Any], emails_txt, attachments_txt,
+    start: int = 0, processed: int = 0, checkpoint=None, index: Optional["_RowIndex"] = None,
+    labels: Optional[_LabelSplitter] = None, threads: Optional[_Threads] = None,
+) -> int:
+    counter = _CountingText(emails_txt)
+    writer = csv.writer(counter if index is not None else emails_txt)
+    attachments_writer = csv.writer(attachments_txt) if attachments_txt else None
+    update_bytes = max(1, source_size // 200)
+    next_update = start + update_bytes
+    next_checkpoint = time.monotonic() + CHECKPOINT_SECONDS
+    fingerprints = _FingerprintSet() if options["dedupe"] else None
+    j.setdefault("filtered", 0)
+    j.setdefault("duplicates", 0)
+    for offset, data in _iter_mbox_messages(src, start):
+        if checkpoint and time.monotonic() >= next_checkpoint:
+            # Everything before this message has been written.
+            checkpoint(offset, processed)
+            next_checkpoint = time.monotonic() + CHECKPOINT_SECONDS
+        if index is not None:
+            index.end(offset)
+        row, attachment_rows = _convert_message(data, options, fingerprints)
+        if attachment_rows is None:
+            j["duplicates"] += 1
+        elif row is None:
+            j["filtered"] += 1
+        else:
+            writer.writerow(_project_row(row, options))
+            if index is not None:
+                index.add(offset, counter.take(), row[6])
+            if labels is not None:
+                labels.write(row)
+            if threads is not None:
+                threads.add(row)
+            if attachments_writer:
+                attachments_writer.writerows(attachment_rows)
+            processed += 1
+        if offset >= next_update:
+            # No up-front message count: extrapolate from bytes consumed.
+            j["processed"] = processed
+            j["total_messages"] = max(processed, processed * source_size // offset)
+            _note_progress(
+                j["id"],
+                processed=j["processed"],
+                total_messages=j["total_messages"],
+                filtered=j["filtered"],
+                duplicates=j["duplicates"],
+            )
+            next_update = offset + update_bytes
+    return processed
+
+
+def _parse_sharded(
+    j: Dict, src: Path, bounds: List[int], options: Dict[str, Any], emails_txt, attachments_txt,
+    processed: int = 0, checkpoint=None, index: Optional["_RowIndex"] = None,
+    labels: Optional[_LabelSplitter] = None, threads: Optional[_Threads] = None,
+) -> int:
+    source_size = bounds[-1]
+    next_checkpoint = time.monotonic() + CHECKPOINT_SECONDS
+    pool = _parse_processes()
+    parts = [UP / f"{j['id']}.part{n}" for n in range(len(bounds) - 1)]
+    futures = []
+    j.setdefault("filtered", 0)
+    j.setdefault("duplicates", 0)
+    try:
+        if options["dedupe"]:
+            # The first copy wins across shards, so every shard's fingerprints are
+            # read (headers only) before the shards are converted.
+            scans = [
+                pool.submit(_shard_fingerprints, str(src), bounds[n], bounds[n + 1], options)
+                for n in range(len(parts))
+            ]
+            seen = _FingerprintSet()
+            for n, scan in enumerate(scans):
+                skip = array.array("Q")
+                for ordinal, fingerprint in enumerate(scan.result()):
+                    if fingerprint and not seen.add(fingerprint):
+                        skip.append(ordinal)
+                futures.append(
+                    pool.submit(_parse_shard, str(src), bounds[n], bounds[n + 1], options, str(parts[n]), skip)
+                )
+        else:
+            futures.extend(
+                pool.submit(_parse_shard, str(src), bounds[n], bounds[n + 1], options, str(part))
+                for n, part in enumerate(parts)
+            )
+        for n, future in enumerate(futures):
+            count, filtered, skipped, part_index, part_labels, part_threads = future.result()
+            processed += count
+            j["filtered"] += filtered
+            j["duplicates"] += skipped
+            if index is not None:
+                index.extend(part_index)
+            if labels is not None:
+                labels.absorb(part_labels)
+                shutil.rmtree(f"{parts[n]}.labels", ignore_errors=True)
+            if threads is not None:
+                threads.extend(part_threads)
+            emails_txt.flush()
+            with open(f"{parts[n]}.emails.csv", "rb") as part_fp:
+                shutil.copyfileobj(part_fp, emails_txt.buffer, 1024 * 1024)
+            if attachments_txt:
+                attachments_txt.flush()
+                with open(f"{parts[n]}.attachments.csv", "rb") as part_fp:
+                    shutil.copyfileobj(part_fp, attachments_txt.buffer, 1024 * 1024)
+            j["processed"] = processed
+            j["total_messages"] = max(processed, processed * source_size // max(1, bounds[n + 1]))
+            _note_progress(
+                j["id"],
+                processed=j["processed"],
+                total_messages=j["total_messages"],
+                filtered=j["filtered"],
+                duplicates=j["duplicates"],
+            )
+            if checkpoint and time.monotonic() >= next_checkpoint:
+                checkpoint(bounds[n + 1], processed)
+                next_checkpoint = time.monotonic() + CHECKPOINT_SECONDS
+    finally:
+        for future in futures:
+            future.cancel()
+        for part in parts:
+            for suffix in (".emails.csv", ".attachments.csv"):
+                try:
+                    Path(f"{part}{suffix}").unlink(missing_ok=True)
+                except Exception:
+                    pass
+            shutil.rmtree(f"{part}.labels", ignore_errors=True)
+    return processed
+
+
+# --- message index ---
+# Sidecar layout, all little-endian uint64: magic, row count n, then per row
+# (mbox offset, mbox length, emails.csv offset, emails.csv length), then n
+# (Message-Id hash, row) pairs sorted by hash, then for build_threads jobs n
+# (thread_id, thread_depth) pairs. mbox lengths run to the next message, so a
+# raw slice includes the "From " line.
+INDEX_MAGIC = int.from_bytes(b"MBXIDX01", "little")
+
+
+def _text_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "surrogateescape"), digest_size=8).digest(), "little")
+
+
+def _message_id_hash(message_id: str) -> int:
+    return _text_hash(message_id.strip().strip("<>").strip())
+
+
+class _CountingText:
+    """Text stream wrapper that counts the UTF-8 bytes written since the last ``take``."""
+
+    def __init__(self, txt):
+        self._txt = txt
+        self._count = 0
+
+    def write(self, text: str) -> int:
+        # csv.writer writes each row with a single call.
+        self._count += len(text) if text.isascii() else len(text.encode("utf-8", "surrogateescape"))
+        return self._txt.write(text)
+
+    def take(self) -> int:
+        count, self._count = self._count, 0
+        return count
+
+
+class _RowIndex:
+    """Offsets of every message in the mbox and row in emails.csv, kept in flat arrays.
+
+    A message's mbox length is only known when the next message (kept or
+    filtered out) starts, so callers report every message start with ``end``.
+    """
+
+    def __init__(self, csv_pos: int = 0):
+        self.mbox = array.array("Q")
+        self.mbox_len = array.array("Q")
+        self.csv = array.array("Q")
+        self.ids = array.array("Q")
+        self.csv_pos = csv_pos
+        self.open = False
+
+    @property
+    def complete_rows(self) -> int:
+        return len(self.mbox) - self.open
+
+    def add(self, mbox_offset: int, row_bytes: int, message_id: str) -> None:
+        self.mbox.append(mbox_offset)
+        self.mbox_len.append(0)
+        self.csv.append(self.csv_pos)
+        self.ids.append(_message_id_hash(message_id))
+        self.csv_pos += row_bytes
+        self.open = True
+
+    def end(self, mbox_offset: int) -> None:
+        """The last added message ends before ``mbox_offset``, if it has not ended yet."""
+        if self.open:
+            self.mbox_len[-1] = mbox_offset - self.mbox[-1]
+            self.open = False
+
+    def extend(self, part: "_RowIndex") -> None:
+        """Append a finished shard's index, whose CSV offsets start at 0."""
+        base = self.csv_pos
+        self.mbox.extend(part.mbox)
+        self.mbox_len.extend(part.mbox_len)
+        self.csv.extend(pos + base for pos in part.csv)
+        self.ids.extend(part.ids)
+        self.csv_pos += part.csv_pos
+
+    def write(self, path: Path, mbox_end: int, threads: Optional[_Threads] = None) -> None:
+        self.end(mbox_end)
+        n = len(self.mbox)
+        rows = array.array("Q", bytes(32 * n))
+        rows[0::4] = self.mbox
+        rows[1::4] = self.mbox_len
+        rows[2::4] = self.csv
+        rows[3::4] = array.array("Q", (end - start for start, end in zip(self.csv, [*self.csv[1:], self.csv_pos])))
+        ids = array.array("Q", bytes(16 * n))
+        order = sorted(range(n), key=self.ids.__getitem__)
+        ids[0::2] = array.array("Q", (self.ids[row] for row in order))
+        ids[1::2] = array.array("Q", order)
+        with path.open("wb") as fp:
+            fp.write(array.array("Q", (INDEX_MAGIC, n)).tobytes())
+            fp.write(rows.tobytes())
+            fp.write(ids.tobytes())
+            if threads is not None:
+                pairs = array.array("Q", bytes(16 * n))
+                pairs[0::2] = threads.thread
+                pairs[1::2] = threads.depth
+                fp.write(pairs.tobytes())
+
+
+# Indexes of jobs still parsing, with their source, for previews.
+_LIVE_INDEXES: Dict[str, Tuple["_RowIndex", Any, Dict[str, Any]]] = {}
+
+
+@contextmanager
+def _open_index(path: Path):
+    """Map an index sidecar and yield it as a flat sequence of uint64."""
+    with path.open("rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        table = memoryview(mapped).cast("Q")
+        try:
+            if table[0] != INDEX_MAGIC:
+                raise ValueError("Not a message index")
+            yield table
+        finally:
+            table.release()
+
+
+def _index_row(table, row: int) -> Dict[str, Any]:
+    base = 2 + 4 * row
+    entry = {
+        "row": row,
+        "mbox_offset": table[base],
+        "mbox_length": table[base + 1],
+        "csv_offset": table[base + 2],
+        "csv_length": table[base + 3],
+    }
+    threads = 2 + 6 * table[1]
+    if len(table) > threads:
+        entry["thread_id"] = f"{table[threads + 2 * row]:016x}"
+        entry["thread_depth"] = table[threads + 2 * row + 1]
+    return entry
+
+
+def _fill_thread(values: List[str], options: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    """Put the resolved thread from an index entry into re-converted row ``values``; blank while parsing."""
+    if options["build_threads"]:
+        at = _row_fields(options).index("thread_id")
+        values[at] = entry.get("thread_id", "")
+        values[at + 2] = str(entry.get("thread_depth", ""))
+
+
+def _index_lookup(table, message_id: str) -> List[int]:
+    """Rows whose Message-Id hashes like ``message_id``, by binary search."""
+    n = table[1]
+    base = 2 + 4 * n
+    key = _message_id_hash(message_id)
+    pos = bisect.bisect_left(range(n), key, key=lambda k: table[base + 2 * k])
+    rows = []
+    while pos < n and table[base + 2 * pos] == key:
+        rows.append(table[base + 2 * pos + 1])
+        pos += 1
+    return sorted(rows)
+
+
+# --- parallel deflate ---
+def _gf2_times(matrix: Tuple[int, ...], vec: int) -> int:
+    total = 0
+    n = 0
+    while vec:
+        if vec & 1:
+            total ^= matrix[n]
+        vec >>= 1
+        n += 1
+    return total
+
+
+def _gf2_compose(outer: Tuple[int, ...], inner: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(_gf2_times(outer, column) for column in inner)
+
+
+@functools.lru_cache(maxsize=16)
+def _crc32_shift(length: int) -> Tuple[int, ...]:
+    """GF(2) operator that advances a CRC-32 over ``length`` zero bytes, as in zlib's crc32_combine."""
+    op = tuple(1 << n for n in range(32))
+    zero_bits = (0xEDB88320,) + tuple(1 << n for n in range(31))
+    for _ in range(3):
+        zero_bits = _gf2_compose(zero_bits, zero_bits)
+    while length:
+        if length & 1:
+            op = _gf2_compose(zero_bits, op)
+        length >>= 1
+        if length:
+            zero_bits = _gf2_compose(zero_bits, zero_bits)
+    return op
+
+
+def _crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """CRC-32 of ``a + b`` from crc32(a), crc32(b) and len(b)."""
+    if not length2:
+        return crc1
+    return _gf2_times(_crc32_shift(length2), crc1) ^ crc2
+
+
+def _deflate_pool() -> ThreadPoolExecutor:
+    global _DEFLATE_POOL
+    if _DEFLATE_POOL is None:
+        _DEFLATE_POOL = ThreadPoolExecutor(max_workers=DEFLATE_THREADS)
+    return _DEFLATE_POOL
+
+
+def _deflate_block(data: bytes, window: bytes, level: int) -> Tuple[bytes, int]:
+    if window:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=window)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH), zlib.crc32(data)
+
+
+class _ParallelDeflateWriter(io.RawIOBase):
+    """Raw deflate stream built pigz-style from independently compressed blocks.
+
+    Each block is primed with the previous block's last 32 KiB and ends in a
+    sync flush, so the blocks concatenate into one stream; zlib drops the GIL
+    while compressing, so the pool scales across cores.
+    """
+
+    def __init__(self, dest, level: Optional[int], resume: Optional[Dict[str, int]] = None):
+        self._dest = dest
+        self._level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        self._pool = _deflate_pool()
+        self._pending: collections.deque = collections.deque()
+        self._buffer = bytearray()
+        # A resumed stream starts its first block without a dictionary.
+        self._window = b""
+        resume = resume or {}
+        self.crc = resume.get("crc", 0)
+        self.size = resume.get("size", 0)
+        self.compressed = resume.get("compressed", 0)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buffer += b
+        while len(self._buffer) >= DEFLATE_BLOCK:
+            self._submit(bytes(self._buffer[:DEFLATE_BLOCK]))
+            del self._buffer[:DEFLATE_BLOCK]
+        return len(b)
+
+    def checkpoint(self) -> Dict[str, int]:
+        """Deflate everything written so far, make it durable and return the state to resume from."""
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._emit()
+        self._dest.flush()
+        os.fsync(self._dest.fileno())
+        return {"crc": self.crc, "size": self.size, "compressed": self.compressed, "output": self._dest.tell()}
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._emit()
+            # An empty final block terminates the stream.
+            tail = zlib.compressobj(self._level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+            self._dest.write(tail)
+            self.compressed += len(tail)
+        finally:
+            for future, _length in self._pending:
+                future.cancel()
+            super().close()
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append((self._pool.submit(_deflate_block, block, self._window, self._level), len(block)))
+        self._window = block[-DEFLATE_WINDOW:]
+        while len(self._pending) > DEFLATE_THREADS * 2:
+            self._emit()
+
+    def _emit(self) -> None:
+        future, length = self._pending.popleft()
+        data, crc = future.result()
+        self._dest.write(data)
+        self.crc = _crc32_combine(self.crc, crc, length)
+        self.size += length
+        self.compressed += len(data)
+
+
+@contextmanager
+def _deflate_member(
+    fp, name: str, level: Optional[int], members: List[zipfile.ZipInfo], resume: Optional[Dict[str, int]] = None
+):
+    """Write one deflated ZIP member at the current position of the seekable ``fp``.
+
+    With ``resume`` (a writer checkpoint) the member's header is already at offset 0
+    and ``fp`` is positioned at the end of the checkpointed data.
+    """
+    zinfo = zipfile.ZipInfo(name, time.localtime()[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.extract_version = zipfile.ZIP64_VERSION
+    zinfo.CRC = zinfo.file_size = zinfo.compress_size = 0
+    if resume:
+        zinfo.header_offset = 0
+    else:
+        zinfo.header_offset = fp.tell()
+        fp.write(zinfo.FileHeader(zip64=True))
+    with _ParallelDeflateWriter(fp, level, resume) as writer:
+        yield writer
+    zinfo.CRC = writer.crc
+    zinfo.file_size = writer.size
+    zinfo.compress_size = writer.compressed
+    end = fp.tell()
+    fp.seek(zinfo.header_offset)
+    fp.write(zinfo.FileHeader(zip64=True))
+    fp.seek(end)
+    members.append(zinfo)
+
+
+def _write_zip_directory(fp, members: List[zipfile.ZipInfo]) -> None:
+    start = fp.tell()
+    for zinfo in members:
+        sizes = [zinfo.file_size, zinfo.compress_size, zinfo.header_offset]
+        # Fields that do not fit in 32 bits move to the zip64 extra, in this order.
+        wide = [value for value in sizes if value >= zipfile.ZIP64_LIMIT]
+        extra = struct.pack(f"<HH{len(wide)}Q", 1, 8 * len(wide), *wide) if wide else b""
+        file_size, compress_size, header_offset = (min(value, 0xFFFFFFFF) for value in sizes)
+        # Like the local header: non-ASCII names are UTF-8 with the language encoding flag.
+        name = zinfo.filename.encode("utf-8")
+        flag_bits = zinfo.flag_bits if zinfo.filename.isascii() else zinfo.flag_bits | 0x800
+        dosdate = (zinfo.date_time[0] - 1980) << 9 | zinfo.date_time[1] << 5 | zinfo.date_time[2]
+        dostime = zinfo.date_time[3] << 11 | zinfo.date_time[4] << 5 | zinfo.date_time[5] // 2
+        fp.write(
+            struct.pack(
+                zipfile.structCentralDir,
+                zipfile.stringCentralDir,
+                zinfo.create_version,
+                zinfo.create_system,
+                zinfo.extract_version,
+                zinfo.reserved,
+                flag_bits,
+                zinfo.compress_type,
+                dostime,
+                dosdate,
+                zinfo.CRC,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+                0,
+                0,
+                zinfo.internal_attr,
+                zinfo.external_attr,
+                header_offset,
+            )
+        )
+        fp.write(name)
+        fp.write(extra)
+    end = fp.tell()
+    count, size, offset = len(members), end - start, start
+    if offset >= zipfile.ZIP64_LIMIT or size >= zipfile.ZIP64_LIMIT:
+        fp.write(
+            struct.pack(
+                zipfile.structEndArchive64, zipfile.stringEndArchive64,
+                44, 45, 45, 0, 0, count, count, size, offset,
+            )
+        )
+        fp.write(struct.pack(zipfile.structEndArchive64Locator, zipfile.stringEndArchive64Locator, 0, end, 1))
+        size, offset = min(size, 0xFFFFFFFF), min(offset, 0xFFFFFFFF)
+    fp.write(struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0, count, count, size, offset, 0))
+
+
+class _QueuedWriter(io.RawIOBase):
+    """Write-only stream that hands blocks to a compression thread through a bounded queue."""
+
+    def __init__(self, dest):
+        self._dest = dest
+        self._queue: queue.Queue = queue.Queue(maxsize=OUTPUT_QUEUE_BLOCKS)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self._error:
+            raise self._error
+        self._queue.put(bytes(b))
+        return len(b)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._queue.put(None)
+            self._thread.join()
+            super().close()
+        if self._error:
+            raise self._error
+
+    def _drain(self) -> None:
+        # Keep consuming after a failure so the producer never blocks on a full queue.
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if self._error is None:
+                try:
+                    self._dest.write(block)
+                except BaseException as e:
+                    self._error = e
+
+
+def _write_columnar(src, dest: Path, output_format: str, fields: List[str]) -> None:
+    """Convert the CSV stream ``src`` (header row first) into a Parquet or Arrow IPC file, batch by batch."""
+    schema = pa.schema(
+        [(name, pa.dictionary(pa.int32(), pa.string()) if name in DICTIONARY_COLUMNS else pa.string()) for name in fields]
+    )
+    reader = pa_csv.open_csv(
+        src,
+        read_options=pa_csv.ReadOptions(block_size=COLUMNAR_BLOCK),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in fields}),
+    )
+    if output_format == "parquet":
+        writer = pa_parquet.ParquetWriter(str(dest), schema, compression="zstd")
+    else:
+        writer = pa_ipc.new_file(
+            str(dest), schema, options=pa_ipc.IpcWriteOptions(compression="zstd", emit_dictionary_deltas=True)
+        )
+    # The IPC file format cannot replace a dictionary, only extend it, so Arrow
+    # output keeps one growing dictionary per column. Parquet row groups each
+    # carry their own.
+    dictionaries = {name: pa.array([], pa.string()) for name in fields if name in DICTIONARY_COLUMNS}
+    with writer:
+        for batch in reader:
+            columns = []
+            for name, column in zip(fields, batch.columns):
+                if name not in dictionaries:
+                    pass
+                elif output_format == "parquet":
+                    column = column.dictionary_encode()
+                else:
+                    indices = pa_compute.index_in(column, value_set=dictionaries[name])
+                    if indices.null_count:
+                        new = pa_compute.unique(column.filter(pa_compute.is_null(indices)))
+                        dictionaries[name] = pa.concat_arrays([dictionaries[name], new])
+                        indices = pa_compute.index_in(column, value_set=dictionaries[name])
+                    column = pa.DictionaryArray.from_arrays(indices, dictionaries[name])
+                columns.append(column)
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+
+@contextmanager
+def _columnar_output(path: Path, options: Dict[str, Any], attachments: Optional[Path] = None):
+    """Yield a binary stream for emails.csv that a thread converts to Parquet / Arrow as it arrives.
+
+    With ``attachments`` the converted emails and attachments files are packed into a stored ZIP.
+    """
+    output_format = options["output_format"]
+    extension = COLUMNAR_FORMATS[output_format][0]
+    emails_path = path if attachments is None else UP / f"{path.name}.emails.{extension}"
+    read_fd, write_fd = os.pipe()
+    errors: List[BaseException] = []
+
+    def convert() -> None:
+        try:
+            with os.fdopen(read_fd, "rb") as src:
+                _write_columnar(src, emails_path, output_format, _header_fields(options))
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=convert, daemon=True)
+    thread.start()
+    try:
+        with os.fdopen(write_fd, "wb", buffering=0) as sink:
+            yield sink
+    finally:
+        thread.join()
+        if errors:
+            # Also replaces the BrokenPipeError the writer sees when conversion fails.
+            raise errors[0]
+    if attachments:
+        attachments_path = UP / f"{path.name}.attachments.{extension}"
+        try:
+            with attachments.open("rb") as src:
+                _write_columnar(src, attachments_path, output_format, ATTACHMENTS_FIELDS)
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                zf.write(emails_path, f"emails.{extension}")
+                zf.write(attachments_path, f"attachments.{extension}")
+        finally:
+            emails_path.unlink(missing_ok=True)
+            attachments_path.unlink(missing_ok=True)
+
+
+@contextmanager
+def _emails_output(
+    path: Path,
+    options: Dict[str, Any],
+    attachments: Optional[Path] = None,
+    resume: Optional[Dict[str, int]] = None,
+    extras: Optional[List[Tuple[str, Path]]] = None,
+):
+    """Yield a binary stream for emails.csv; ZIP outputs get ``attachments`` and ``extras`` added afterwards.
+
+    ``extras`` holds (member name, path) pairs and is only read once the stream
+    is closed, so the caller can fill it in after writing the rows.
+
+    Only deflate output can be checkpointed (the stream has a ``checkpoint`` method)
+    and resumed from one; ``resume`` is ignored for the other formats.
+    """
+    compression = options["compression"]
+    level = options["compression_level"]
+    if options["output_format"] != "csv":
+        with _columnar_output(path, options, attachments) as sink:
+            yield sink
+    elif compression == "deflate":
+        members: List[zipfile.ZipInfo] = []
+        with path.open("r+b" if resume else "wb") as fp:
+            if resume:
+                fp.truncate(resume["output"])
+                fp.seek(resume["output"])
+            with _deflate_member(fp, "emails.csv", level, members, resume) as sink:
+                yield sink
+            if attachments:
+                with _deflate_member(fp, "attachments.csv", level, members) as sink, attachments.open("rb") as src:
+                    shutil.copyfileobj(src, sink, DEFLATE_BLOCK)
+            for name, extra in extras or ():
+                with _deflate_member(fp, name, level, members) as sink, extra.open("rb") as src:
+                    shutil.copyfileobj(src, sink, DEFLATE_BLOCK)
+            _write_zip_directory(fp, members)
+    elif compression == "stored":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+            with zf.open("emails.csv", "w", force_zip64=True) as member, _QueuedWriter(member) as sink:
+                yield sink
+            if attachments:
+                zf.write(attachments, "attachments.csv")
+            for name, extra in extras or ():
+                zf.write(extra, name)
+    elif compression == "gzip":
+        level = 6 if level is None else level
+        with path.open("wb") as fp, gzip.GzipFile("emails.csv", "wb", level, fp) as gz, _QueuedWriter(gz) as sink:
+            yield sink
+    elif compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        with path.open("wb") as fp, compressor.stream_writer(fp) as zst, _QueuedWriter(zst) as sink:
+            yield sink
+    else:
+        raise ValueError(f"Unknown compression {compression!r}")
+
+
+def _sharded(size: int) -> bool:
+    """Whether an archive of ``size`` bytes is parsed in shards by the process pool."""
+    return PARSE_PROCESSES > 1 and size >= 2 * SHARD_MIN_BYTES
+
+
+def _parse_job(jid: str) -> None:
+    j = _load(jid)
+    # An upload reaped while it waited for a worker is already marked failed.
+    if not j or j["status"] == "error":
+        return
+    # A streaming job stays "uploading" until its last chunk is verified.
+    growing = _GROWING.get(jid) if j["status"] == "uploading" else None
+    if not growing:
+        j["status"] = "processing"
+    src = Path(j["in_path"])
+    options = _normalize_options(j.get("options"))
+    out_path = OUT / f"{jid}-{_output_file(options)[0]}"
+    attachments_spool = UP / f"{jid}.attachments.csv"
+    include_attachments = options["include_attachments"]
+    index_path = OUT / f"{jid}-index.bin" if options["include_index"] else None
+    index = None
+    labels_spool = UP / f"{jid}.labels"
+    labels = None
+    rows_spool = UP / f"{jid}.rows.csv"
+    threads = None
+    extras: List[Tuple[str, Path]] = []
+    keep_source = False
+    _LIVE_INDEXES.pop(jid, None)
+    resume = j.get("checkpoint")
+    if resume and not (
+        not index_path
+        and not options["split_labels"]
+        and not options["build_threads"]
+        and not options["dedupe"]
+        and options["output_format"] == "csv"
+        and options["compression"] == "deflate"
+        and out_path.exists()
+        and (not include_attachments or attachments_spool.exists())
+    ):
+        resume = None
+    start = resume["source"] if resume else 0
+    j["processed"] = resume["rows"] if resume else 0
+    j["filtered"] = resume.get("filtered", 0) if resume else 0
+    j["duplicates"] = 0
+    j["total_messages"] = j.get("total_messages", 0)
+    _update_job(
+        jid,
+        status=j["status"],
+        processed=j["processed"],
+        total_messages=j["total_messages"],
+        filtered=j["filtered"],
+        duplicates=0,
+    )
+    try:
+        source_size = j["size"] if growing else src.stat().st_size
+        bounds = [start, source_size]
+        if not growing and _sharded(source_size - start):
+            count = min(PARSE_PROCESSES * 4, (source_size - start) // SHARD_MIN_BYTES)
+            bounds = _mbox_shard_bounds(src, source_size, count, start)
+        # zipfile allows one open member at a time, so attachments are spooled.
+        with _emails_output(
+            out_path, options, attachments_spool if include_attachments else None, resume, extras
+        ) as emails_fp:
+            with io.TextIOWrapper(
+                io.BufferedWriter(emails_fp, OUTPUT_BLOCK), encoding="utf-8", newline=""
+            ) as emails_txt:
+                attachments_txt = None
+                rows_txt = None
+                parse_options = options
+                if resume:
+                    if include_attachments:
+                        with attachments_spool.open("r+b") as spool:
+                            spool.truncate(resume["attachments"])
+                        attachments_txt = attachments_spool.open("a", encoding="utf-8", newline="")
+                else:
+                    header = _CountingText(emails_txt)
+                    csv.writer(header).writerow(_header_fields(options))
+                    csv_start = header.take()
+                    index = _RowIndex(csv_start) if index_path else None
+                    if index is not None:
+                        _LIVE_INDEXES[jid] = (index, growing or src, options)
+                    if options["split_labels"]:
+                        shutil.rmtree(labels_spool, ignore_errors=True)
+                        labels = _LabelSplitter(labels_spool, options)
+                    if include_attachments:
+                        attachments_txt = attachments_spool.open("w", encoding="utf-8", newline="")
+                        csv.writer(attachments_txt).writerow(ATTACHMENTS_FIELDS)
+                    if options["build_threads"]:
+                        # Threads are only known at the end: rows are spooled whole and
+                        # written out (projected and split by label) once resolved.
+                        threads = _Threads(options)
+                        rows_txt = rows_spool.open("w+", encoding="utf-8", newline="")
+                        parse_options = {
+                            **options,
+                            "columns": None,
+                            "include_labels": options["include_labels"] or options["split_labels"],
+                            "split_labels": False,
+                        }
+
+                def save_checkpoint(source: int, rows: int) -> None:
+                    emails_txt.flush()
+                    state = emails_fp.checkpoint()
+                    if attachments_txt:
+                        attachments_txt.flush()
+                        os.fsync(attachments_txt.fileno())
+                        state["attachments"] = attachments_txt.buffer.tell()
+                    state.update(source=source, rows=rows, filtered=j["filtered"])
+                    _update_job(jid, checkpoint=state)
+
+                # The index, label spools, threads and fingerprints are not checkpointed,
+                # so those jobs restart from scratch.
+                checkpoint = (
+                    save_checkpoint
+                    if hasattr(emails_fp, "checkpoint")
+                    and not (index_path or labels or threads or options["dedupe"])
+                    else None
+                )
+                try:
+                    rows_out = rows_txt or emails_txt
+                    row_labels = None if threads else labels
+                    if len(bounds) > 2:
+                        processed = _parse_sharded(
+                            j, src, bounds, parse_options, rows_out, attachments_txt, j["processed"], checkpoint,
+                            index, row_labels, threads,
+                        )
+                    else:
+                        processed = _parse_serial(
+                            j, growing or src, source_size, parse_options, rows_out, attachments_txt,
+                            start, j["processed"], checkpoint, index, row_labels, threads,
+                        )
+                    if threads:
+                        threads.resolve()
+                        rows_txt.seek(0)
+                        _write_threaded(rows_txt, emails_txt, options, threads, index, labels, csv_start)
+                finally:
+                    if attachments_txt:
+                        attachments_txt.close()
+                    if labels:
+                        labels.close()
+                    if rows_txt:
+                        rows_txt.close()
+            if index is not None:
+                index.write(index_path, source_size, threads)
+                extras.append(("index.bin", index_path))
+            if labels:
+                members = labels.members()
+                extras.extend(zip(_label_member_names([label for label, _path in members]), (p for _l, p in members)))
+        # Indexed jobs keep their source for /result lookups.
+        keep_source = bool(index_path)
+        key = _result_key(j)
+        # Cached before the job reports done, so a re-upload right after finds it.
+        # A cached copy of an indexed job would have no source to look messages up in.
+        if key and not index_path:
+            try:
+                _cache_result(key, out_path, processed)
+            except Exception:
+                pass
+        _update_job(
+            jid,
+            status="done",
+            processed=processed,
+            total_messages=processed,
+            filtered=j["filtered"],
+            duplicates=j["duplicates"],
+            out_path=str(out_path),
+            checkpoint=None,
+            finished=time.time(),
+        )
+    except Exception as e:
+        if growing:
+            growing.abort(str(e))
+        _update_job(jid, status="error", error=str(e))
+    finally:
+        _LIVE_INDEXES.pop(jid, None)
+        if growing:
+            _GROWING.pop(jid, None)
+            # The upload is renamed to .mbox once its last chunk is verified.
+            src = growing.path
+        for path in (attachments_spool,) if keep_source else (src, attachments_spool, index_path):
+            if path is None:
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            except Exception:
+                pass
+        shutil.rmtree(labels_spool, ignore_errors=True)
+        rows_spool.unlink(missing_ok=True)
+
+
+# --- scheduler ---
+class _Scheduler:
+    """Parse queue with a fixed worker count, fair between clients.
+
+    A free worker takes a job from the client with the fewest jobs running, so
+    one client's backlog cannot hold every worker while others wait. Among
+    those it picks the smallest archive first, but every second spent waiting
+    counts as SCHEDULER_AGING bytes off a job's size, so large archives are not
+    starved.
+    """
+
+    def __init__(self, workers: int):
+        self._cond = threading.Condition()
+        # job id -> (size, queued or started at, client)
+        self._queued: Dict[str, Tuple[int, float, str]] = {}
+        self._running: Dict[str, Tuple[int, float, str]] = {}
+        self._workers = workers
+        self._threads: List[threading.Thread] = []
+        self._rate = float(SCHEDULER_DEFAULT_RATE)
+
+    def queued_bytes(self) -> int:
+        with self._cond:
+            return sum(size for size, _queued_at, _client in self._queued.values())
+
+    def submit(self, jid: str, size: int, client: str = "") -> None:
+        with self._cond:
+            self._queued[jid] = (size, time.monotonic(), client)
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify()
+
+    def cancel(self, jid: str) -> bool:
+        """Withdraw a job that has not started; return False once a worker has it."""
+        with self._cond:
+            return self._queued.pop(jid, None) is not None
+
+    def _priority(self, jid: str, now: float) -> float:
+        size, queued_at, _client = self._queued[jid]
+        return size - (now - queued_at) * SCHEDULER_AGING
+
+    def _next(self, jobs, running: Dict[str, int], now: float) -> str:
+        # Caller holds self._cond. ``running`` counts jobs in progress by client.
+        return min(jobs, key=lambda jid: (running.get(self._queued[jid][2], 0), self._priority(jid, now)))
+
+    def estimate(self, jid: str) -> Optional[Tuple[int, float]]:
+        """Return ``(queue position, seconds until start)`` for a queued job."""
+        with self._cond:
+            if jid not in self._queued:
+                return None
+            now = time.monotonic()
+            # Replays the queue: (time the worker is free, tie-breaker, client of the job it runs).
+            free = [
+                (max(0.0, size / self._rate - (now - started)), n, client)
+                for n, (size, started, client) in enumerate(self._running.values())
+            ]
+            free += [(0.0, len(free) + n, None) for n in range(max(0, self._workers - len(free)))]
+            heapq.heapify(free)
+            running = collections.Counter(client for _free_at, _n, client in free if client is not None)
+            waiting = dict.fromkeys(self._queued)
+            for position in range(1, len(waiting) + 1):
+                start, n, client = heapq.heappop(free)
+                if client is not None:
+                    running[client] -= 1
+                other = self._next(waiting, running, now)
+                if other == jid:
+                    return position, start
+                del waiting[other]
+                size, _queued_at, client = self._queued[other]
+                running[client] += 1
+                heapq.heappush(free, (start + size / self._rate, n, client))
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queued:
+                    self._cond.wait()
+                now = time.monotonic()
+                running = collections.Counter(client for _size, _started, client in self._running.values())
+                jid = self._next(self._queued, running, now)
+                size, _queued_at, client = self._queued.pop(jid)
+                self._running[jid] = (size, now, client)
+            try:
+                _parse_job(jid)
+            except Exception:
+                pass
+            finally:
+                with self._cond:
+                    size, started, _client = self._running.pop(jid)
+                    elapsed = time.monotonic() - started
+                    if size >= 1024 * 1024 and elapsed > 0:
+                        self._rate = 0.8 * self._rate + 0.2 * size / elapsed
+
+
+def _client_key(request: Request) -> str:
+    # uvicorn puts the X-Forwarded-For address here for a trusted proxy.
+    return request.client.host if request.client else ""
+
+
+SCHEDULER = _Scheduler(PARSE_WORKERS)
+# Streaming parses mostly wait for chunks, so they get their own workers rather than parse workers.
+STREAMS = _Scheduler(STREAM_WORKERS)
+
+
+def _admission_error(size: int) -> Optional[str]:
+    if SCHEDULER.queued_bytes() + STREAMS.queued_bytes() + size > MAX_QUEUED_BYTES:
+        return "The parse queue is full, please try again later"
+    if shutil.disk_usage(UP).free < size + MIN_FREE_BYTES:
+        return "Not enough disk space for this upload, please try again later"
+    return None
+
+
+def _recover_jobs() -> None:
+    """Re-queue jobs that were queued or parsing when the process stopped; they resume from their checkpoint."""
+    with _JOB_DB_LOCK:
+        rows = _job_db().execute("SELECT id FROM jobs WHERE status IN ('queued', 'processing')").fetchall()
+    for (jid,) in rows:
+        j = _load(jid)
+        if not j:
+            continue
+        if Path(j["in_path"]).exists():
+            _update_job(jid, status="queued")
+            SCHEDULER.submit(jid, j["size"], j.get("client", ""))
+        else:
+            _update_job(jid, status="error", error="The uploaded archive was lost in a restart; please upload it again")
+
+
+def _reap_outputs() -> None:
+    """Expire finished jobs and cached results after DOWNLOAD_TTL_SECONDS.
+
+    Then delete finished jobs oldest first until outputs fit OUTPUT_BUDGET_BYTES.
+    """
+    now = time.time()
+    _expire_results()
+    with _JOB_DB_LOCK:
+        rows = _job_db().execute(
+            "SELECT id, updated FROM jobs WHERE status IN ('done', 'downloaded', 'error') ORDER BY updated"
+        ).fetchall()
+    finished = []
+    for jid, updated in rows:
+        j = _load(jid)
+        if not j:
+            continue
+        out_path = j.get("out_path")
+        if now - j.get("finished", updated) >= DOWNLOAD_TTL_SECONDS:
+            _cleanup_job(jid, out_path)
+            continue
+        try:
+            size = Path(out_path).stat().st_size if out_path else 0
+        except OSError:
+            size = 0
+        finished.append((j.get("finished", updated), jid, out_path, size))
+    total = sum(item[3] for item in finished)
+    for _finished, jid, out_path, size in sorted(finished):
+        if total <= OUTPUT_BUDGET_BYTES:
+            break
+        _cleanup_job(jid, out_path)
+        total -= size
+    # Outputs whose job record is gone, e.g. left by a crash during cleanup.
+    for path in OUT.iterdir():
+        try:
+            if path.is_file() and now - path.stat().st_mtime >= DOWNLOAD_TTL_SECONDS and not _load(path.name.split("-", 1)[0]):
+                path.unlink()
+        except Exception:
+            pass
+
+
+def _reap_uploads() -> None:
+    """Drop uploads that received no chunk for UPLOAD_IDLE_SECONDS, freeing their preallocated files."""
+    cutoff = time.time() - UPLOAD_IDLE_SECONDS
+    with _JOB_DB_LOCK:
+        rows = _job_db().execute(
+            "SELECT id FROM jobs WHERE status = 'uploading' AND updated < ?", (cutoff,)
+        ).fetchall()
+    error = "The upload was abandoned; please upload the file again"
+    for (jid,) in rows:
+        j = _update_job(jid, status="error", error=error)
+        if not j:
+            continue
+        STREAMS.cancel(jid)
+        growing = _GROWING.pop(jid, None)
+        if growing:
+            growing.abort(error)
+        _UPLOAD_HASHES.pop(jid, None)
+        _JOB_LOCKS.pop(jid, None)
+        _CHUNK_LOCKS.pop(jid, None)
+        try:
+            Path(j["in_path"]).unlink(missing_ok=True)
+        except Exception:
+            pass
+
+
+def _reaper() -> None:
+    while True:
+        try:
+            _reap_uploads()
+            _reap_outputs()
+        except Exception:
+            pass
+        time.sleep(REAPER_INTERVAL)
+
+
+@app.on_event("startup")
+def _startup() -> None:
+    # Here rather than at import, which the parse pool's workers also do.
+    _import_json_jobs()
+    threading.Thread(target=_job_flusher, daemon=True).start()
+    atexit.register(_flush_jobs)
+    _recover_jobs()
+    threading.Thread(target=_reaper, daemon=True).start()
+
+
+@app.get("/", response_class=HTMLResponse)
+def home():
+    return HTML
+
+
+@app.head("/")
+def head_ok():
+    return Response(status_code=200)
+
+
+@app.get("/how-to", response_class=HTMLResponse)
+def how_to():
+    return read_page("how-to.html")
+
+
+@app.head("/how-to")
+def how_to_head():
+    return Response(status_code=200)
+
+
+@app.get("/faq", response_class=HTMLResponse)
+def faq():
+    return read_page("faq.html")
+
+
+@app.head("/faq")
+def faq_head():
+    return Response(status_code=200)
+
+
+@app.get("/privacy", response_class=HTMLResponse)
+def privacy():
+    return read_page("privacy.html")
+
+
+@app.head("/privacy")
+def privacy_head():
+    return Response(status_code=200)
+
+
+@app.get("/terms", response_class=HTMLResponse)
+def terms():
+    return read_page("terms.html")
+
+
+@app.head("/terms")
+def terms_head():
+    return Response(status_code=200)
+
+
+@app.get("/contact", response_class=HTMLResponse)
+def contact():
+    return read_page("contact.html")
+
+
+@app.head("/contact")
+def contact_head():
+    return Response(status_code=200)
+
+
+@app.get("/support", response_class=HTMLResponse)
+def support():
+    return read_page("support.html")
+
+
+@app.head("/support")
+def support_head():
+    return Response(status_code=200)
+
+
+@app.get("/robots.txt")
+def robots():
+    txt = (PAGES / "robots.txt").read_text(encoding="utf-8")
+    return Response(
+        txt,
+        media_type="text/plain; charset=utf-8",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 @app.head("/robots.txt")
@@ -1191,14 +3929,72 @@ def ads_head():
 
 
 @app.post("/upload/init")
-async def upload_init(payload: UploadInit):
+async def upload_init(payload: UploadInit, request: Request):
     if payload.size <= 0:
         raise HTTPException(400, "File is empty")
     if payload.size > MAX_BYTES:
         raise HTTPException(413, "File too large (max 20 GB)")
+    if payload.compression not in OUTPUT_FORMATS:
+        raise HTTPException(400, f"Unknown compression (use {', '.join(OUTPUT_FORMATS)})")
+    if payload.compression == "zstd" and zstandard is None:
+        raise HTTPException(400, "zstd output is not available on this server")
+    levels = OUTPUT_FORMATS[payload.compression][2]
+    if payload.compression_level is not None and payload.compression_level not in levels:
+        raise HTTPException(400, f"Invalid compression level for {payload.compression}")
+    if payload.output_format != "csv" and payload.output_format not in COLUMNAR_FORMATS:
+        raise HTTPException(400, f"Unknown output format (use csv, {', '.join(COLUMNAR_FORMATS)})")
+    if payload.output_format != "csv" and pa is None:
+        raise HTTPException(400, "Parquet and Arrow output are not available on this server")
+    if (
+        payload.include_attachments
+        and payload.output_format == "csv"
+        and not OUTPUT_FORMATS[payload.compression][0].endswith(".zip")
+    ):
+        raise HTTPException(400, "The attachments manifest needs a ZIP output")
+    if payload.split_labels and (
+        payload.output_format != "csv" or not OUTPUT_FORMATS[payload.compression][0].endswith(".zip")
+    ):
+        raise HTTPException(400, "Per-label files need a CSV output in a ZIP")
+    if payload.include_index and (
+        payload.output_format != "csv" or not OUTPUT_FORMATS[payload.compression][0].endswith(".zip")
+    ):
+        raise HTTPException(400, "The message index needs a CSV output in a ZIP")
+    if payload.columns is not None:
+        unknown = [name for name in payload.columns if name not in ALL_COLUMNS]
+        if not payload.columns or unknown or len(set(payload.columns)) != len(payload.columns):
+            raise HTTPException(400, f"columns must be distinct names from: {', '.join(ALL_COLUMNS)}")
+    options = {
+        "include_body": payload.include_body,
+        "include_thread_id": payload.include_thread_id,
+        "include_labels": payload.include_labels,
+        "split_labels": payload.split_labels,
+        "build_threads": payload.build_threads,
+        "dedupe": payload.dedupe,
+        "include_attachments": payload.include_attachments,
+        "include_index": payload.include_index,
+        "compression": payload.compression,
+        "compression_level": payload.compression_level,
+        "output_format": payload.output_format,
+        "columns": payload.columns,
+        "filter": payload.filter.model_dump() if payload.filter else None,
+    }
+    message_filter = _normalize_options(options)["filter"]
+    if message_filter:
+        try:
+            _compile_filter(message_filter)
+        except ValueError as e:
+            raise HTTPException(400, f"Invalid filter: {e}")
     jid = uuid.uuid4().hex
+    busy = _admission_error(payload.size)
+    if busy:
+        raise HTTPException(503, busy, headers={"Retry-After": "300"})
     dst = UP / f"{jid}.upload"
-    dst.write_bytes(b"")
+    try:
+        await run_in_threadpool(_preallocate, dst, payload.size)
+    except OSError:
+        dst.unlink(missing_ok=True)
+        raise HTTPException(507, "Not enough disk space for this upload")
+    expected_chunks = max(1, math.ceil(payload.size / CHUNK))
     job = {
         "id": jid,
         "status": "uploading",
@@ -1206,18 +4002,29 @@ async def upload_init(payload: UploadInit):
         "filename": payload.filename,
         "in_path": str(dst),
         "received": 0,
-        "next_index": 0,
-        "expected_chunks": max(1, math.ceil(payload.size / CHUNK)),
+        "expected_chunks": expected_chunks,
+        # Received-chunk bitmap, bit i of byte i // 8 for chunk i, base64 encoded.
+        "chunks": base64.b64encode(bytes((expected_chunks + 7) // 8)).decode("ascii"),
+        # Verified per-chunk digests, kept so the tree hash check needs no re-read.
+        "chunk_digests": base64.b64encode(bytes(32 * expected_chunks)).decode("ascii") if payload.tree_sha256 else "",
         "sha256": payload.sha256,
+        "tree_sha256": payload.tree_sha256,
+        # The scheduler shares workers fairly between clients.
+        "client": _client_key(request),
         "total_messages": 0,
-        "options": {
-            "include_body": payload.include_body,
-            "include_thread_id": payload.include_thread_id,
-            "include_attachments": payload.include_attachments,
-        },
+        "options": options,
     }
     _save(job)
-    return JSONResponse({"job_id": jid, "chunk_size": CHUNK})
+    key = _result_key(job)
+    # Sharding a finished upload beats tailing it with one parser, so even an explicit
+    # request to stream is declined for such archives; "streaming" tells the client.
+    stream = payload.parse_while_uploading is not False and not _sharded(payload.size)
+    if stream and key and await run_in_threadpool(_cached_result, key):
+        stream = False
+    if stream:
+        _GROWING[jid] = _GrowingUpload(dst, payload.size)
+        STREAMS.submit(jid, payload.size, job["client"])
+    return JSONResponse({"job_id": jid, "chunk_size": CHUNK, "streaming": stream})
 
 
 @app.post("/upload/chunk")
@@ -1225,7 +4032,7 @@ async def upload_chunk(
     job_id: str = Form(...),
     index: int = Form(...),
     total: int = Form(...),
-    final: bool = Form(False),
+    final: bool = Form(False),  # accepted from older clients; the bitmap decides completion
     chunk_hash: str = Form(...),
     chunk: UploadFile = File(...),
 ):
@@ -1234,43 +4041,98 @@ async def upload_chunk(
         raise HTTPException(404, "Unknown job")
     if job.get("status") not in {"uploading", "queued"}:
         raise HTTPException(409, "Job no longer accepts chunks")
-    expected_index = job.get("next_index", 0)
-    if index != expected_index:
-        raise HTTPException(409, f"Unexpected chunk index {index}, expected {expected_index}")
-    data = await chunk.read()
-    if not data:
-        raise HTTPException(400, "Empty chunk")
-    digest = hashlib.sha256(data).hexdigest()
-    if digest != chunk_hash:
-        raise HTTPException(400, "Checksum mismatch")
-    received = job.get("received", 0) + len(data)
-    if received > job.get("size", MAX_BYTES):
-        raise HTTPException(400, "Received more data than declared")
-    with open(job["in_path"], "ab") as dest:
-        dest.write(data)
-    job["received"] = received
-    job["next_index"] = index + 1
-    job["expected_chunks"] = total
-    _save(job)
-    if final:
-        if received != job.get("size"):
-            raise HTTPException(400, "Size mismatch on finalize")
+    expected_chunks = job["expected_chunks"]
+    if total != expected_chunks:
+        raise HTTPException(400, f"Expected {expected_chunks} chunks of {CHUNK} bytes")
+    if not 0 <= index < expected_chunks:
+        raise HTTPException(400, f"Chunk index {index} out of range")
+    # Requests for one index take turns, and only the first that verifies writes it for good:
+    # a corrupt copy written after the bit is set would slip past the whole-file checks,
+    # which hash the verified buffers rather than re-read the file.
+    async with _CHUNK_LOCKS[job_id][index]:
+        job = _load(job_id)
+        if not job or job.get("status") not in {"uploading", "queued"}:
+            raise HTTPException(409, "Job no longer accepts chunks")
+        if _bitmap_test(base64.b64decode(job["chunks"]), index):
+            # Retry of a chunk that already landed, e.g. after a lost response.
+            return JSONResponse({"status": "partial" if job["status"] == "uploading" else job["status"], "received": job["received"]})
+        length = _chunk_length(job, index)
+        offset = index * CHUNK
+        running = None
         if job.get("sha256"):
-            file_hash = _sha256_file(Path(job["in_path"]))
-            if file_hash != job["sha256"]:
+            hasher, hashed = _UPLOAD_HASHES.setdefault(job_id, (hashlib.sha256(), 0))
+            if hashed == offset:
+                running = hasher.copy()
+        # Positional write before verification: a rejected chunk is overwritten by its retry.
+        written, digest = await run_in_threadpool(_ingest_chunk, chunk.file, job["in_path"], offset, length, running)
+        if written != length:
+            raise HTTPException(400, f"Chunk {index} must be {length} bytes")
+        if digest != chunk_hash:
+            raise HTTPException(400, "Checksum mismatch")
+        async with _JOB_LOCKS[job_id]:
+            job = _load(job_id)
+            if not job or job.get("status") != "uploading":
+                raise HTTPException(409, "Job no longer accepts chunks")
+            bitmap = bytearray(base64.b64decode(job["chunks"]))
+            if not _bitmap_test(bitmap, index):
+                bitmap[index >> 3] |= 1 << (index & 7)
+                job["chunks"] = base64.b64encode(bitmap).decode("ascii")
+                job["received"] += length
+                if job.get("tree_sha256"):
+                    digests = bytearray(base64.b64decode(job["chunk_digests"]))
+                    digests[32 * index:32 * index + 32] = bytes.fromhex(digest)
+                    job["chunk_digests"] = base64.b64encode(digests).decode("ascii")
+                _update_job(
+                    job_id, chunks=job["chunks"], received=job["received"], chunk_digests=job.get("chunk_digests", "")
+                )
+            growing = _GROWING.get(job_id)
+            if growing and job["received"] >= job["size"] and STREAMS.cancel(job_id):
+                # Its streaming parse never got a worker; queue it like any finished upload.
+                _GROWING.pop(job_id, None)
+                growing = None
+            if growing:
+                growing.advance(_contiguous_bytes(job, bitmap))
+            if job.get("sha256"):
+                hasher, hashed = _UPLOAD_HASHES.get(job_id, (hashlib.sha256(), 0))
+                if running is not None and hashed == offset:
+                    hasher, hashed = running, offset + length
+                if hashed < job["size"] and _bitmap_test(bitmap, hashed // CHUNK):
+                    hasher, hashed = await run_in_threadpool(_advance_upload_hash, job, hasher, hashed)
+                _UPLOAD_HASHES[job_id] = (hasher, hashed)
+            if job["received"] < job["size"]:
+                return JSONResponse({"status": "partial", "received": job["received"]})
+            # Every chunk has landed exactly once, so the bitmap is full and the running hash complete.
+            mismatch = False
+            if job.get("tree_sha256"):
+                tree_hash = hashlib.sha256(base64.b64decode(job["chunk_digests"])).hexdigest()
+                mismatch = tree_hash != job["tree_sha256"]
+            if job.get("sha256") and _UPLOAD_HASHES[job_id][0].hexdigest() != job["sha256"]:
+                mismatch = True
+            if mismatch:
+                if growing:
+                    # The parser must not finalize output for an upload that failed verification.
+                    growing.abort("Final checksum mismatch")
                 raise HTTPException(400, "Final checksum mismatch")
-        final_path = Path(job["in_path"]).with_suffix(".mbox")
-        Path(job["in_path"]).rename(final_path)
-        job["in_path"] = str(final_path)
-        job["status"] = "queued"
-        _save(job)
-        POOL.submit(_parse_job, job_id)
-        return JSONResponse({"status": "queued"})
-    return JSONResponse({"status": "partial", "received": received})
+            final_path = Path(job["in_path"]).with_suffix(".mbox")
+            Path(job["in_path"]).rename(final_path)
+            _JOB_LOCKS.pop(job_id, None)
+            _CHUNK_LOCKS.pop(job_id, None)
+            _UPLOAD_HASHES.pop(job_id, None)
+            if growing:
+                growing.path = final_path
+                _update_job(job_id, in_path=str(final_path), status="processing")
+                growing.advance(job["size"], final=True)
+                return JSONResponse({"status": "processing"})
+            job = _update_job(job_id, in_path=str(final_path), status="queued")
+    # Only now, with the bytes checked against its sha256, may the upload get a cached result.
+    if await run_in_threadpool(_finish_from_cache, job):
+        return JSONResponse({"status": "done"})
+    SCHEDULER.submit(job_id, job["size"], job.get("client", ""))
+    return JSONResponse({"status": "queued"})
 
 
 @app.post("/upload")
-async def legacy_upload(file: UploadFile = File(...)):
+async def legacy_upload(request: Request, file: UploadFile = File(...)):
     """Legacy single-request upload kept for compatibility."""
     jid = uuid.uuid4().hex
     dst = UP / f"{jid}.mbox"
@@ -1291,6 +4153,7 @@ async def legacy_upload(file: UploadFile = File(...)):
         "size": total,
         "filename": file.filename or "upload.mbox",
         "in_path": str(dst),
+        "client": _client_key(request),
         "total_messages": 0,
         "options": {
             "include_body": True,
@@ -1299,34 +4162,306 @@ async def legacy_upload(file: UploadFile = File(...)):
         },
     }
     _save(job)
-    POOL.submit(_parse_job, jid)
+    SCHEDULER.submit(jid, total, job["client"])
     return JSONResponse({"job_id": jid})
 
 
+def _status_payload(j: Dict) -> Dict[str, Any]:
+    payload = {
+        "status": j["status"],
+        "processed": j.get("processed"),
+        "received": j.get("received"),
+        "size": j.get("size"),
+        "total_messages": j.get("total_messages"),
+        "filtered": j.get("filtered", 0),
+        "duplicates": j.get("duplicates", 0),
+        "error": j.get("error"),
+    }
+    queue = {"queued": SCHEDULER, "uploading": STREAMS}.get(j["status"])
+    estimate = queue.estimate(j["id"]) if queue else None
+    if estimate:
+        payload["queue_position"] = estimate[0]
+        payload["estimated_start"] = round(time.time() + estimate[1])
+    return payload
+
+
 @app.get("/status/{jid}")
 def status(jid: str):
     j = _load(jid)
     if not j:
         return JSONResponse({"status": "unknown"}, status_code=404)
-    return JSONResponse(
-        {
-            "status": j["status"],
-            "processed": j.get("processed"),
-            "received": j.get("received"),
-            "size": j.get("size"),
-            "total_messages": j.get("total_messages"),
-            "error": j.get("error"),
-        }
+    return JSONResponse(_status_payload(j))
+
+
+async def _status_events(jid: str):
+    event = _JOB_EVENTS.subscribe(jid)
+    last = None
+    rates: Dict[str, float] = {}
+    # Rates are measured from the first payload this stream saw, never from zero:
+    # a client that connects late must not be told the whole upload took 0 s.
+    seen: Dict[str, Tuple[int, float]] = {}
+    try:
+        while True:
+            event.clear()
+            j = _load(jid)
+            if not j:
+                yield 'data: {"status": "unknown"}\n\n'
+                return
+            payload = _status_payload(j)
+            now = time.monotonic()
+            for key in ("received", "processed"):
+                value = payload[key] or 0
+                if key not in seen:
+                    seen[key] = (value, now)
+                    continue
+                before, then = seen[key]
+                if value != before and now - then >= STATUS_STREAM_INTERVAL:
+                    # Smoothed so the client's ETA does not jump on every batch.
+                    rate = max(0, value - before) / (now - then)
+                    rates[key] = 0.7 * rates[key] + 0.3 * rate if key in rates else rate
+                    seen[key] = (value, now)
+            if "received" in rates and (payload["received"] or 0) < (payload["size"] or 0):
+                payload["bytes_per_second"] = round(rates["received"])
+            if "processed" in rates:
+                payload["messages_per_second"] = round(rates["processed"], 1)
+            if payload != last:
+                yield f"data: {json.dumps(payload)}\n\n"
+                last = payload
+            if j["status"] in ("done", "error", "downloaded"):
+                return
+            try:
+                await asyncio.wait_for(event.wait(), STATUS_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            # Throttle: changes that land while we sleep go out as one event.
+            await asyncio.sleep(STATUS_STREAM_INTERVAL)
+    finally:
+        _JOB_EVENTS.unsubscribe(jid, event)
+
+
+@app.get("/status/{jid}/stream")
+async def status_stream(jid: str):
+    if not _load(jid):
+        return JSONResponse({"status": "unknown"}, status_code=404)
+    return StreamingResponse(
+        _status_events(jid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range ``Range`` header into ``(start, end)`` (inclusive).
+
+    Returns None for headers we answer with the whole file (other units, several
+    ranges, garbage) and raises 416 for a range that lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep or not (first or last):
+            return None
+        if first:
+            start, end = int(first), size - 1
+            if last:
+                if int(last) < start:
+                    return None
+                end = min(int(last), end)
+        else:
+            suffix = int(last)
+            # "bytes=-0" selects nothing and is unsatisfiable.
+            start, end = max(0, size - suffix) if suffix else size, size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(416, "Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _file_body(path: Path, start: int, length: int):
+    with path.open("rb") as fp:
+        fp.seek(start)
+        while length > 0:
+            data = fp.read(min(OUTPUT_BLOCK, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+@app.api_route("/download/{jid}", methods=["GET", "HEAD"])
+def download(jid: str, request: Request):
+    """Serve a finished job's output; can be retried and resumed with ``Range`` until the job expires."""
+    j = _load(jid)
+    if not j or j.get("status") not in ("done", "downloaded") or "out_path" not in j:
+        raise HTTPException(404, "Not ready")
+    path = Path(j["out_path"])
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        raise HTTPException(404, "Not ready")
+    filename, media_type = _output_file(_normalize_options(j.get("options")))
+    # The output never changes once written, so size and mtime identify it.
+    etag = f'"{jid}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+    last_modified = email_utils.formatdate(st.st_mtime, usegmt=True)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    start, end, status_code = 0, st.st_size - 1, 200
+    if_range = request.headers.get("if-range")
+    if "range" in request.headers and (if_range is None or if_range.strip() in (etag, last_modified)):
+        byte_range = _byte_range(request.headers["range"], st.st_size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        _file_body(path, start, end - start + 1), status_code=status_code, headers=headers, media_type=media_type
     )
 
 
-@app.get("/download/{jid}")
-def download(jid: str, background_tasks: BackgroundTasks):
+def _indexed_job(jid: str) -> Tuple[Dict, Path]:
     j = _load(jid)
-    if not j or j.get("status") != "done" or "out_path" not in j:
+    if not j or j.get("status") not in ("done", "downloaded"):
         raise HTTPException(404, "Not ready")
-    j["status"] = "downloaded"
-    _save(j)
-    background_tasks.add_task(_cleanup_job, jid, j["out_path"])
-    return FileResponse(j["out_path"], filename="emails.zip", media_type="application/zip")
+    index_path = OUT / f"{jid}-index.bin"
+    if not _normalize_options(j.get("options"))["include_index"] or not index_path.exists():
+        raise HTTPException(404, "This job has no message index")
+    return j, index_path
+
+
+def _index_entry(jid: str, row: int) -> Tuple[Dict, Dict[str, int]]:
+    j, index_path = _indexed_job(jid)
+    with _open_index(index_path) as table:
+        if not 0 <= row < table[1]:
+            raise HTTPException(404, "Row out of range")
+        return j, _index_row(table, row)
+
+
+def _read_span(path: str, offset: int, length: int) -> bytes:
+    with open(path, "rb") as fp:
+        return os.pread(fp.fileno(), length, offset)
+
+
+@app.get("/result/{jid}/row/{row}")
+def result_row(jid: str, row: int):
+    """One row of emails.csv, re-read from the source mbox through the index."""
+    j, entry = _index_entry(jid, row)
+    raw = _read_span(j["in_path"], entry["mbox_offset"], entry["mbox_length"])
+    options = _normalize_options(j.get("options"))
+    fields, _attachment_rows = _convert_message(_mbox_message(raw, 0, len(raw)), options)
+    _fill_thread(fields, options, entry)
+    entry["fields"] = dict(zip(_header_fields(options), _project_row(fields, options)))
+    return entry
+
+
+@app.get("/result/{jid}/row/{row}/raw")
+def result_row_raw(jid: str, row: int):
+    j, entry = _index_entry(jid, row)
+    raw = _read_span(j["in_path"], entry["mbox_offset"], entry["mbox_length"])
+    return Response(raw, media_type="application/mbox")
+
+
+class _ResultRows:
+    """Rows of an indexed job, re-converted from its source mbox one message at a time."""
+
+    def __init__(self, count: int, complete: bool, bounds, source, options: Dict[str, Any], table=None):
+        self.count = count
+        self.complete = complete
+        self._bounds = bounds
+        self._source = source
+        self._options = options
+        self._table = table
+
+    def fields(self, row: int) -> Dict[str, Any]:
+        start, end = self._bounds(row)
+        path = Path(getattr(self._source, "path", self._source))
+        try:
+            raw = _read_span(str(path), start, end - start)
+        except FileNotFoundError:
+            # A streaming upload is renamed to .mbox when its last chunk lands,
+            # possibly before its _GrowingUpload learns the new path.
+            raw = _read_span(str(path.with_suffix(".mbox")), start, end - start)
+        values, _attachment_rows = _convert_message(_mbox_message(raw, 0, len(raw)), self._options)
+        _fill_thread(values, self._options, _index_row(self._table, row) if self._table is not None else {})
+        return {"row": row, **dict(zip(_header_fields(self._options), _project_row(values, self._options)))}
+
+    def lookup(self, message_id: str) -> List[int]:
+        return _index_lookup(self._table, message_id) if self._table is not None else []
+
+
+@contextmanager
+def _result_rows(jid: str):
+    live = _LIVE_INDEXES.get(jid)
+    if live:
+        index, source, options = live
+        offsets, lengths = index.mbox, index.mbox_len
+        yield _ResultRows(
+            index.complete_rows, False, lambda row: (offsets[row], offsets[row] + lengths[row]), source, options
+        )
+        return
+    j, index_path = _indexed_job(jid)
+    with _open_index(index_path) as table:
+        yield _ResultRows(
+            table[1],
+            True,
+            lambda row: (table[2 + 4 * row], table[2 + 4 * row] + table[3 + 4 * row]),
+            Path(j["in_path"]),
+            _normalize_options(j.get("options")),
+            table,
+        )
+
+
+@app.get("/result/{jid}/rows")
+def result_rows(jid: str, offset: int = 0, limit: int = PREVIEW_PAGE_ROWS):
+    """A page of rows; works while the job is still parsing (``complete`` is false then)."""
+    offset = max(0, offset)
+    limit = max(0, min(limit, PREVIEW_MAX_ROWS))
+    with _result_rows(jid) as rows:
+        page = [rows.fields(row) for row in range(offset, min(offset + limit, rows.count))]
+        return {"offset": offset, "total": rows.count, "complete": rows.complete, "rows": page}
+
+
+@app.get("/result/{jid}/search")
+def result_search(jid: str, q: str, offset: int = 0, limit: int = PREVIEW_PAGE_ROWS):
+    """Rows containing ``q`` in any field, case-insensitively.
+
+    An exact Message-Id is found through the index. Otherwise each request scans
+    at most SEARCH_SCAN_ROWS rows from ``offset``; continue from ``next``.
+    """
+    if not q.strip():
+        raise HTTPException(400, "Empty search")
+    offset = max(0, offset)
+    limit = max(1, min(limit, PREVIEW_MAX_ROWS))
+    with _result_rows(jid) as rows:
+        found = rows.lookup(q) if offset == 0 else []
+        if found:
+            return {"q": q, "rows": [rows.fields(row) for row in found[:limit]], "next": None}
+        needle = q.casefold()
+        matches = []
+        row = offset
+        stop = min(rows.count, offset + SEARCH_SCAN_ROWS)
+        while row < stop and len(matches) < limit:
+            fields = rows.fields(row)
+            if any(needle in str(value).casefold() for key, value in fields.items() if key != "row"):
+                matches.append(fields)
+            row += 1
+        more = row < rows.count or not rows.complete
+        return {"q": q, "rows": matches, "next": row if more else None}
+
+
+@app.get("/result/{jid}/lookup")
+def result_lookup(jid: str, message_id: str):
+    _j, index_path = _indexed_job(jid)
+    with _open_index(index_path) as table:
+        return {"message_id": message_id, "rows": _index_lookup(table, message_id)}
 
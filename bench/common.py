@@ -0,0 +1,29 @@
+"""Shared setup for the benchmarks: import ``app/main.py`` with throwaway storage roots."""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_ROOT = Path(tempfile.mkdtemp(prefix="mbox-csv-bench-"))
+os.environ.setdefault("DATA_DIR", str(_ROOT / "data"))
+os.environ.setdefault("DOWNLOADS_DIR", str(_ROOT / "downloads"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+import main  # noqa: E402
+
+
+def load_messages(path: str):
+    """Messages of an mbox as ``_parse_job`` sees them."""
+    return [main._normalize_newlines(data) for _offset, data in main._iter_mbox_messages(Path(path))]
+
+
+def timed(label: str, fn, count: int, size: int = 0) -> float:
+    """Run ``fn`` once (after a warm-up run) and print its per-message rate, and MB/s for ``size`` bytes."""
+    fn()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    line = f"{label:<34} {elapsed * 1e6 / count:10.1f} us/msg {count / elapsed:10,.0f} msg/s"
+    print(line + (f" {size / 1e6 / elapsed:8.1f} MB/s" if size else ""))
+    return elapsed
@@ -0,0 +1,61 @@
+"""Header extraction: ``_header_value`` on a parsed message vs. the raw header block fast path.
+
+    python bench/headers.py [archive.mbox]
+
+Without an archive, 5,000 messages with plain ASCII headers are generated.
+"""
+import io
+import sys
+
+from email import policy
+from email.parser import BytesParser
+
+from common import load_messages, main, timed
+
+CSV_HEADERS = ["Date", "From", "To", "Cc", "Bcc", "Subject", "Message-Id", "X-GM-THRID"]
+
+
+def generate(count: int = 5000):
+    messages = []
+    for i in range(count):
+        messages.append(
+            (
+                f"Date: Mon, {1 + i % 28} Jan 2024 {i % 24:02d}:{i % 60:02d}:00 +0000\n"
+                f"From: Sender {i % 97} <sender{i % 97}@example.com>\n"
+                f"To: team{i % 13}@example.org, Someone Else <else{i % 7}@example.net>\n"
+                f"Cc: cc{i % 5}@example.com\n"
+                f"Subject: Weekly status report number {i}\n"
+                f"Message-ID: <msg{i}.{i * 7919 % 10007}@example.com>\n"
+                f"X-GM-THRID: {1600000000000000000 + i // 4}\n"
+                "MIME-Version: 1.0\n"
+                "Content-Type: text/plain; charset=utf-8\n"
+                "\n"
+                f"Short body {i}.\n"
+            ).encode()
+        )
+    return messages
+
+
+def run():
+    messages = load_messages(sys.argv[1]) if len(sys.argv) > 1 else generate()
+    print(f"{len(messages):,} messages, headers: {', '.join(CSV_HEADERS)}")
+    names = [name.lower() for name in CSV_HEADERS]
+    for label, header_policy in (("policy.default", policy.default), ("compat32", policy.compat32)):
+        parser = BytesParser(policy=header_policy)
+
+        def parsed():
+            for data in messages:
+                message = parser.parse(io.BytesIO(data), headersonly=True)
+                [main._header_value(message, name) for name in CSV_HEADERS]
+
+        def fast():
+            for data in messages:
+                fields = main._first_headers(main._split_headers(data)[0])
+                [main._fields_value(fields, name, header_policy) for name in names]
+
+        timed(f"{label}: _header_value", parsed, len(messages))
+        timed(f"{label}: raw header block", fast, len(messages))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,106 @@
+"""HTML bodies: ``_html_text`` against an ``html.parser`` stripper, and conversion with HTML-only bodies.
+
+    python bench/html_bodies.py [archive.mbox]
+
+Without an archive, 3,000 HTML newsletter messages are generated.
+"""
+import base64
+import io
+import quopri
+import random
+import sys
+from html.parser import HTMLParser
+
+from email import policy
+from email.parser import BytesParser
+
+from common import load_messages, main, timed
+
+WORDS = "the quick brown fox jumps over lazy dog newsletter offer price update account security café naïve".split()
+
+
+def generate(count: int = 3000):
+    rng = random.Random(7)
+
+    def paragraph():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+
+    def document():
+        style = "".join(f".c{i}{{color:#{i:06x};padding:{i}px}}" for i in range(rng.randint(20, 200)))
+        body = []
+        for _ in range(rng.randint(5, 40)):
+            r = rng.random()
+            if r < 0.3:
+                body.append(f'<table width="100%"><tr><td style="font-family:Arial">{paragraph()}</td><td>&nbsp;</td></tr></table>')
+            elif r < 0.6:
+                body.append(f'<p>{paragraph()} &amp; more &#8212; <a href="https://example.com/{rng.random()}">link</a></p>')
+            elif r < 0.7:
+                body.append(f"<script>var x = {rng.random()}; if (x < 1) {{ track(); }}</script>")
+            else:
+                body.append(f'<div><span style="color:red">{paragraph()}</span><br/><img src="cid:{rng.random()}"></div>')
+        return f"<!DOCTYPE html><html><head><title>News</title><style>{style}</style></head><body>{''.join(body)}</body></html>"
+
+    messages = []
+    for i in range(count):
+        markup = document().encode()
+        if i % 5 < 2:
+            part = "Content-Type: text/html; charset=utf-8\nContent-Transfer-Encoding: quoted-printable\n\n"
+            part += quopri.encodestring(markup).decode()
+        else:
+            part = (
+                f'Content-Type: multipart/related; boundary="b{i}"\n\n--b{i}\n'
+                "Content-Type: text/html; charset=utf-8\nContent-Transfer-Encoding: base64\n\n"
+                f"{base64.encodebytes(markup).decode()}\n--b{i}\n"
+                "Content-Type: image/png\nContent-Transfer-Encoding: base64\n\niVBORw0KGgo=\n"
+                f"--b{i}--\n"
+            )
+        messages.append(
+            f"From: news{i}@shop.example\nTo: me@example.com\nSubject: Offer {i}\n"
+            f"Message-ID: <h{i}@shop.example>\nMIME-Version: 1.0\n{part}".encode()
+        )
+    return messages
+
+
+class _Stripper(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.text = []
+        self.hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.hidden += tag in ("script", "style")
+
+    def handle_endtag(self, tag):
+        self.hidden -= tag in ("script", "style")
+
+    def handle_data(self, data):
+        if not self.hidden:
+            self.text.append(data)
+
+
+def run():
+    messages = load_messages(sys.argv[1]) if len(sys.argv) > 1 else generate()
+    parser = BytesParser(policy=policy.default)
+    documents = []
+    for data in messages:
+        for part in parser.parse(io.BytesIO(data)).walk():
+            if part.get_content_type() == "text/html":
+                documents.append(part.get_content())
+                break
+    size = sum(len(document) for document in documents)
+    print(f"{len(messages):,} messages, {len(documents):,} HTML parts, {size / 1e6:.1f} MB of HTML")
+
+    def stripper():
+        for document in documents:
+            strip = _Stripper()
+            strip.feed(document)
+            strip.close()
+
+    timed("_html_text", lambda: [main._html_text(document) for document in documents], len(documents), size)
+    timed("html.parser stripper", stripper, len(documents), size)
+    options = main._normalize_options({})
+    timed("conversion with bodies", lambda: [main._convert_message(data, options) for data in messages], len(messages))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,86 @@
+"""Body and attachment extraction: a full ``policy.default`` parse vs. the MIME walker.
+
+    python bench/mime.py [archive.mbox]
+
+Without an archive, 40 messages with 1-3 MB base64 PDF attachments are generated.
+"""
+import base64
+import io
+import random
+import sys
+
+from email import policy
+from email.parser import BytesParser
+
+from common import load_messages, main, timed
+
+
+def generate(count: int = 40):
+    rng = random.Random(4)
+    messages = []
+    for i in range(count):
+        pdf = base64.encodebytes(rng.randbytes(rng.randrange(1, 3) * 1024 * 1024)).decode()
+        messages.append(
+            (
+                f"From: sender{i}@example.com\n"
+                f"Subject: Invoice {i}\n"
+                f"Message-ID: <inv{i}@example.com>\n"
+                "MIME-Version: 1.0\n"
+                'Content-Type: multipart/mixed; boundary="MIX"\n'
+                "\n"
+                "--MIX\n"
+                "Content-Type: text/plain; charset=utf-8\n"
+                "\n"
+                f"Please find invoice {i} attached.\n"
+                "--MIX\n"
+                f'Content-Type: application/pdf; name="invoice{i}.pdf"\n'
+                f'Content-Disposition: attachment; filename="invoice{i}.pdf"\n'
+                "Content-Transfer-Encoding: base64\n"
+                "\n"
+                f"{pdf}"
+                "--MIX--\n"
+            ).encode()
+        )
+    return messages
+
+
+def run():
+    messages = load_messages(sys.argv[1]) if len(sys.argv) > 1 else generate()
+    size = sum(len(data) for data in messages)
+    print(f"{len(messages):,} messages, {size / 1e6:.0f} MB")
+    parser = BytesParser(policy=policy.default)
+
+    def full_body():
+        for data in messages:
+            main._extract_body_text(parser.parse(io.BytesIO(data)))
+
+    def full_attachments():
+        for data in messages:
+            message = parser.parse(io.BytesIO(data))
+            main._extract_body_text(message)
+            list(main._iter_attachment_rows(message, ""))
+
+    def walker(include_attachments):
+        def walk():
+            for data in messages:
+                try:
+                    main._fast_message_parts(data, True, include_attachments, "")
+                except main._MimeFallback:
+                    full = parser.parse(io.BytesIO(data))
+                    main._extract_body_text(full)
+                    if include_attachments:
+                        list(main._iter_attachment_rows(full, ""))
+
+        return walk
+
+    for label, fn in (
+        ("body: full parse", full_body),
+        ("body: walker", walker(False)),
+        ("body + attachments: full parse", full_attachments),
+        ("body + attachments: walker", walker(True)),
+    ):
+        timed(label, fn, len(messages), size)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+# main creates its storage directories on import, so point them somewhere writable first.
+_ROOT = Path(tempfile.mkdtemp(prefix="mbox-csv-tests-"))
+os.environ.setdefault("DATA_DIR", str(_ROOT / "data"))
+os.environ.setdefault("DOWNLOADS_DIR", str(_ROOT / "downloads"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def convert():
+    """Run ``_parse_job`` on an mbox given as bytes; return the finished job record."""
+    def run(mbox: bytes, **options):
+        jid = main.uuid.uuid4().hex
+        path = main.UP / f"{jid}.mbox"
+        path.write_bytes(mbox)
+        main._save({
+            "id": jid,
+            "status": "queued",
+            "size": len(mbox),
+            "filename": "test.mbox",
+            "in_path": str(path),
+            "total_messages": 0,
+            "options": options,
+        })
+        main._parse_job(jid)
+        job = main._load(jid)
+        assert job["status"] == "done", job.get("error")
+        return job
+
+    return run
+
+
+@pytest.fixture(autouse=True)
+def _release_streams():
+    """Fail streaming parses a test left waiting for chunks, so they free their workers."""
+    yield
+    for upload in list(main._GROWING.values()):
+        upload.abort("The test has finished")
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def upload(client):
+    """Upload bytes through /upload/init and /upload/chunk; return (job id, last response)."""
+    def send(data: bytes, **init):
+        response = client.post("/upload/init", json={"filename": "test.mbox", "size": len(data), **init})
+        assert response.status_code == 200, response.text
+        jid, chunk_size = response.json()["job_id"], response.json()["chunk_size"]
+        total = -(-len(data) // chunk_size)
+        for index in range(total):
+            piece = data[index * chunk_size:(index + 1) * chunk_size]
+            response = client.post(
+                "/upload/chunk",
+                data={"job_id": jid, "index": index, "total": total, "chunk_hash": main.hashlib.sha256(piece).hexdigest()},
+                files={"chunk": ("blob", piece)},
+            )
+            assert response.status_code == 200, response.text
+        return jid, response.json()
+
+    return send
+
+
+@pytest.fixture
+def wait(client):
+    """Poll /status until the job is done or failed."""
+    def poll(jid: str, timeout: float = 60):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            status = client.get(f"/status/{jid}").json()
+            if status["status"] in ("done", "error"):
+                return status
+            time.sleep(0.05)
+        raise AssertionError(f"job {jid} still {status['status']}")
+
+    return poll
@@ -0,0 +1,57 @@
+"""The result cache answers verified re-uploads only, and forgets results with the other outputs."""
+import hashlib
+
+import main
+
+
+def _archive(tag: str) -> bytes:
+    return "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i}@example.com\nSubject: {tag} {i}\n\nbody {i}\n\n"
+        for i in range(50)
+    ).encode()
+
+
+def test_reupload_is_served_after_verification(client, upload, wait):
+    data = _archive("cache")
+    digest = hashlib.sha256(data).hexdigest()
+    first, _response = upload(data, sha256=digest)
+    assert wait(first)["status"] == "done"
+
+    init = client.post("/upload/init", json={"filename": "x", "size": len(data), "sha256": digest}).json()
+    assert "status" not in init and init["streaming"] is False
+    assert client.get(f"/status/{init['job_id']}").json()["status"] == "uploading"
+    assert client.get(f"/download/{init['job_id']}").status_code != 200
+
+    second, response = upload(data, sha256=digest)
+    assert response["status"] == "done"
+    assert main._load(second).get("cached")
+    assert client.get(f"/download/{second}").content == client.get(f"/download/{first}").content
+
+
+def test_claimed_hash_without_the_bytes(client, upload, wait):
+    data = _archive("claimed")
+    digest = hashlib.sha256(data).hexdigest()
+    wait(upload(data, sha256=digest)[0])
+    forged = _archive("forged")[:len(data)].ljust(len(data), b"\n")
+    init = client.post("/upload/init", json={"filename": "x", "size": len(data), "sha256": digest}).json()
+    response = client.post(
+        "/upload/chunk",
+        data={"job_id": init["job_id"], "index": 0, "total": 1, "chunk_hash": hashlib.sha256(forged).hexdigest()},
+        files={"chunk": ("blob", forged)},
+    )
+    assert response.status_code == 400
+    assert client.get(f"/download/{init['job_id']}").status_code != 200
+
+
+def test_results_expire(upload, wait, monkeypatch):
+    data = _archive("expire")
+    digest = hashlib.sha256(data).hexdigest()
+    wait(upload(data, sha256=digest)[0])
+    assert any(main.RESULTS.iterdir())
+    monkeypatch.setattr(main, "DOWNLOAD_TTL_SECONDS", 0)
+    main._expire_results()
+    assert not any(main.RESULTS.iterdir())
+    monkeypatch.undo()
+    jid, response = upload(data, sha256=digest)
+    assert response["status"] != "done"
+    assert wait(jid)["status"] == "done" and not main._load(jid).get("cached")
@@ -0,0 +1,55 @@
+"""A deflate job interrupted after a checkpoint resumes to the same output as an uninterrupted run."""
+import shutil
+import zipfile
+
+import pytest
+
+import main
+
+
+class _Crash(BaseException):
+    pass
+
+
+def _archive(count: int = 800) -> bytes:
+    return "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i % 13}@example.com\nSubject: Checkpoint {i}\n"
+        f"Message-ID: <c{i}@example.com>\n\n{'body text ' * (i % 40)}\n\n"
+        for i in range(count)
+    ).encode()
+
+
+@pytest.mark.parametrize("crash_after", [1, 3])
+def test_resume_from_checkpoint(convert, monkeypatch, tmp_path, crash_after):
+    mbox = _archive()
+    expected = zipfile.ZipFile(convert(mbox)["out_path"]).read("emails.csv")
+
+    monkeypatch.setattr(main, "CHECKPOINT_SECONDS", 0)
+    update_job = main._update_job
+    saved = []
+
+    def crash_on_checkpoint(jid, **fields):
+        update_job(jid, **fields)
+        if fields.get("checkpoint"):
+            saved.append(fields["checkpoint"])
+            if len(saved) == crash_after:
+                raise _Crash()
+
+    jid = main.uuid.uuid4().hex
+    source = main.UP / f"{jid}.mbox"
+    source.write_bytes(mbox)
+    (tmp_path / "source.mbox").write_bytes(mbox)
+    main._save({"id": jid, "status": "queued", "size": len(mbox), "filename": "t.mbox",
+                "in_path": str(source), "total_messages": 0, "options": {}})
+    monkeypatch.setattr(main, "_update_job", crash_on_checkpoint)
+    with pytest.raises(_Crash):
+        main._parse_job(jid)
+    monkeypatch.setattr(main, "_update_job", update_job)
+    # A real crash leaves the upload in place; the cleanup in _parse_job's finally removed it.
+    shutil.copy(tmp_path / "source.mbox", source)
+
+    assert main._load(jid)["checkpoint"]["rows"] == saved[-1]["rows"]
+    main._parse_job(jid)
+    job = main._load(jid)
+    assert job["status"] == "done" and job["processed"] == 800
+    assert zipfile.ZipFile(job["out_path"]).read("emails.csv") == expected
@@ -0,0 +1,102 @@
+"""Parquet and Arrow outputs hold the same columns and values as the CSV output."""
+import csv
+import io
+import zipfile
+
+import pytest
+
+import main
+
+pa = pytest.importorskip("pyarrow")
+from pyarrow import ipc, parquet  # noqa: E402
+
+
+def _archive(count: int = 50) -> bytes:
+    messages = []
+    for i in range(count):
+        attachment = (
+            "Content-Type: multipart/mixed; boundary=b\n\n--b\nContent-Type: text/plain\n\n"
+            f"Body {i}, with a comma\n--b\nContent-Type: application/pdf\n"
+            f'Content-Disposition: attachment; filename="f{i}.pdf"\nContent-Transfer-Encoding: base64\n\nAAAA\n--b--\n'
+            if i % 4 == 0
+            else f"\nBody {i}\nsecond line\n"
+        )
+        messages.append(
+            "From sender@example.com Mon Jan  1 00:00:00 2024\n"
+            f"From: Sender {i % 3} <s{i % 3}@example.com>\n"
+            f"To: r{i % 5}@example.com\n"
+            f"Subject: Message {i}\n"
+            f"Message-ID: <m{i}@example.com>\n"
+            + attachment
+            + "\n"
+        )
+    return "".join(messages).encode()
+
+
+def _csv(data: bytes):
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8"), newline="")))
+    return rows[0], rows[1:]
+
+
+def _table(data: bytes, output_format: str):
+    source = pa.BufferReader(data)
+    if output_format == "parquet":
+        return parquet.read_table(source)
+    return ipc.open_file(source).read_all()
+
+
+def _columns(table):
+    return table.column_names, [[str(value) for value in row.values()] for row in table.to_pylist()]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"include_body": False}, {"columns": ["subject", "from", "body"]}, {"include_attachments": True}],
+)
+def test_matches_csv(convert, output_format, options):
+    mbox = _archive()
+    with zipfile.ZipFile(convert(mbox, **options)["out_path"]) as zf:
+        expected = {name: _csv(zf.read(name)) for name in zf.namelist()}
+    job = convert(mbox, output_format=output_format, **options)
+    if options.get("include_attachments"):
+        with zipfile.ZipFile(job["out_path"]) as zf:
+            assert zf.namelist() == [f"emails.{output_format}", f"attachments.{output_format}"]
+            tables = {
+                f"{name}.csv": _table(zf.read(f"{name}.{output_format}"), output_format)
+                for name in ("emails", "attachments")
+            }
+    else:
+        with open(job["out_path"], "rb") as fp:
+            tables = {"emails.csv": _table(fp.read(), output_format)}
+    assert tables.keys() == expected.keys()
+    for name, table in tables.items():
+        header, rows = _columns(table)
+        assert (header, rows) == expected[name], name
+    if "columns" in options:
+        assert tables["emails.csv"].column_names == options["columns"]
+    assert pa.types.is_dictionary(tables["emails.csv"].schema.field("from").type)
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+@pytest.mark.parametrize("case", ["empty", "filtered"])
+def test_no_rows(convert, output_format, case):
+    if case == "empty":
+        job = convert(b"", output_format=output_format)
+    else:
+        job = convert(_archive(), output_format=output_format, filter={"subject": "nothing like this"})
+        assert job["filtered"] == 50
+    with open(job["out_path"], "rb") as fp:
+        table = _table(fp.read(), output_format)
+    assert table.num_rows == 0
+    assert table.column_names == main._header_fields(main._normalize_options({}))
+
+
+def test_requires_pyarrow(client, monkeypatch):
+    init = {"filename": "x.mbox", "size": 10, "output_format": "parquet", "parse_while_uploading": False}
+    monkeypatch.setattr(main, "pa", None)
+    response = client.post("/upload/init", json=init)
+    assert response.status_code == 400 and "not available" in response.json()["detail"]
+    monkeypatch.undo()
+    assert client.post("/upload/init", json={**init, "output_format": "feather"}).status_code == 400
+    assert client.post("/upload/init", json=init).status_code == 200
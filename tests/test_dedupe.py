@@ -0,0 +1,73 @@
+"""dedupe keeps the first copy of each message that passes the filter, serially and across shards."""
+import csv
+import io
+import zipfile
+
+import pytest
+
+import main
+
+
+def _archive(count: int = 300) -> bytes:
+    messages = []
+    for i in range(count):
+        subject = "keep" if i % 2 else "drop"
+        if i % 3 == 0:
+            # Copies by Message-Id spread over the whole archive. Subjects alternate, so the
+            # first copy the filter keeps is not the first copy in the archive.
+            header, body = f"Message-ID: <m{i % 45}@example.com>\n", f"Body {i}"
+        elif i % 3 == 1:
+            # No Message-Id: identical headers and body make a copy.
+            header, body, subject = "", f"Same body {i % 10}", "keep"
+            i %= 10
+        else:
+            header, body = f"Message-ID: <u{i}@example.com>\n", f"Body {i}"
+        messages.append(
+            "From sender@example.com Mon Jan  1 00:00:00 2024\n"
+            "Date: Mon, 1 Jan 2024 00:00:00 +0000\n"
+            f"From: sender{i % 7}@example.com\n"
+            f"Subject: {subject} {i}\n"
+            f"{header}\n{body}\n\n"
+        )
+    return "".join(messages).encode()
+
+
+def _rows(job):
+    with zipfile.ZipFile(job["out_path"]) as zf:
+        return list(csv.reader(io.StringIO(zf.read("emails.csv").decode("utf-8"), newline="")))
+
+
+def _expected(reference, subject_glob=None):
+    header, rows = reference[0], reference[1:]
+    subject, message_id = header.index("subject"), header.index("message_id")
+    seen, kept, duplicates = set(), [], 0
+    for row in rows:
+        if subject_glob and not main._subject_matcher(subject_glob)(row[subject]):
+            continue
+        key = row[message_id] or tuple(row)
+        if key in seen:
+            duplicates += 1
+        else:
+            seen.add(key)
+            kept.append(row)
+    return [header] + kept, duplicates
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+@pytest.mark.parametrize("subject", [None, "keep*"])
+def test_dedupe(convert, monkeypatch, sharded, subject):
+    mbox = _archive()
+    message_filter = {"subject": subject} if subject else None
+    expected, duplicates = _expected(_rows(convert(mbox)), subject)
+    assert duplicates > 0
+    if sharded:
+        monkeypatch.setattr(main, "SHARD_MIN_BYTES", len(mbox) // 6)
+        monkeypatch.setattr(main, "PARSE_PROCESSES", 3)
+    job = convert(mbox, dedupe=True, filter=message_filter)
+    assert _rows(job) == expected
+    assert job["duplicates"] == duplicates
+    assert job["processed"] == len(expected) - 1
+    if subject:
+        reference = _rows(convert(mbox))
+        at = reference[0].index("subject")
+        assert job["filtered"] == sum(1 for row in reference[1:] if not row[at].startswith("keep"))
@@ -0,0 +1,100 @@
+"""Downloads answer Range, If-Range and HEAD, and outputs expire by age and by total size."""
+import pytest
+
+import main
+
+
+def _archive(tag: str, count: int = 60) -> bytes:
+    return "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i}@example.com\nSubject: {tag} {i}\n\nbody {tag} {i}\n\n"
+        for i in range(count)
+    ).encode()
+
+
+@pytest.fixture
+def finished(upload, wait):
+    def make(tag: str = "download"):
+        jid, _response = upload(_archive(tag))
+        assert wait(jid)["status"] == "done"
+        return jid
+
+    return make
+
+
+def test_whole_file_and_ranges(client, finished):
+    jid = finished()
+    whole = client.get(f"/download/{jid}")
+    assert whole.status_code == 200
+    assert whole.headers["accept-ranges"] == "bytes" and whole.headers["etag"]
+    body, size = whole.content, len(whole.content)
+    assert int(whole.headers["content-length"]) == size
+
+    for spec, start, end in [
+        ("bytes=10-19", 10, 19),
+        ("bytes=10-", 10, size - 1),
+        ("bytes=-5", size - 5, size - 1),
+        ("bytes=-100000000", 0, size - 1),
+        (f"bytes=5-{size + 100}", 5, size - 1),
+    ]:
+        response = client.get(f"/download/{jid}", headers={"Range": spec})
+        assert response.status_code == 206, spec
+        assert response.headers["content-range"] == f"bytes {start}-{end}/{size}"
+        assert response.content == body[start:end + 1]
+
+    # Ranges we do not serve partially get the whole file.
+    for spec in ("bytes=0-1,5-6", "items=0-5", "bytes=9-3", "bytes=x-"):
+        response = client.get(f"/download/{jid}", headers={"Range": spec})
+        assert response.status_code == 200 and response.content == body, spec
+
+
+def test_unsatisfiable_range(client, finished):
+    jid = finished()
+    size = len(client.get(f"/download/{jid}").content)
+    for spec in (f"bytes={size}-", "bytes=-0"):
+        response = client.get(f"/download/{jid}", headers={"Range": spec})
+        assert response.status_code == 416, spec
+        assert response.headers["content-range"] == f"bytes */{size}"
+
+
+def test_if_range(client, finished):
+    jid = finished()
+    whole = client.get(f"/download/{jid}")
+    for validator in (whole.headers["etag"], whole.headers["last-modified"]):
+        response = client.get(f"/download/{jid}", headers={"Range": "bytes=0-9", "If-Range": validator})
+        assert response.status_code == 206 and response.content == whole.content[:10]
+    stale = client.get(f"/download/{jid}", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == whole.content
+
+
+def test_head(client, finished):
+    jid = finished()
+    whole = client.get(f"/download/{jid}")
+    head = client.head(f"/download/{jid}")
+    assert head.status_code == 200 and head.content == b""
+    assert head.headers["content-length"] == str(len(whole.content))
+    assert head.headers["etag"] == whole.headers["etag"]
+    partial = client.head(f"/download/{jid}", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.headers["content-length"] == "10"
+
+
+def test_outputs_expire_after_ttl(client, finished, monkeypatch):
+    jid = finished("ttl")
+    path = main._load(jid)["out_path"]
+    main._reap_outputs()
+    assert client.get(f"/download/{jid}").status_code == 200
+    monkeypatch.setattr(main, "DOWNLOAD_TTL_SECONDS", 0)
+    main._reap_outputs()
+    assert client.get(f"/download/{jid}").status_code == 404
+    assert not main.Path(path).exists() and main._load(jid) is None
+
+
+def test_budget_evicts_oldest_past_failed_jobs(client, finished, monkeypatch):
+    # A failed job has no output; as the oldest record it must not stop the budget pass.
+    main._save({"id": "failed-before-budget", "status": "error", "error": "Upload abandoned"})
+    older, newer = finished("budget-old"), finished("budget-new")
+    paths = {jid: main.Path(main._load(jid)["out_path"]) for jid in (older, newer)}
+    monkeypatch.setattr(main, "OUTPUT_BUDGET_BYTES", paths[newer].stat().st_size)
+    main._reap_outputs()
+    assert main._load("failed-before-budget") is None
+    assert not paths[older].exists() and main._load(older) is None
+    assert client.get(f"/download/{newer}").status_code == 200
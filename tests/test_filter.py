@@ -0,0 +1,50 @@
+"""Message filters decide on headers alone."""
+import csv
+import io
+import json
+import time
+import zipfile
+
+import pytest
+
+import main
+
+
+def _accept(spec, headers: bytes) -> bool:
+    fields = main._first_headers(main._split_headers(headers)[0])
+    return main._compile_filter(json.dumps(spec, sort_keys=True))(fields)
+
+
+@pytest.mark.parametrize(
+    "pattern, subject, matches",
+    [
+        ("invoice", "Your INVOICE #12", True),
+        ("invoice", "Receipt", False),
+        ("*invoice*", "Re: invoice", True),
+        ("invoice*", "Re: invoice", False),
+        ("re: [0-9]*", "RE: 2024 plan", True),
+        ("caf?", "=?utf-8?q?Caf=C3=A9?=", True),
+        ("(?i)re:", "Re: x", False),
+    ],
+)
+def test_subject_glob(pattern, subject, matches):
+    assert _accept({"subject": pattern}, f"Subject: {subject}\n\n".encode()) is matches
+
+
+def test_subject_glob_does_not_backtrack():
+    subject = "ab " * 100000
+    start = time.perf_counter()
+    assert not _accept({"subject": "*a*b*a*b*a*b*z"}, f"Subject: {subject}\n\n".encode())
+    assert time.perf_counter() - start < 1
+
+
+def test_filtered_job(convert):
+    mbox = "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i}@{'example.com' if i % 2 else 'other.org'}\n"
+        f"Subject: {'Invoice' if i % 3 == 0 else 'Note'} {i}\nDate: Mon, {1 + i} Jan 2024 00:00:00 +0000\n\nbody\n\n"
+        for i in range(20)
+    ).encode()
+    job = convert(mbox, filter={"subject": "invoice", "senders": ["example.com"], "date_from": "2024-01-05"})
+    rows = list(csv.DictReader(io.StringIO(zipfile.ZipFile(job["out_path"]).read("emails.csv").decode(), newline="")))
+    assert [row["subject"] for row in rows] == ["Invoice 9", "Invoice 15"]
+    assert job["filtered"] == 18
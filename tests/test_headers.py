@@ -0,0 +1,58 @@
+"""The raw header fast path must render exactly what ``_header_value`` does on a parsed message."""
+import io
+import random
+
+import pytest
+from email import policy
+from email.parser import BytesParser
+
+import main
+
+CSV_HEADERS = ["Date", "From", "To", "Cc", "Bcc", "Subject", "Message-Id", "X-GM-THRID"]
+NAMES = CSV_HEADERS + ["date", "CC", "message-id", "X-Gmail-Labels", "X-Other", "Content-Type", ":", "Bad Name", "From "]
+ATOMS = [
+    "bob", "a.b", "x@y.z", "<a@b.c>", "Bob Smith", '"Q, R"', "=?utf-8?q?caf=C3=A9?=", "=?iso-8859-1?b?Y2Fm6Q==?=",
+    "caf\xc3\xa9", "\xff\xfe", "(c)", "  ", "\t", ",", ";", ":", "<>", "undisclosed-recipients:;",
+    "Mon, 1 Jan 2024 00:00:00 +0000", "Tue, 31 Feb 2024 25:00:00", "1 Jan 2024 10:00 -0800", "Jan 2024",
+    "<a..b@c>", "[x]", "@", "\\", '"', "a@b.c, d@e.f", "J. Doe <j@d.e>", "=?", "?=",
+]
+
+
+def _value(rng: random.Random) -> str:
+    return "".join(rng.choice(ATOMS) + rng.choice(["", " ", "  "]) for _ in range(rng.randrange(0, 5)))
+
+
+def _header_block(rng: random.Random) -> bytes:
+    lines = []
+    for _ in range(rng.randrange(0, 12)):
+        if rng.random() < 0.1:
+            lines.append(rng.choice([" cont " + _value(rng), "\tcont", "From someone", ""]))
+        else:
+            lines.append(rng.choice(NAMES) + ":" + rng.choice(["", " ", "\t"]) + _value(rng))
+    newline = rng.choice(["\n", "\r\n", "\r"])
+    body = rng.choice(["", "body\n", "From x\nbody", " notheader"])
+    return (newline.join(lines) + newline + rng.choice(["", newline]) + body).encode("latin-1")
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_fast_headers_match_header_value(seed):
+    rng = random.Random(seed)
+    for _ in range(2500):
+        data = _header_block(rng)
+        fields = main._first_headers(main._split_headers(main._normalize_newlines(data))[0])
+        for header_policy in (policy.compat32, policy.default):
+            message = BytesParser(policy=header_policy).parse(io.BytesIO(data), headersonly=True)
+            expected = [main._header_value(message, name) for name in CSV_HEADERS]
+            got = [main._fields_value(fields, name.lower(), header_policy) for name in CSV_HEADERS]
+            assert got == expected, data
+        # Labels are always decoded, header-only jobs included.
+        assert main._labels_value(fields) == main._header_value(message, "X-Gmail-Labels"), data
+
+
+def test_header_only_rows_use_compat32():
+    data = b"Subject: =?utf-8?q?caf=C3=A9?=\nFrom: A <a@b.c>\n\nbody\n"
+    options = main._normalize_options({"include_body": False})
+    row, _attachments = main._convert_message(data, options)
+    assert row[5] == "=?utf-8?q?caf=C3=A9?="
+    row, _attachments = main._convert_message(data, main._normalize_options({"include_body": True}))
+    assert row[5] == "café"
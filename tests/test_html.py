@@ -0,0 +1,42 @@
+"""HTML bodies: rendering rules, and windowed rendering against rendering the whole document."""
+import random
+
+import pytest
+
+import main
+
+WORDS = "the quick brown fox café naïve &amp; &nbsp; &#8212; &bogus; a<b x>y".split()
+TAGS = [
+    "<p>", "</p>", "<div class=x>", "</div>", "<br>", "<br/>", "<td>", "<tr>", "<table>", "<li>", "<b>", "</b>",
+    "<script>var a = 1 < 2;</script>", "<style>p{color:red}</style>", "<head><title>T</title></head>",
+    "<!-- comment <p> -->", "<!DOCTYPE html>", "<script>", "<!--", "<img src='x'>", "<SCRIPT>x</SCRIPT>",
+]
+
+
+@pytest.mark.parametrize(
+    "markup, text",
+    [
+        ("<p>Hi &amp; bye</p><script>x<y</script><div>a<br>b</div>", "Hi & bye\n\na\nb"),
+        (
+            "<html><head><title>T</title><style>p{}</style></head><body>one<br><br>two"
+            "<table><tr><td>x</td><td>y</td></tr></table>&nbsp;end</body></html>",
+            "one\n\ntwo\n\nx y\n\nend",
+        ),
+        ("<!-- c --><p>x<script>never closed", "x"),
+        ("plain   text\n with\twhitespace", "plain text with whitespace"),
+    ],
+)
+def test_html_text(markup, text):
+    assert main._html_text(markup) == text
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_windowed_rendering_is_a_prefix_of_the_whole(seed, monkeypatch):
+    rng = random.Random(seed)
+    for _ in range(300):
+        limit = rng.choice([1, 7, 40, 200, 1000])
+        monkeypatch.setattr(main, "BODY_LIMIT", limit)
+        pieces = [rng.choice(TAGS) if rng.random() < 0.4 else rng.choice(WORDS) + rng.choice(["", " ", "\n"])
+                  for _ in range(rng.randrange(0, 4000))]
+        markup = "".join(pieces)
+        assert main._html_text(markup) == main._html_render(markup)[:limit]
@@ -0,0 +1,34 @@
+"""Importing the module, as the parse pool's spawned workers do, must leave the job store alone.
+
+The app's startup opens it and imports old JSON records instead.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import main
+
+
+def test_import_has_no_side_effects(tmp_path):
+    data = tmp_path / "data"
+    (data / "jobs").mkdir(parents=True)
+    legacy = data / "jobs" / "old.json"
+    legacy.write_text(json.dumps({"id": "old", "status": "done"}))
+    probe = (
+        "import threading, main\n"
+        "assert main._JOB_DB is None\n"
+        "assert threading.active_count() == 1, threading.enumerate()\n"
+    )
+    env = {**os.environ, "DATA_DIR": str(data), "DOWNLOADS_DIR": str(tmp_path / "downloads")}
+    app = Path(main.__file__).parent
+    subprocess.run([sys.executable, "-c", probe], cwd=app, env=env, check=True)
+    assert legacy.exists()
+    assert not (data / "jobs.sqlite3").exists()
+
+    subprocess.run(
+        [sys.executable, "-c", "import main\nmain._startup()\nassert main._load('old')['status'] == 'done'\n"],
+        cwd=app, env=env, check=True,
+    )
+    assert not legacy.exists()
@@ -0,0 +1,84 @@
+"""Per-label CSV files must hold exactly the rows of the messages carrying each label."""
+import collections
+import csv
+import io
+import zipfile
+
+import pytest
+
+import main
+
+LABELS = [
+    "Inbox",
+    "Inbox,Important",
+    '"Work/Project, X",Inbox',
+    "=?UTF-8?Q?Entw=C3=BCrfe?=,Inbox",
+    "Entwürfe",
+    "Opened,Category Personal,Work/Project, X",
+    "",
+    "a:b?*,Sent",
+]
+
+
+def _archive(count: int = 120) -> bytes:
+    messages = []
+    for i in range(count):
+        labels = LABELS[i % len(LABELS)]
+        messages.append(
+            f"From sender@example.com Mon Jan  1 00:00:00 2024\n"
+            f"From: sender{i % 5}@example.com\n"
+            f"Subject: Message {i}\n"
+            f"Message-ID: <m{i}@example.com>\n"
+            + (f"X-Gmail-Labels: {labels}\n" if labels else "")
+            + f"\nBody {i}\n\n"
+        )
+    return "".join(messages).encode()
+
+
+def _rows(zf: zipfile.ZipFile, name: str):
+    return list(csv.reader(io.StringIO(zf.read(name).decode("utf-8"), newline="")))
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"split_labels": True},
+        {"split_labels": True, "include_labels": True},
+        {"split_labels": True, "columns": ["subject", "body", "labels"]},
+        {"split_labels": True, "columns": ["subject", "labels"]},
+        {"split_labels": True, "include_body": False},
+    ],
+)
+def test_split_labels(convert, monkeypatch, options, sharded):
+    mbox = _archive()
+    monkeypatch.setattr(main, "LABEL_OPEN_FILES", 2)
+    if sharded:
+        monkeypatch.setattr(main, "SHARD_MIN_BYTES", len(mbox) // 6)
+        monkeypatch.setattr(main, "PARSE_PROCESSES", 3)
+    reference_options = {key: value for key, value in options.items() if key != "split_labels"}
+    if "columns" not in options:
+        reference_options["include_labels"] = True
+    reference = _rows(zipfile.ZipFile(convert(mbox, **reference_options)["out_path"]), "emails.csv")
+    header, rows = reference[0], reference[1:]
+    keep = [n for n, name in enumerate(header) if name != "labels" or options.get("include_labels") or "columns" in options]
+    expected = collections.defaultdict(list)
+    for row in rows:
+        for label in main._gmail_labels(row[header.index("labels")]):
+            expected[label].append([row[n] for n in keep])
+    assert "Entwürfe" in expected
+
+    with zipfile.ZipFile(convert(mbox, **options)["out_path"]) as zf:
+        assert _rows(zf, "emails.csv") == [[row[n] for n in keep] for row in reference]
+        names = main._label_member_names(list(expected))
+        assert sorted(name for name in zf.namelist() if name.startswith("labels/")) == sorted(names)
+        for label, name in zip(expected, names):
+            assert _rows(zf, name) == [[header[n] for n in keep]] + expected[label], label
+
+
+@pytest.mark.parametrize("include_body", [False, True])
+def test_labels_are_decoded_for_every_policy(convert, include_body):
+    mbox = _archive(len(LABELS))
+    job = convert(mbox, include_labels=True, include_body=include_body, filter={"labels": ["entwürfe"]})
+    rows = _rows(zipfile.ZipFile(job["out_path"]), "emails.csv")
+    assert [row[rows[0].index("labels")] for row in rows[1:]] == ["Entwürfe,Inbox", "Entwürfe"]
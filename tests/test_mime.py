@@ -0,0 +1,120 @@
+"""The MIME walker must produce the body and attachment rows of a full ``policy.default`` parse."""
+import base64
+import io
+import quopri
+import random
+
+import pytest
+from email import policy
+from email.parser import BytesParser
+
+import main
+
+PARSER = BytesParser(policy=policy.default)
+TEXTS = [
+    "hello world", "  \n  ", "", "Café naïve", "x" * 50, "line1\nline2\n\n", "From inside body", "--B\n", "--B--", "日本",
+    "<p>Hi&amp;bye</p><style>x{}</style>",
+    "<html><head><title>T</title></head><body><div>a<br>b &nbsp; &#233;</div><script>var x=1<2;</script></body></html>",
+]
+
+
+def _encode(text: str, cte: str, charset: str) -> str:
+    data = text.encode(charset if charset in ("utf-8", "latin-1", "utf-16") else "utf-8", "replace")
+    if cte == "base64":
+        return base64.encodebytes(data).decode()
+    if cte == "quoted-printable":
+        return quopri.encodestring(data).decode()
+    return data.decode("latin-1")
+
+
+def _leaf(rng: random.Random):
+    content_type = rng.choice([
+        "text/plain", "text/plain", "text/html", "application/pdf", 'multipart/related; start="<x>"', "image/png",
+        "text", "text/plain; format=flowed", "message/delivery-status",
+    ])
+    charset = rng.choice(["utf-8", "latin-1", "utf-16", "bogus", None])
+    cte = rng.choice([None, "7bit", "8bit", "base64", "quoted-printable", "x-uuencode", "BASE64"])
+    headers = ["Content-Type: " + content_type + (f"; charset={charset}" if charset else "")]
+    if cte:
+        headers.append("Content-Transfer-Encoding: " + cte)
+    r = rng.random()
+    if r < 0.2:
+        headers.append('Content-Disposition: attachment; filename="f.txt"')
+    elif r < 0.3:
+        headers.append("Content-Disposition: inline")
+    elif r < 0.35:
+        headers[0] += '; name="n.txt"'
+    elif r < 0.4:
+        headers.append('Content-Disposition: attachment; filename=""')
+    text = rng.choice(TEXTS) * rng.choice([1, 1, 3])
+    if rng.random() < 0.03:
+        text = "big text " * 9000 + "end"
+    if rng.random() < 0.02:
+        text = " " * 300000 + "tail"
+    return "\n".join(headers), _encode(text, (cte or "").lower(), charset or "us-ascii")
+
+
+def _part(rng: random.Random, depth: int, boundaries: list):
+    r = rng.random()
+    if depth < 3 and r < 0.3:
+        boundary = rng.choice(["B", "inner", "B1", "b c", "=_x", "Bx"]) + str(depth)
+        if rng.random() < 0.1 and boundaries:
+            boundary = rng.choice(boundaries)
+        subtype = rng.choice(["mixed", "alternative", "related", "digest"])
+        if " " in boundary or rng.random() < 0.5:
+            header = f'Content-Type: multipart/{subtype}; boundary="{boundary}"'
+        else:
+            header = f"Content-Type: multipart/{subtype}; boundary={boundary}"
+        if rng.random() < 0.05:
+            header = "Content-Type: multipart/mixed"
+        body = rng.choice(["", "preamble\n", "This is MIME\n\n"])
+        for _ in range(rng.randrange(0, 4)):
+            if rng.random() < 0.05:
+                body += "--" + boundary + "\n"
+            part_headers, part_body = _part(rng, depth + 1, boundaries + [boundary])
+            separator = "--" + boundary + rng.choice(["", "", " ", "\t", "x"])
+            body += separator + "\n" + part_headers + rng.choice(["\n\n", "\n", "\n\n\n"]) + part_body + "\n"
+        body += rng.choice(
+            [f"--{boundary}--\n", f"--{boundary}--", f"--{boundary}-- \n", "", f"--{boundary}--\nepilogue\n"]
+        )
+        return header, body
+    if depth < 3 and r < 0.38:
+        inner_headers, inner_body = _part(rng, depth + 1, boundaries)
+        return "Content-Type: message/rfc822", "Subject: inner\n" + inner_headers + "\n\n" + inner_body
+    return _leaf(rng)
+
+
+def _messages(seed: int, count: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        headers, body = _part(rng, 0, [])
+        message = ("From: a@b.c\nSubject: s\n" + headers + rng.choice(["\n\n", "\n"]) + body).encode(
+            "utf-8", "surrogateescape"
+        )
+        if rng.random() < 0.1:
+            message = message.replace(b"\n", b"\r\n")
+        yield rng, main._normalize_newlines(message)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_walker_body_matches_full_parse(seed):
+    for _rng, data in _messages(seed, 800):
+        expected = main._extract_body_text(PARSER.parse(io.BytesIO(data)))
+        try:
+            body = main._fast_message_parts(data, True, False, "")[0]
+        except main._MimeFallback:
+            continue
+        assert body == expected, data
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_walker_attachments_match_full_parse(seed, monkeypatch):
+    for rng, data in _messages(100 + seed, 600):
+        full = PARSER.parse(io.BytesIO(data))
+        expected = (main._extract_body_text(full), list(main._iter_attachment_rows(full, "id")))
+        monkeypatch.setattr(main, "QP_COUNT_BLOCK", rng.choice([1, 5, 64, 1 << 20]))
+        try:
+            got = main._fast_message_parts(data, True, True, "id")
+        except main._MimeFallback:
+            continue
+        assert got == expected, data
@@ -0,0 +1,40 @@
+"""Row previews of indexed jobs must show what emails.csv holds."""
+import csv
+import io
+import zipfile
+
+import main
+
+
+def _archive(count: int = 30) -> bytes:
+    return "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i}@example.com\nSubject: Preview {i}\n"
+        f"Message-ID: <p{i}@example.com>\n\nbody {i}\n\n"
+        for i in range(count)
+    ).encode()
+
+
+def test_rows_match_emails_csv(client, convert):
+    job = convert(_archive(), include_index=True)
+    rows = list(csv.DictReader(io.StringIO(zipfile.ZipFile(job["out_path"]).read("emails.csv").decode(), newline="")))
+    page = client.get(f"/result/{job['id']}/rows", params={"offset": 5, "limit": 10}).json()
+    assert page["total"] == len(rows) and page["complete"]
+    assert [{key: value for key, value in row.items() if key != "row"} for row in page["rows"]] == rows[5:15]
+    found = client.get(f"/result/{job['id']}/search", params={"q": "<p7@example.com>"}).json()
+    assert [row["row"] for row in found["rows"]] == [7]
+
+
+def test_rows_need_an_index(client, convert):
+    job = convert(_archive())
+    assert client.get(f"/result/{job['id']}/rows").status_code == 404
+
+
+def test_rows_follow_a_renamed_upload(tmp_path):
+    mbox = _archive(3)
+    (tmp_path / "job.mbox").write_bytes(mbox)
+    growing = main._GrowingUpload(tmp_path / "job.upload", len(mbox))
+    starts = [offset for offset, _data in main._iter_mbox_messages(tmp_path / "job.mbox")] + [len(mbox)]
+    rows = main._ResultRows(
+        3, False, lambda row: (starts[row], starts[row + 1]), growing, main._normalize_options({})
+    )
+    assert rows.fields(1)["subject"] == "Preview 1"
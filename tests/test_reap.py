@@ -0,0 +1,31 @@
+"""Uploads that stop receiving chunks are dropped with their preallocated file."""
+from pathlib import Path
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_idle_uploads_are_reaped(client, wait, monkeypatch, stream):
+    init = client.post(
+        "/upload/init", json={"filename": "x.mbox", "size": 4096, "parse_while_uploading": stream}
+    ).json()
+    jid = init["job_id"]
+    path = Path(main._load(jid)["in_path"])
+    assert path.stat().st_size == 4096 and (jid in main._GROWING) == stream
+
+    main._reap_uploads()
+    assert main._load(jid)["status"] == "uploading"
+
+    monkeypatch.setattr(main, "UPLOAD_IDLE_SECONDS", -1)
+    main._reap_uploads()
+    status = wait(jid)
+    assert status["status"] == "error" and "abandoned" in status["error"]
+    assert not path.exists() and jid not in main._GROWING
+    response = client.post(
+        "/upload/chunk",
+        data={"job_id": jid, "index": 0, "total": 1, "chunk_hash": "0" * 64},
+        files={"chunk": ("blob", b"x" * 4096)},
+    )
+    assert response.status_code == 409
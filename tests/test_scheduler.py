@@ -0,0 +1,58 @@
+"""The parse queue: fair between clients, smallest first within a client, with aging."""
+import time
+
+import main
+
+GB = 1 << 30
+
+
+class _Idle(main._Scheduler):
+    """A scheduler whose workers never start, so the queue can be inspected."""
+
+    def submit(self, jid, size, client="", queued_at=None):
+        with self._cond:
+            self._queued[jid] = (size, time.monotonic() if queued_at is None else queued_at, client)
+
+    def run(self, jid, size, client, started):
+        with self._cond:
+            self._running[jid] = (size, started, client)
+
+    def order(self):
+        return sorted(self._queued, key=lambda jid: self.estimate(jid)[0])
+
+
+def test_smallest_first_with_aging():
+    now = time.monotonic()
+    scheduler = _Idle(1)
+    scheduler.submit("big", 4 * GB, "a", now)
+    scheduler.submit("small", GB, "a", now)
+    assert scheduler.order() == ["small", "big"]
+    # Waiting counts against size: a big archive queued long ago goes first.
+    scheduler.submit("old", 4 * GB, "a", now - 4 * GB / main.SCHEDULER_AGING)
+    assert scheduler.order()[0] == "old"
+
+
+def test_one_client_cannot_take_every_worker():
+    now = time.monotonic()
+    scheduler = _Idle(2)
+    scheduler.run("a0", 20 * GB, "a", now)
+    for n in range(1, 5):
+        scheduler.submit(f"a{n}", 20 * GB, "a", now - 600)
+    scheduler.submit("b0", 20 * GB, "b", now)
+    # b has nothing running, so the idle worker takes its job although a's have waited longer.
+    assert scheduler.estimate("b0") == (1, 0.0)
+    position, start = scheduler.estimate("a1")
+    assert position == 2 and start > 0
+    assert scheduler.order() == ["b0", "a1", "a2", "a3", "a4"]
+
+
+def test_estimate_replays_fair_order():
+    now = time.monotonic()
+    scheduler = _Idle(2)
+    for n in range(3):
+        scheduler.submit(f"a{n}", GB + n, "a", now - 10)
+        scheduler.submit(f"b{n}", 2 * GB + n, "b", now)
+    # Each client keeps one worker; a's smaller archives do not push b's back.
+    assert scheduler.order() == ["a0", "b0", "a1", "b1", "a2", "b2"]
+    starts = [scheduler.estimate(jid)[1] for jid in scheduler.order()]
+    assert starts == sorted(starts) and starts[:2] == [0.0, 0.0]
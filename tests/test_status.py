@@ -0,0 +1,56 @@
+"""The status stream reports rates measured over real intervals only."""
+import asyncio
+import json
+import time
+
+import main
+
+
+async def _events(jid, count):
+    stream = main._status_events(jid)
+    out = []
+    async for chunk in stream:
+        if chunk.startswith("data:"):
+            out.append(json.loads(chunk[5:]))
+            if len(out) == count:
+                break
+    await stream.aclose()
+    return out
+
+
+def test_rates_start_from_the_first_event(monkeypatch):
+    monkeypatch.setattr(main, "STATUS_STREAM_INTERVAL", 0.2)
+    jid = "status-rates"
+    main._save({"id": jid, "status": "uploading", "size": 10_000_000, "received": 8_000_000, "processed": 0})
+
+    async def run():
+        task = asyncio.ensure_future(_events(jid, 2))
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        await asyncio.sleep(0.3)
+        main._note_progress(jid, received=8_500_000)
+        events = await task
+        return events, time.monotonic() - started
+
+    (first, second), elapsed = asyncio.run(run())
+    assert "bytes_per_second" not in first and "messages_per_second" not in first
+    # 500 kB over roughly 0.3 s, not 8.5 MB over the stream's lifetime.
+    assert 500_000 / (elapsed + 0.2) < second["bytes_per_second"] < 500_000 / 0.2
+
+
+def test_no_upload_rate_once_received(monkeypatch):
+    monkeypatch.setattr(main, "STATUS_STREAM_INTERVAL", 0.05)
+    jid = "status-received"
+    main._save({"id": jid, "status": "queued", "size": 100, "received": 50, "processed": 0})
+
+    async def run():
+        task = asyncio.ensure_future(_events(jid, 3))
+        await asyncio.sleep(0.1)
+        main._note_progress(jid, received=100)
+        await asyncio.sleep(0.1)
+        main._note_progress(jid, processed=5)
+        return await task
+
+    events = asyncio.run(run())
+    assert all("bytes_per_second" not in event for event in events)
+    assert events[-1]["messages_per_second"] > 0
@@ -0,0 +1,66 @@
+"""Streaming parses go through their own bounded queue and leave large archives to sharding."""
+import time
+
+import main
+
+
+class _Busy(main._Scheduler):
+    """A streaming queue whose workers never pick anything up, as when all are busy."""
+
+    def submit(self, jid, size, client=""):
+        with self._cond:
+            self._queued[jid] = (size, time.monotonic(), client)
+
+
+def _archive(count: int = 40) -> bytes:
+    return "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i}@example.com\nSubject: stream {i}\n\nbody {i}\n\n"
+        for i in range(count)
+    ).encode()
+
+
+def _init(client, size, **extra):
+    return client.post("/upload/init", json={"filename": "x.mbox", "size": size, **extra})
+
+
+def test_small_archives_stream_by_default(client, upload, wait):
+    data = _archive()
+    jid, response = upload(data)
+    assert response["status"] in ("processing", "done")
+    assert wait(jid)["status"] == "done"
+    assert wait(jid)["processed"] == 40
+
+
+def test_streaming_queue_counts_for_admission_and_eta(client, upload, wait, monkeypatch):
+    monkeypatch.setattr(main, "STREAMS", _Busy(1))
+    data = _archive()
+    monkeypatch.setattr(main, "MAX_QUEUED_BYTES", 2 * len(data) - 1)
+    first = _init(client, len(data)).json()["job_id"]
+    assert first in main._GROWING
+    status = client.get(f"/status/{first}").json()
+    assert status["status"] == "uploading" and status["queue_position"] == 1
+    assert _init(client, len(data)).status_code == 503
+
+    # Its upload finishes before a streaming worker is free: it joins the parse queue instead.
+    monkeypatch.setattr(main, "MAX_QUEUED_BYTES", 10 * len(data))
+    jid, response = upload(data)
+    assert response["status"] == "queued"
+    assert jid not in main._GROWING
+    assert wait(jid)["status"] == "done"
+    assert main.STREAMS.queued_bytes() == len(data)  # only the abandoned first upload
+
+
+def test_sharded_archives_do_not_stream(client, monkeypatch):
+    data = _archive()
+    monkeypatch.setattr(main, "PARSE_PROCESSES", 2)
+    monkeypatch.setattr(main, "SHARD_MIN_BYTES", len(data) // 2)
+    # An explicit request is declined, and the response says so.
+    for flag in (True, None):
+        init = _init(client, len(data), parse_while_uploading=flag).json()
+        assert init["streaming"] is False and init["job_id"] not in main._GROWING
+    monkeypatch.setattr(main, "SHARD_MIN_BYTES", len(data))
+    init = _init(client, len(data), parse_while_uploading=False).json()
+    assert init["streaming"] is False and init["job_id"] not in main._GROWING
+    for flag in (True, None):
+        init = _init(client, len(data), parse_while_uploading=flag).json()
+        assert init["streaming"] is True and init["job_id"] in main._GROWING
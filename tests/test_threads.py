@@ -0,0 +1,132 @@
+"""Reconstructed threads must match a straightforward JWZ implementation over the parsed messages."""
+import array
+import csv
+import io
+import random
+import re
+import zipfile
+
+import pytest
+
+import main
+
+TOKEN = re.compile(r"<[^<>\s]+>")
+REPLY = re.compile(r"(?:\s*(?:re|fwd?|aw|sv)(?:\[\d+\])?\s*:)+\s*", re.IGNORECASE)
+
+
+def _archive(seed: int, count: int = 400) -> bytes:
+    rng = random.Random(seed)
+    ids = []
+    messages = []
+    for i in range(count):
+        headers = [f"From: p{i % 9}@example.com", f"Date: Mon, 1 Jan 2024 00:00:{i % 60:02d} +0000"]
+        own = f"<m{i}.{rng.randrange(3)}@example.com>" if rng.random() < 0.3 else f"<m{i}@example.com>"
+        if rng.random() < 0.05:
+            own = rng.choice(ids) if ids else own  # repeated Message-Id
+        if rng.random() > 0.05:
+            headers.append(f"Message-ID: {own}")
+        topic = f"topic {rng.randrange(40)}"
+        r = rng.random()
+        if ids and r < 0.55:
+            chain = rng.sample(ids, min(len(ids), rng.randrange(1, 12)))
+            if rng.random() < 0.1:
+                chain.append(f"<missing{rng.randrange(20)}@example.com>")
+            if rng.random() < 0.05:
+                chain.append(own)  # a loop through the message itself
+            headers.append("References: " + "\n\t".join(chain))
+            headers.append(f"Subject: Re: {topic}")
+        elif ids and r < 0.65:
+            headers.append(f"In-Reply-To: {rng.choice(ids)} (comment)")
+            headers.append(f"Subject: {topic}")
+        else:
+            headers.append(f"Subject: {rng.choice(['', 'Re: ', 'RE[2]: ', 'Fwd: Re:', 'AW: '])}{topic}")
+        ids.append(own)
+        messages.append("From x@y Mon Jan  1 00:00:00 2024\n" + "\n".join(headers) + f"\n\nbody {i}\n\n")
+    return "".join(messages).encode()
+
+
+def _reference(path):
+    """(root key, depth) per message; subject-merged threads keep their depths."""
+    messages = [main._first_headers(main._split_headers(main._normalize_newlines(data))[0])
+                for _offset, data in main._iter_mbox_messages(path)]
+    parent, owner, nodes, subjects = {}, {}, [], []
+    for row, fields in enumerate(messages):
+        message_id = fields.get("message-id", ("", ""))[1]
+        token = TOKEN.search(message_id)
+        key = token.group() if token else message_id.strip()
+        if not key or key in owner:
+            key = f"#{row}"
+        owner[key] = row
+        nodes.append(key)
+        subjects.append(main._render_header("Subject", fields.get("subject", ("", ""))[1], main.policy.compat32))
+
+    def reaches(node, ancestor):
+        while node is not None:
+            if node == ancestor:
+                return True
+            node = parent.get(node)
+        return False
+
+    for row, fields in enumerate(messages):
+        previous = None
+        for ref in main._message_refs(fields):
+            if previous is not None and ref not in parent and not reaches(previous, ref):
+                parent[ref] = previous
+            previous = ref
+        node = nodes[row]
+        if previous is None:
+            parent.pop(node, None)
+        elif not reaches(previous, node):
+            parent[node] = previous
+
+    def root_depth(node):
+        depth = 0
+        while node in parent:
+            node, depth = parent[node], depth + 1
+        return node, depth
+
+    depths = [root_depth(node)[1] for node in nodes]
+    grouped, seen = {}, set()
+    for row in range(len(nodes)):
+        top = root_depth(nodes[row])[0]
+        if top in seen:
+            continue
+        seen.add(top)
+        subject = subjects[owner.get(top, row)]
+        reply = REPLY.match(subject)
+        key = " ".join(subject[reply.end() if reply else 0:].split()).casefold()
+        if key:
+            group = grouped.setdefault(key, top)
+            if group != top and reply:
+                parent[top] = group
+    return [(root_depth(node)[0], depth) for node, depth in zip(nodes, depths)]
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_threads_match_reference(convert, monkeypatch, tmp_path, seed, sharded):
+    mbox = _archive(seed)
+    (tmp_path / "threads.mbox").write_bytes(mbox)
+    if sharded:
+        monkeypatch.setattr(main, "SHARD_MIN_BYTES", len(mbox) // 6)
+        monkeypatch.setattr(main, "PARSE_PROCESSES", 3)
+    job = convert(mbox, build_threads=True, include_body=False)
+    rows = list(csv.DictReader(io.StringIO(zipfile.ZipFile(job["out_path"]).read("emails.csv").decode(), newline="")))
+    expected = _reference(tmp_path / "threads.mbox")
+    assert len(rows) == len(expected)
+    threads = {}
+    for row, (root, depth) in zip(rows, expected):
+        assert threads.setdefault(row["thread_id"], root) == root
+        assert int(row["thread_depth"]) == depth
+    assert len(set(threads.values())) == len(threads)
+
+
+def test_container_table_grows():
+    keys = array.array("Q")
+    table = main._ContainerTable(keys, capacity=4)
+    rng = random.Random(0)
+    for key in {rng.getrandbits(64) for _ in range(5000)} | {0}:
+        keys.append(key)
+        table.add(len(keys) - 1)
+    assert all(table.get(key) == n for n, key in enumerate(keys))
+    assert table.get(12345) == -1
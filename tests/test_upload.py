@@ -0,0 +1,129 @@
+"""Chunked uploads: arrival order, retries, overlapping requests and whole-file checks."""
+import asyncio
+import hashlib
+import time
+
+import httpx
+import pytest
+
+import main
+
+
+def _archive(tag: str, count: int = 80) -> bytes:
+    return "".join(
+        f"From x@y Mon Jan  1 00:00:00 2024\nFrom: p{i}@example.com\nSubject: {tag} {i}\n\nbody {tag} {i}\n\n"
+        for i in range(count)
+    ).encode()
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(main, "CHUNK", 1024)
+    return 1024
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _form(jid, index, total, piece, digest=None):
+    return {
+        "data": {"job_id": jid, "index": index, "total": total, "chunk_hash": digest or hashlib.sha256(piece).hexdigest()},
+        "files": {"chunk": ("blob", piece)},
+    }
+
+
+def test_overlapping_requests_keep_the_verified_chunk(client, small_chunks, monkeypatch):
+    data = _archive("overlap")
+    pieces = _chunks(data, small_chunks)
+    sha256 = hashlib.sha256(data).hexdigest()
+    init = client.post("/upload/init", json={
+        "filename": "x.mbox", "size": len(data), "sha256": sha256, "parse_while_uploading": False,
+    }).json()
+    jid = init["job_id"]
+    corrupt = bytes(len(pieces[0]))
+
+    ingest = main._ingest_chunk
+
+    def slow_corrupt(src, dest_path, offset, limit, running=None):
+        # The corrupt copy is still being written when the good one finishes.
+        if src.read(1) == b"\0":
+            time.sleep(0.3)
+        src.seek(0)
+        return ingest(src, dest_path, offset, limit, running)
+
+    monkeypatch.setattr(main, "_ingest_chunk", slow_corrupt)
+
+    async def race():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            bad = asyncio.ensure_future(
+                http.post("/upload/chunk", **_form(jid, 0, len(pieces), corrupt, hashlib.sha256(pieces[0]).hexdigest()))
+            )
+            await asyncio.sleep(0.05)
+            good = await http.post("/upload/chunk", **_form(jid, 0, len(pieces), pieces[0]))
+            return (await bad).status_code, good.status_code
+
+    statuses = asyncio.run(race())
+    assert sorted(statuses) == [200, 400]
+    with open(main._load(jid)["in_path"], "rb") as fp:
+        assert fp.read(len(pieces[0])) == pieces[0]
+
+
+def _send(client, jid, pieces, order):
+    return [client.post("/upload/chunk", **_form(jid, index, len(pieces), pieces[index])) for index in order]
+
+
+def _init(client, data, **extra):
+    response = client.post("/upload/init", json={"filename": "x.mbox", "size": len(data), **extra})
+    assert response.status_code == 200, response.text
+    return response.json()["job_id"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_out_of_order_and_repeated_chunks(client, wait, small_chunks, stream):
+    data = _archive(f"order-{stream}")
+    pieces = _chunks(data, small_chunks)
+    jid = _init(client, data, sha256=hashlib.sha256(data).hexdigest(), parse_while_uploading=stream)
+    order = list(range(len(pieces)))[::-1]
+    # Every chunk but the first twice, then chunk 3 again as a lost-response retry.
+    responses = _send(client, jid, pieces, order[:-1] + order[:-1] + [3])
+    assert all(r.status_code == 200 for r in responses)
+    assert {r.json()["status"] for r in responses} == {"partial"}
+    assert responses[-1].json()["received"] == len(data) - len(pieces[0])
+    last = _send(client, jid, pieces, [0])[0]
+    assert last.status_code == 200 and last.json()["status"] in ("queued", "processing", "done")
+    status = wait(jid)
+    assert status["status"] == "done" and status["processed"] == 80
+    retry = _send(client, jid, pieces, [0])[0]
+    assert retry.status_code == 409
+
+
+def test_tree_hash(client, wait, small_chunks):
+    data = _archive("tree")
+    pieces = _chunks(data, small_chunks)
+    tree = hashlib.sha256(b"".join(hashlib.sha256(piece).digest() for piece in pieces)).hexdigest()
+    jid = _init(client, data, tree_sha256=tree)
+    responses = _send(client, jid, pieces, [2, 0, 1] + list(range(3, len(pieces))))
+    assert all(r.status_code == 200 for r in responses)
+    assert wait(jid)["status"] == "done"
+
+    jid = _init(client, data, tree_sha256=hashlib.sha256(b"other").hexdigest(), parse_while_uploading=False)
+    responses = _send(client, jid, pieces, range(len(pieces)))
+    assert all(r.status_code == 200 for r in responses[:-1])
+    assert responses[-1].status_code == 400 and "mismatch" in responses[-1].json()["detail"]
+    assert main._load(jid)["status"] == "uploading"
+
+
+def test_sha256_mismatch_aborts_streaming_parse(client, wait, small_chunks):
+    data = _archive("mismatch")
+    pieces = _chunks(data, small_chunks)
+    jid = _init(client, data, sha256=hashlib.sha256(b"not this archive").hexdigest())
+    assert jid in main._GROWING
+    while jid not in main.STREAMS._running:
+        time.sleep(0.01)
+    responses = _send(client, jid, pieces, range(len(pieces)))
+    assert responses[-1].status_code == 400
+    status = wait(jid)
+    assert status["status"] == "error" and "mismatch" in status["error"]
+    assert client.get(f"/download/{jid}").status_code == 404